@@ -1,10 +1,12 @@
 import streamlit as st
-import pandas as pd
 from datetime import datetime
 import json
 import time
 import os
-import chromadb
+
+from source_code.telemetry import stage
+
+# pandas 與 chromadb 延遲到首次使用時才導入，縮短 Streamlit 冷啟動時間
 
 # 初始化全局變數
 if 'rag_system' not in st.session_state:
@@ -162,6 +164,31 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+@st.cache_resource(show_spinner=False)
+def load_local_engine():
+    """每個進程只建立一個本機引擎 (連同熱重載監視器與快取預熱)，由所有瀏覽器會話共用
+
+    引擎建立時會 embedding 整個數據集並建立 collection；每個會話各建一個會重複這些工作，
+    熱重載時各自的監視器也會重複重建索引，預熱也會為每個會話重新發出 embedding 請求。
+    """
+    from source_code.config import HOT_RELOAD_CONFIG, WARMUP_CONFIG
+    from source_code.prompt_rag_system import PromptGeneratorRAGSystem
+    rag_system = PromptGeneratorRAGSystem()
+    
+    # 數據集或 chunk 文件變更時在背景重建索引並切換，不必重新載入系統
+    watcher = None
+    if HOT_RELOAD_CONFIG["enabled"]:
+        from source_code.hot_reload import DatasetWatcher
+        watcher = DatasetWatcher(rag_system).start()
+    
+    # 在背景預熱常見查詢，不阻塞載入 (進度顯示於側邊欄)
+    warmer = None
+    if WARMUP_CONFIG["enabled"]:
+        from source_code.warmup import CacheWarmer
+        warmer = CacheWarmer(rag_system).start()
+    return rag_system, watcher, warmer
+
+
 class StreamlitRAGInterface:
     """
     Streamlit 前端界面類
@@ -180,6 +207,10 @@ class StreamlitRAGInterface:
             st.session_state.current_results = None
         if 'selected_category' not in st.session_state:
             st.session_state.selected_category = None
+        if 'filtered_results' not in st.session_state:
+            st.session_state.filtered_results = None
+        if 'result_generation' not in st.session_state:
+            st.session_state.result_generation = 0
     
     def check_system_status(self):
         """檢查系統關鍵組件的狀態"""
@@ -191,20 +222,26 @@ class StreamlitRAGInterface:
         
         # 檢查 OpenAI API Key
         try:
+            from source_code.config import REPLAY_CONFIG
             api_key = os.environ.get("OPENAI_API_KEY")
+            if not api_key and REPLAY_CONFIG["offline"]:
+                # 離線模式由重放替身回答 API 請求
+                api_key = REPLAY_CONFIG["offline_api_key"]
             if api_key and len(api_key) > 20:  # 簡單的長度檢查
                 status["api_key"] = True
         except Exception as e:
             st.error(f"API Key 檢查錯誤: {str(e)}")
             
-        # 檢查 Chroma 數據庫
+        # 檢查 Chroma 數據庫（系統尚未載入時不導入 chromadb）
         try:
-            if hasattr(st.session_state, 'rag_system'):
-                if not isinstance(st.session_state.rag_system, MockRAGSystem):
-                    # 檢查數據庫連接
-                    client = chromadb.Client()
-                    collections = client.list_collections()
-                    status["database"] = len(collections) > 0
+            rag_system = st.session_state.get('rag_system')
+            if rag_system is not None and getattr(rag_system, 'chroma_client', None) is not None:
+                # 檢查數據庫連接
+                collections = rag_system.chroma_client.list_collections()
+                status["database"] = len(collections) > 0
+            elif rag_system is not None and hasattr(rag_system, 'is_ready'):
+                # 遠端服務：以服務的就緒狀態為準
+                status["database"] = rag_system.is_ready()
         except Exception as e:
             st.error(f"數據庫檢查錯誤: {str(e)}")
             
@@ -212,8 +249,8 @@ class StreamlitRAGInterface:
         try:
             dataset_path = "dataset/processed_dataset.csv"
             if os.path.exists(dataset_path):
-                df = pd.read_csv(dataset_path)
-                status["dataset"] = len(df) > 0
+                from source_code.dataset_store import get_dataset_store
+                status["dataset"] = get_dataset_store(dataset_path).row_count() > 0
         except Exception as e:
             st.error(f"數據集檢查錯誤: {str(e)}")
             
@@ -247,22 +284,36 @@ class StreamlitRAGInterface:
     def load_system(self):
         """載入系統"""
         try:
-            # 初始化環境
-            from source_code.config import initialize_environment
-            env_status = initialize_environment()
+            from source_code.config import SERVER_CONFIG
             
-            if not env_status["api_key_set"]:
-                st.error("OpenAI API Key 未設置")
-                return False
-                
-            # 檢查數據集
-            if not os.path.exists("dataset/processed_dataset.csv"):
-                st.error("數據集文件不存在")
-                return False
+            # 已設置 RAG 服務位址時改用 HTTP 客戶端，檢索在服務的 worker 進程中執行
+            if SERVER_CONFIG["server_url"]:
+                from source_code.client import RemoteRAGSystem
+                rag_system = RemoteRAGSystem()
+                if not rag_system.is_ready():
+                    st.error(f"RAG 服務尚未就緒：{SERVER_CONFIG['server_url']}")
+                    return False
+                st.session_state.rag_system = rag_system
+            else:
+                # 初始化環境
+                from source_code.config import initialize_environment
+                env_status = initialize_environment()
                 
-            # 初始化真實的 RAG 系統
-            from source_code.prompt_rag_system import PromptGeneratorRAGSystem
-            st.session_state.rag_system = PromptGeneratorRAGSystem()
+                if not env_status["api_key_set"]:
+                    st.error("OpenAI API Key 未設置")
+                    return False
+                    
+                # 檢查數據集
+                if not os.path.exists("dataset/processed_dataset.csv"):
+                    st.error("數據集文件不存在")
+                    return False
+                    
+                # 初始化真實的 RAG 系統 (進程內共用，預熱只在建立時執行一次)
+                (
+                    st.session_state.rag_system,
+                    st.session_state.reload_watcher,
+                    st.session_state.warmer
+                ) = load_local_engine()
             
             # 載入系統統計
             st.session_state.system_stats = self.load_system_stats()
@@ -281,7 +332,8 @@ class StreamlitRAGInterface:
         """載入系統統計信息"""
         try:
             if os.path.exists("dataset/processed_dataset.csv"):
-                df = pd.read_csv("dataset/processed_dataset.csv")
+                from source_code.dataset_store import load_dataset
+                df = load_dataset(["prompt_type"], "dataset/processed_dataset.csv")
                 return {
                     "collections": {
                         "total_prompts": len(df),
@@ -337,6 +389,12 @@ class StreamlitRAGInterface:
                         percentage = (count / total_docs * 100) if total_docs > 0 else 0
                         st.markdown(f"📝 **{name}**: {count:,} ({percentage:.1f}%)")
                 
+                # 索引版本與熱重載狀態
+                self.render_reload_status()
+                
+                # 啟動預熱進度
+                self.render_warmup_status()
+                
                 # 搜尋歷史
                 if st.session_state.search_history:
                     st.markdown("## 🕒 搜尋歷史")
@@ -356,6 +414,52 @@ class StreamlitRAGInterface:
                     st.success("搜尋歷史已清除")
                     st.rerun()
     
+    def render_reload_status(self):
+        """側邊欄顯示索引版本；熱重載切換版本後刷新統計"""
+        watcher = st.session_state.get('reload_watcher')
+        if watcher is None:
+            return
+        
+        status = watcher.status()
+        if st.session_state.get('index_version') != status["version"]:
+            if st.session_state.get('index_version') is not None:
+                st.session_state.system_stats = self.load_system_stats()
+            st.session_state.index_version = status["version"]
+        
+        labels = {"idle": "✅ 最新", "pending": "⏳ 偵測到變更", "reloading": "🔄 背景重建中", "failed": "❌ 重建失敗"}
+        st.markdown(f"**索引版本**: v{status['version']} ({labels.get(status['state'], status['state'])})")
+        last_reload = status.get("last_reload")
+        if last_reload:
+            st.caption(
+                f"上次重載：{last_reload['documents']:,} 條，重用 {last_reload['reused']:,}、"
+                f"新 embedding {last_reload['embedded']:,}，耗時 {last_reload['duration']:.1f}s"
+            )
+        if status["state"] == "failed" and status.get("last_error"):
+            st.caption(f"錯誤：{status['last_error']} (繼續使用目前版本)")
+    
+    def render_warmup_status(self):
+        """側邊欄顯示背景預熱進度 (本機引擎或 RAG 服務的 worker)"""
+        warmer = st.session_state.get('warmer')
+        if warmer is not None:
+            status = warmer.status()
+        elif hasattr(st.session_state.rag_system, 'warmup_status'):
+            status = st.session_state.rag_system.warmup_status()
+        else:
+            status = None
+        if not status:
+            return
+        
+        total = status.get("total") or 0
+        completed = status.get("completed", 0)
+        labels = {"pending": "⏳ 準備中", "warming": "🔥 預熱中", "done": "✅ 已完成", "stopped": "⏹️ 已停止", "failed": "❌ 預熱失敗"}
+        st.markdown(f"**快取預熱**: {labels.get(status['state'], status['state'])}")
+        if total:
+            st.progress(min(completed / total, 1.0), text=f"{completed:,} / {total:,} 條查詢")
+        if status["state"] == "done" and status.get("seconds") is not None:
+            st.caption(f"耗時 {status['seconds']:.1f}s，錯誤 {status.get('errors', 0)}")
+        elif status.get("last_error"):
+            st.caption(f"錯誤：{status['last_error']}")
+    
     def render_main_interface(self):
         """渲染主界面"""
         if not st.session_state.system_loaded:
@@ -421,57 +525,109 @@ class StreamlitRAGInterface:
         
         # 顯示搜尋結果
         if st.session_state.current_results:
-            self.display_search_results(st.session_state.current_results)
+            with stage("app.render", scenario=st.session_state.current_results.get("scenario")):
+                self.display_search_results(st.session_state.current_results)
     
     def process_search(self, user_query, context_content, search_mode):
         """處理搜尋請求"""
-        with st.spinner("🔍 搜尋中，請稍候..."):
-            try:
-                if not self.rag_system:
-                    self.rag_system = st.session_state.get('rag_system')
+        with stage("app.process_search", search_mode=search_mode, context_length=len(context_content or "")):
+            with st.spinner("🔍 搜尋中，請稍候..."):
+                try:
                     if not self.rag_system:
-                        st.error("系統未正確載入，請重新載入系統")
-                        return
+                        self.rag_system = st.session_state.get('rag_system')
+                        if not self.rag_system:
+                            st.error("系統未正確載入，請重新載入系統")
+                            return
                 
-                # 準備上下文
-                context = context_content.strip() if context_content else None
+                    # 準備上下文
+                    context = context_content.strip() if context_content else None
                 
-                # 自動檢測模式邏輯
-                if search_mode == "自動檢測":
-                    final_context = context
-                elif search_mode == "無上下文":
-                    final_context = None
-                elif search_mode == "有上下文":
-                    if not context:
-                        st.warning("您選擇了'有上下文'模式，但未提供任何上下文內容。請在文本框中輸入內容。")
-                        return
-                    final_context = context
+                    # 自動檢測模式邏輯
+                    if search_mode == "自動檢測":
+                        final_context = context
+                    elif search_mode == "無上下文":
+                        final_context = None
+                    elif search_mode == "有上下文":
+                        if not context:
+                            st.warning("您選擇了'有上下文'模式，但未提供任何上下文內容。請在文本框中輸入內容。")
+                            return
+                        final_context = context
                 
-                # 模擬API調用延遲
-                time.sleep(1.5)
+                    # 模擬API調用延遲
+                    time.sleep(1.5)
                 
-                # 調用 RAG 系統
-                result = self.rag_system.query(user_query, final_context)
+                    # 調用 RAG 系統 (lazy：只取 id、分數與 metadata，全文在展開時才載入)
+                    result = self.rag_system.query(user_query, final_context, lazy=True)
                 
-                if "error" in result:
-                    st.error(f"搜尋失敗：{result['error']}")
-                    return
+                    if "error" in result:
+                        st.error(f"搜尋失敗：{result['error']}")
+                        return
                 
-                # 保存結果
-                st.session_state.current_results = result
+                    # 保存結果 (新的結果代次讓上一輪的展開狀態失效)
+                    st.session_state.current_results = result
+                    st.session_state.result_generation += 1
                 
-                # 添加到搜尋歷史
-                st.session_state.search_history.append({
-                    "query": user_query,
-                    "context": final_context,
-                    "scenario": result.get("scenario"),
-                    "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                })
+                    # 添加到搜尋歷史
+                    st.session_state.search_history.append({
+                        "query": user_query,
+                        "context": final_context,
+                        "scenario": result.get("scenario"),
+                        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                    })
                 
-                st.success("🎉 搜尋完成！")
+                    st.success("🎉 搜尋完成！")
                 
-            except Exception as e:
-                st.error(f"搜尋過程中發生錯誤：{str(e)}")
+                except Exception as e:
+                    st.error(f"搜尋過程中發生錯誤：{str(e)}")
+    
+    def lazy_expander(self, label, key):
+        """建立可偵測展開狀態的 expander
+        
+        Returns:
+            (expander, 是否展開)；Streamlit 不支援展開事件時視為展開 (即時載入全文)
+        """
+        try:
+            expander = st.expander(label, key=key, on_change="rerun")
+        except TypeError:
+            return st.expander(label), True
+        return expander, bool(getattr(expander, "open", st.session_state.get(key)))
+    
+    def hydrate_documents(self, items, keys, text_key="text"):
+        """為已展開、尚未載入全文的結果項批量取回全文
+        
+        Args:
+            items: 結果項列表 (含 id)，全文寫回到 item[text_key]，重跑時不重複載入
+            keys: 與 items 對應的 expander key，None 表示一律載入
+        """
+        pending = [
+            item for item, key in zip(items, keys)
+            if item.get("id") and text_key not in item and (key is None or st.session_state.get(key))
+        ]
+        if not pending:
+            return
+        rag_system = st.session_state.get('rag_system')
+        if rag_system is None:
+            return
+        with stage("app.hydrate", documents=len(pending)):
+            documents = rag_system.get_documents([item["id"] for item in pending])
+        for item in pending:
+            if item["id"] in documents:
+                item[text_key] = documents[item["id"]]
+    
+    def render_aliases(self, item, key):
+        """在已展開的結果項中按需展開近似重複的別名"""
+        if not item.get("alias_count"):
+            return
+        if not st.checkbox(f"顯示 {item['alias_count']} 個近似重複的 prompt", key=f"{key}_aliases"):
+            return
+        if "aliases" not in item:
+            rag_system = st.session_state.get('rag_system')
+            with stage("app.aliases"):
+                item["aliases"] = rag_system.get_aliases([item["id"]]).get(item["id"], []) if rag_system else []
+        for alias in item["aliases"]:
+            st.caption(alias["id"])
+            if alias.get("text"):
+                st.text(alias["text"][:300] + ("..." if len(alias["text"]) > 300 else ""))
     
     def display_search_results(self, results):
         """顯示搜尋結果"""
@@ -554,14 +710,26 @@ class StreamlitRAGInterface:
             </div>
             """, unsafe_allow_html=True)
             
-            # 顯示 prompt
+            # 顯示 prompt：只為已展開的項目載入全文
             prompts = category_info.get("prompts", [])
+            generation = st.session_state.result_generation
+            expander_keys = [f"expand_{generation}_{selected_category}_{i}" for i in range(1, len(prompts) + 1)]
+            self.hydrate_documents(prompts, expander_keys)
             for i, prompt in enumerate(prompts, 1):
                 unique_key = f"copy_{selected_category}_{i}"
-                with st.expander(f"Prompt {i} (相似度: {prompt['score']:.3f}) - {prompt['complexity'].capitalize()}"):
+                expander, is_open = self.lazy_expander(
+                    f"Prompt {i} (相似度: {prompt['score']:.3f}) - {prompt['complexity'].capitalize()}",
+                    expander_keys[i - 1]
+                )
+                with expander:
+                    if not is_open:
+                        continue
+                    if "text" not in prompt:
+                        self.hydrate_documents([prompt], [None])
+                    text = prompt.get("text", "(無法載入內容)")
                     st.markdown(f"""
                     <div class="prompt-preview">
-                        {prompt['text'].replace('<', '&lt;').replace('>', '&gt;')[:500]}{'...' if len(prompt['text']) > 500 else ''}
+                        {text.replace('<', '&lt;').replace('>', '&gt;')[:500]}{'...' if len(text) > 500 else ''}
                     </div>
                     """, unsafe_allow_html=True)
                     
@@ -572,8 +740,9 @@ class StreamlitRAGInterface:
                         st.write(f"**相似度**: {prompt['score']:.3f}")
                     with col3:
                         if st.button(f"📋 複製 Prompt {i}", key=unique_key):
-                            st.code(prompt['text'], language="text")
+                            st.code(text, language="text")
                             st.success("Prompt 已複製到剪貼簿！") # Streamlit doesn't actually copy, but this provides good UX.
+                    self.render_aliases(prompt, expander_keys[i - 1])
         
         # 過濾建議
         if filter_suggestions:
@@ -611,32 +780,38 @@ class StreamlitRAGInterface:
                 st.code(customized_prompt, language="text")
                 st.success("客製化 Prompt 已複製到剪貼簿！")
         
-        with st.expander("🔍 查看生成細節 (上下文分析與源 Prompt)"):
-            # 上下文分析
-            if context_analysis:
-                st.markdown("### 📄 上下文分析")
-                col1, col2 = st.columns(2)
-                with col1:
-                    st.write(f"**內容類型**: {context_analysis.get('content_type', 'general')}")
-                with col2:
-                    st.write(f"**內容長度**: {context_analysis.get('length', 0)} 字符")
-                
-                if context_analysis.get('summary'):
-                    st.write(f"**分析摘要**: {context_analysis['summary']}")
-            
-            # 源 Prompt 信息
-            if source_prompts:
-                st.markdown("### 📚 參考的來源 Prompt")
-                st.write(f"本次客製化基於 {len(source_prompts)} 個高品質的來源 prompt：")
+        details, details_open = self.lazy_expander(
+            "🔍 查看生成細節 (上下文分析與源 Prompt)",
+            f"details_{st.session_state.result_generation}"
+        )
+        with details:
+            if details_open:
+                # 上下文分析
+                if context_analysis:
+                    st.markdown("### 📄 上下文分析")
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        st.write(f"**內容類型**: {context_analysis.get('content_type', 'general')}")
+                    with col2:
+                        st.write(f"**內容長度**: {context_analysis.get('length', 0)} 字符")
+                    
+                    if context_analysis.get('summary'):
+                        st.write(f"**分析摘要**: {context_analysis['summary']}")
                 
-                for i, source in enumerate(source_prompts, 1):
-                    st.markdown(f"**源 Prompt {i} (相似度: {source['score']:.3f})**")
-                    st.write(f"**類型**: {source['prompt_type']}, **複雜度**: {source['complexity']}, **技巧**: {source['techniques']}")
-                    st.markdown(f"""
-                    <div class="source-prompt">
-                        {source['original_text'].replace('<', '&lt;').replace('>', '&gt;')[:300]}...
-                    </div>
-                    """, unsafe_allow_html=True)
+                # 源 Prompt 信息
+                if source_prompts:
+                    self.hydrate_documents(source_prompts, [None] * len(source_prompts), text_key="original_text")
+                    st.markdown("### 📚 參考的來源 Prompt")
+                    st.write(f"本次客製化基於 {len(source_prompts)} 個高品質的來源 prompt：")
+                    
+                    for i, source in enumerate(source_prompts, 1):
+                        st.markdown(f"**源 Prompt {i} (相似度: {source['score']:.3f})**")
+                        st.write(f"**類型**: {source['prompt_type']}, **複雜度**: {source['complexity']}, **技巧**: {source.get('techniques', '-')}")
+                        st.markdown(f"""
+                        <div class="source-prompt">
+                            {source.get('original_text', '(無法載入內容)').replace('<', '&lt;').replace('>', '&gt;')[:300]}...
+                        </div>
+                        """, unsafe_allow_html=True)
         
         # 期望輸出
         if expected_outputs:
@@ -691,6 +866,10 @@ class StreamlitRAGInterface:
         # 執行過濾搜尋
         if st.button("🎯 執行過濾搜尋", type="primary"):
             self.execute_filtered_search(filter_query, selected_type, selected_complexity)
+        
+        # 結果保存在 session state，展開項目觸發的重跑不會丟失結果
+        if st.session_state.filtered_results:
+            self.display_filtered_results(st.session_state.filtered_results)
 
     def execute_filtered_search(self, query, prompt_type, complexity):
         """執行過濾搜索"""
@@ -705,8 +884,14 @@ class StreamlitRAGInterface:
             if complexity != "全部":
                 filters["complexity"] = complexity
                 
-            results = st.session_state.rag_system.apply_user_filter(query, filters)
+            # 分頁：首頁檢索一次，之後的頁面經由游標取得
+            from source_code.config import PAGINATION_CONFIG
+            with stage("app.filtered_search", has_filters=bool(filters)):
+                results = st.session_state.rag_system.apply_user_filter(
+                    query, filters, lazy=True, page_size=PAGINATION_CONFIG["page_size"]
+                )
             
+            st.session_state.filtered_results = None
             if "error" in results:
                 st.error(f"搜索錯誤：{results['error']}")
                 return
@@ -714,21 +899,66 @@ class StreamlitRAGInterface:
             if results["total_found"] == 0:
                 st.warning("未找到符合條件的結果")
                 return
-                
-            # 顯示結果
-            st.markdown(f"🔍 找到 {results['total_found']} 個匹配結果")
-            
-            for result in results["results"]:
-                with st.expander(f"相似度: {result['score']:.3f}"):
-                    st.markdown(f"**類型**: {result['metadata']['prompt_type']}")
-                    st.markdown(f"**複雜度**: {result['metadata']['complexity']}")
-                    st.text_area("Prompt 內容", result["text"], height=100)
+            
+            results["query"] = query
+            results["filters"] = filters
+            st.session_state.filtered_results = results
+            st.session_state.result_generation += 1
                     
         except Exception as e:
             st.error(f"執行搜索時發生錯誤：{str(e)}")
     
+    def load_next_filtered_page(self):
+        """取下一頁並附加到已顯示的過濾結果 (按鈕回呼，在重跑前執行)"""
+        from source_code.config import PAGINATION_CONFIG
+        
+        results = st.session_state.filtered_results
+        if not results or not results.get("next_cursor"):
+            return
+        with stage("app.filtered_search", has_filters=bool(results["filters"]), paged=True):
+            page = st.session_state.rag_system.apply_user_filter(
+                results["query"],
+                results["filters"],
+                lazy=True,
+                page_size=PAGINATION_CONFIG["page_size"],
+                cursor=results["next_cursor"]
+            )
+        if "error" in page:
+            results["page_error"] = page["error"]
+            return
+        results.pop("page_error", None)
+        results["results"].extend(page["results"])
+        results["next_cursor"] = page.get("next_cursor")
+        results["total_found"] = page["total_found"]
+    
+    def display_filtered_results(self, results):
+        """顯示過濾搜索結果，全文只為已展開的項目載入"""
+        st.markdown(f"🔍 找到 {results['total_found']} 個匹配結果，已顯示 {len(results['results'])} 個")
+        
+        items = results["results"]
+        generation = st.session_state.result_generation
+        expander_keys = [f"filtered_{generation}_{i}" for i in range(len(items))]
+        self.hydrate_documents(items, expander_keys)
+        for result, key in zip(items, expander_keys):
+            expander, is_open = self.lazy_expander(f"相似度: {result['score']:.3f}", key)
+            with expander:
+                st.markdown(f"**類型**: {result['metadata']['prompt_type']}")
+                st.markdown(f"**複雜度**: {result['metadata']['complexity']}")
+                if is_open:
+                    if "text" not in result:
+                        self.hydrate_documents([result], [None])
+                    st.text_area("Prompt 內容", result.get("text", "(無法載入內容)"), height=100, key=f"{key}_text")
+                    self.render_aliases(result, key)
+        
+        if results.get("page_error"):
+            st.error(f"載入下一頁失敗：{results['page_error']}")
+        if results.get("next_cursor"):
+            st.button("⬇️ 載入更多結果", key=f"filtered_more_{generation}", on_click=self.load_next_filtered_page)
+    
     def render_system_analysis(self):
         """渲染系統分析界面"""
+        import pandas as pd
+        
         st.markdown("## 📊 系統分析與統計")
         
         if not self.system_stats:
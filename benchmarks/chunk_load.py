@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+chunk 載入基準：processed_chunks.json (json.load) vs. 列式 chunk 存儲 (mmap)
+
+每種方式在獨立子進程中執行，量測開啟並取一個 chunk、按記錄查詢的耗時與常駐記憶體增量。
+
+用法：
+    python -m benchmarks.chunk_load --repeat 5
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+from benchmarks.suite import REPO_ROOT
+
+_PROBE = r"""
+import json, os, sys, time
+sys.path.insert(0, {root!r})
+import numpy
+from source_code.config import CHUNK_STORE, PROCESSED_CHUNKS
+
+def rss():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+before = rss()
+start = time.perf_counter()
+if {mode!r} == "json":
+    with open(PROCESSED_CHUNKS, "r", encoding="utf-8") as f:
+        chunks = json.load(f)
+    opened = time.perf_counter()
+    chunk = chunks[len(chunks) // 2]
+    related = [c for c in chunks if c["metadata"].get("source_record_id") == "record_77"]
+else:
+    from source_code.chunk_store import ChunkStore
+    store = ChunkStore(str(CHUNK_STORE))
+    opened = time.perf_counter()
+    chunk = store[len(store) // 2]
+    related = store.by_record("record_77")
+end = time.perf_counter()
+print(json.dumps({{"open_ms": (opened - start) * 1000, "total_ms": (end - start) * 1000, "rss_mb": (rss() - before) / 2 ** 20}}))
+"""
+
+
+def measure(mode: str) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(root=REPO_ROOT, mode=mode)],
+        capture_output=True, text=True, check=True, cwd=REPO_ROOT
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="chunk 載入基準")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    from source_code.chunk_store import open_chunk_store
+    open_chunk_store()  # 確保列式文件存在且為最新
+
+    print(f"{'方式':<8}{'開啟 ms':>10}{'開啟+查詢 ms':>14}{'RSS 增量 MB':>14}")
+    for mode in ("json", "store"):
+        runs = [measure(mode) for _ in range(args.repeat)]
+        print(
+            f"{mode:<8}{statistics.median(r['open_ms'] for r in runs):>10.2f}"
+            f"{statistics.median(r['total_ms'] for r in runs):>14.2f}"
+            f"{statistics.median(r['rss_mb'] for r in runs):>14.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
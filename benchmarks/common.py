@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""
+基準測試共用工具
+
+提供離線、可重現的 embedding 替身，讓基準測試不依賴 OpenAI API，
+以及模擬遠端 API 延遲的延遲分佈。
+"""
+
+from typing import List
+
+# embedding 替身與延遲分佈已移至 source_code.replay (離線重放替身共用)，此處保留原匯入路徑
+from source_code.replay import TOKEN_PATTERN, HashingEmbeddingFunction, LatencyModel
+
+
+class DelayedEmbeddingFunction:
+    """在 embedding 替身前加上模擬的網路與 API 延遲"""
+    
+    def __init__(self, embedding_function, latency: LatencyModel):
+        self.embedding_function = embedding_function
+        self.latency = latency
+    
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        self.latency.sleep()
+        return self.embedding_function(input)
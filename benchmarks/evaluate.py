@@ -0,0 +1,651 @@
+# -*- coding: utf-8 -*-
+"""
+檢索品質 vs. 速度評估
+
+數據集每筆記錄都以 record_id 連結 task_description 與其 good_prompt / bad_prompt /
+expected_answer，構成現成的相關性標註：以 task_description 作為查詢，
+同一記錄的文檔即為相關文檔。
+
+語料 (--corpus)：
+- records: 每筆記錄一個 good_prompt 文檔 (與 process_dataset 相同)，相關度 1
+- chunks: chunk 存儲 (processed_chunks.json) 的全部 chunk；good_prompt / complete 相關度 2，
+  context / expected_output 相關度 1
+
+對每種檢索配置量測 recall@k (分母為 min(相關文檔數, k))、MRR@10、nDCG@10、
+單次檢索延遲與索引記憶體，並標出 (延遲, recall@10) 的 Pareto 前沿，
+讓效能優化能以證據確認召回率沒有下降。
+
+embedding (--embedder)：
+- hashing: 特徵雜湊替身 (預設，不需要 API Key)；召回率只反映詞彙重疊，不代表生產環境
+- openai: 經由共用客戶端呼叫真實 embedding API (SYSTEM_CONFIG["embedding_model"])
+- replay: 重放 --cassette 錄製的真實向量，未錄製的文本以特徵雜湊合成 (報告註明兩者數量)
+報告開頭與 JSON 的 embedder 欄位註明數字由哪個 embedding 產生。
+
+用法：
+    python -m benchmarks.evaluate --corpus records --queries 500
+    python -m benchmarks.evaluate --corpus chunks --replicate 10 --json eval.json
+    python -m benchmarks.evaluate --embedder openai --queries 200
+    PROMPT_RAG_RECORD=eval.jsonl python -m benchmarks.evaluate --embedder openai   # 錄製一次
+    python -m benchmarks.evaluate --embedder replay --cassette eval.jsonl          # 之後離線重放
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+from collections import Counter, OrderedDict, defaultdict
+from typing import Any, Dict, List, Optional
+
+from benchmarks.common import TOKEN_PATTERN, HashingEmbeddingFunction
+
+CHUNK_GRADES = {"good_prompt": 2, "complete": 2, "context": 1, "expected_output": 1}
+RECALL_CUTOFFS = (1, 5, 10)
+EVAL_DEPTH = 10
+EMBED_BATCH = 256    # 每次 embedding API 呼叫的文本數
+
+
+def _rss_bytes() -> Optional[int]:
+    """目前進程的常駐記憶體 (僅 Linux)"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+# ---------------------------------------------------------------------------
+# 語料與查詢
+# ---------------------------------------------------------------------------
+
+class Embedder:
+    """評估使用的 embedding 函數：分批呼叫並記錄向量的來源
+
+    Args:
+        kind: hashing / openai / replay
+        dimensions: hashing 與 replay 合成向量的維度
+        cassette: replay 使用的錄製文件
+    """
+
+    def __init__(self, kind: str = "hashing", dimensions: int = 1536, cassette: Optional[str] = None):
+        self.kind = kind
+        self.responder = None
+        if kind == "hashing":
+            self.function = HashingEmbeddingFunction(dimensions)
+            return
+        from source_code.openai_client import PooledEmbeddingFunction, get_client
+        if kind == "replay":
+            from source_code.replay import Cassette, ReplayOpenAIClient, Responder
+            if not cassette or not os.path.exists(cassette):
+                raise ValueError(f"replay 需要存在的錄製文件 (--cassette)：{cassette}")
+            self.responder = Responder(Cassette(cassette), dimensions=dimensions)
+            client = ReplayOpenAIClient(self.responder)
+        else:
+            # 共用客戶端：設置 PROMPT_RAG_RECORD 時同時錄製，供之後以 replay 重放
+            client = get_client()
+        self.function = PooledEmbeddingFunction(client)
+
+    def __call__(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for start in range(0, len(texts), EMBED_BATCH):
+            vectors.extend(self.function(texts[start:start + EMBED_BATCH]))
+        return vectors
+
+    def describe(self) -> Dict[str, Any]:
+        """報告用的向量來源：embedder 種類與模型標識 (重放時附上錄製與合成的文本數)"""
+        from source_code.vector_snapshot import embedding_model_name
+
+        info = {"kind": self.kind, "model": embedding_model_name(self.function)}
+        if self.responder is not None:
+            # 重放的向量來自錄製時的模型；synthesized 為 0 時數字等同該模型的結果
+            info.update(
+                model=self.function.model,
+                replayed=self.responder.stats["replayed"],
+                synthesized=self.responder.stats["synthesized"]
+            )
+        return info
+
+
+def load_corpus(kind: str, replicate: int, embedding_function) -> Dict[str, Any]:
+    """建立語料：文本、向量、每個文檔所屬的記錄與相關度"""
+    import numpy as np
+    from source_code.chunk_store import open_chunk_store
+    from source_code.dataset_store import load_dataset
+
+    df = load_dataset(["task_description", "good_prompt", "record_id"])
+    record_index = {f"record_{record_id}": i for i, record_id in enumerate(df["record_id"])}
+
+    base_texts, base_records, base_grades = [], [], []
+    if kind == "records":
+        base_texts = df["good_prompt"].fillna("").tolist()
+        base_records = list(range(len(df)))
+        base_grades = [1] * len(df)
+    else:
+        store = open_chunk_store()
+        for index in range(len(store)):
+            record = record_index.get(store.value(index, "source_record_id"))
+            if record is None:
+                continue
+            base_texts.append(store.text(index))
+            base_records.append(record)
+            base_grades.append(CHUNK_GRADES.get(store.value(index, "chunk_type"), 1))
+
+    texts, records, grades = [], [], []
+    for replica in range(replicate):
+        suffix = f"\n\n(variant {replica})" if replica else ""
+        texts.extend(text + suffix for text in base_texts)
+        records.extend(base_records)
+        grades.extend(base_grades)
+
+    vectors = np.asarray(embedding_function(texts), dtype=np.float32)
+    return {
+        "texts": texts,
+        "vectors": vectors,
+        "records": np.asarray(records),
+        "grades": np.asarray(grades),
+        "descriptions": df["task_description"].fillna("").tolist()
+    }
+
+
+def build_queries(corpus: Dict[str, Any], count: int, seed: int, embedding_function) -> List[Dict[str, Any]]:
+    """以 task_description 作為查詢，同一記錄的文檔為相關文檔"""
+    import numpy as np
+
+    relevant = defaultdict(dict)
+    for row, (record, grade) in enumerate(zip(corpus["records"], corpus["grades"])):
+        relevant[int(record)][row] = int(grade)
+
+    candidates = [r for r in relevant if corpus["descriptions"][r].strip()]
+    sample = random.Random(seed).sample(candidates, min(count, len(candidates)))
+    texts = [corpus["descriptions"][r] for r in sample]
+    vectors = np.asarray(embedding_function(texts), dtype=np.float32)
+    return [
+        {"text": text, "vector": vector, "relevant": relevant[record]}
+        for text, vector, record in zip(texts, vectors, sample)
+    ]
+
+
+# ---------------------------------------------------------------------------
+# 檢索配置
+# ---------------------------------------------------------------------------
+
+class Retriever:
+    """檢索配置的共同介面：build 建索引，search 返回文檔行號 (按相關性排序)"""
+
+    name = "base"
+
+    def build(self, corpus: Dict[str, Any]):
+        raise NotImplementedError
+
+    def search(self, vector, text: str, k: int) -> List[int]:
+        raise NotImplementedError
+
+    def index_bytes(self) -> Optional[int]:
+        return None
+
+    def close(self):
+        pass
+
+
+class ExactRetriever(Retriever):
+    """numpy 暴力內積 (向量已正規化，等同餘弦相似度)"""
+
+    name = "exact"
+
+    def build(self, corpus):
+        self.vectors = corpus["vectors"]
+
+    def search(self, vector, text, k):
+        import numpy as np
+
+        scores = self.vectors @ vector
+        top = np.argpartition(-scores, min(k, len(scores) - 1))[:k]
+        return top[np.argsort(-scores[top])].tolist()
+
+    def index_bytes(self):
+        return self.vectors.nbytes
+
+
+class Int8Retriever(Retriever):
+    """每向量對稱 int8 量化；rerank > 0 時以原始向量重排前 rerank 個候選"""
+
+    def __init__(self, rerank: int = 0):
+        self.rerank = rerank
+        self.name = f"int8_rerank{rerank}" if rerank else "int8"
+
+    def build(self, corpus):
+        import numpy as np
+
+        vectors = corpus["vectors"]
+        self.scales = np.abs(vectors).max(axis=1) / 127.0
+        self.scales[self.scales == 0] = 1.0
+        self.codes = np.round(vectors / self.scales[:, None]).astype(np.int8)
+        self.vectors = vectors if self.rerank else None
+
+    def search(self, vector, text, k):
+        import numpy as np
+
+        scores = (self.codes @ vector) * self.scales
+        depth = max(k, self.rerank)
+        top = np.argpartition(-scores, min(depth, len(scores) - 1))[:depth]
+        if self.rerank:
+            scores = self.vectors[top] @ vector
+            return top[np.argsort(-scores)][:k].tolist()
+        return top[np.argsort(-scores[top])][:k].tolist()
+
+    def index_bytes(self):
+        return self.codes.nbytes + self.scales.nbytes + (self.vectors.nbytes if self.vectors is not None else 0)
+
+
+class ProjectedRetriever(Retriever):
+    """PCA 降維粗排 + 原始向量重排 (與 PROMPT_RAG_PROJECTION_DIM 的快照檢索相同)
+
+    原始向量寫入臨時文件並以 mmap 開啟，重排只讀取候選行；index_bytes 只計投影向量與 PCA 參數。
+    """
+
+    def __init__(self, dimensions: int, rerank: int = 100):
+        self.dimensions = dimensions
+        self.rerank = rerank
+        self.name = f"pca{dimensions}_rerank{rerank}" if rerank else f"pca{dimensions}"
+
+    def build(self, corpus):
+        import tempfile
+
+        import numpy as np
+        from source_code.projection import PCAProjection
+
+        vectors = corpus["vectors"]
+        self.projection = PCAProjection.fit(vectors, self.dimensions)
+        self.projected = np.ascontiguousarray(self.projection.transform(vectors))
+        self.projected_norms = (self.projected * self.projected).sum(axis=1)
+        self.norms = (vectors * vectors).sum(axis=1)
+        self.tmp = tempfile.NamedTemporaryFile(suffix=".npy", delete=False)
+        self.tmp.close()
+        np.save(self.tmp.name, vectors)
+        self.vectors = np.load(self.tmp.name, mmap_mode="r")
+
+    def search(self, vector, text, k):
+        from source_code.projection import two_stage_search
+
+        rows, _ = two_stage_search(
+            vector, self.projection.transform(vector), self.projected, self.projected_norms,
+            self.vectors, self.norms, k, self.rerank
+        )
+        return rows
+
+    def index_bytes(self):
+        return (
+            self.projected.nbytes + self.projected_norms.nbytes + self.norms.nbytes
+            + self.projection.components.nbytes + self.projection.mean.nbytes
+        )
+
+    def close(self):
+        self.vectors = None
+        os.unlink(self.tmp.name)
+
+
+class ChromaRetriever(Retriever):
+    """Chroma HNSW，hnsw 參數直接傳給 collection configuration"""
+
+    def __init__(self, name: str, **hnsw):
+        self.name = name
+        self.hnsw = hnsw
+
+    def build(self, corpus):
+        import chromadb
+
+        self.client = chromadb.Client()
+        self.collection_name = f"eval_{self.name}"
+        try:
+            self.client.delete_collection(self.collection_name)
+        except Exception:
+            pass
+        configuration = {"hnsw": self.hnsw} if self.hnsw else None
+        self.collection = self.client.create_collection(
+            self.collection_name, embedding_function=None, configuration=configuration
+        )
+        vectors = corpus["vectors"]
+        for start in range(0, len(vectors), 5000):
+            end = min(start + 5000, len(vectors))
+            self.collection.add(ids=[str(i) for i in range(start, end)], embeddings=vectors[start:end])
+
+    def search(self, vector, text, k):
+        result = self.collection.query(query_embeddings=[vector], n_results=k, include=[])
+        return [int(i) for i in result["ids"][0]]
+
+    def close(self):
+        self.client.delete_collection(self.collection_name)
+
+
+class BM25Retriever(Retriever):
+    """純詞彙 BM25 (Okapi, k1=1.5, b=0.75)"""
+
+    name = "bm25"
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+
+    def build(self, corpus):
+        import numpy as np
+
+        postings = defaultdict(lambda: ([], []))
+        lengths = []
+        for row, text in enumerate(corpus["texts"]):
+            counts = Counter(TOKEN_PATTERN.findall(text.lower()))
+            lengths.append(sum(counts.values()))
+            for token, count in counts.items():
+                postings[token][0].append(row)
+                postings[token][1].append(count)
+
+        self.lengths = np.asarray(lengths, dtype=np.float32)
+        average = float(self.lengths.mean()) if len(self.lengths) else 1.0
+        self.norms = self.k1 * (1 - self.b + self.b * self.lengths / max(average, 1e-9))
+        total = len(lengths)
+        self.postings = {
+            token: (
+                np.asarray(rows, dtype=np.int32),
+                np.asarray(counts, dtype=np.float32),
+                math.log(1 + (total - len(rows) + 0.5) / (len(rows) + 0.5))
+            )
+            for token, (rows, counts) in postings.items()
+        }
+
+    def scores(self, text: str):
+        import numpy as np
+
+        scores = np.zeros(len(self.lengths), dtype=np.float32)
+        for token in set(TOKEN_PATTERN.findall(text.lower())):
+            posting = self.postings.get(token)
+            if posting is None:
+                continue
+            rows, counts, idf = posting
+            scores[rows] += idf * counts * (self.k1 + 1) / (counts + self.norms[rows])
+        return scores
+
+    def search(self, vector, text, k):
+        import numpy as np
+
+        scores = self.scores(text)
+        top = np.argpartition(-scores, min(k, len(scores) - 1))[:k]
+        return top[np.argsort(-scores[top])].tolist()
+
+    def index_bytes(self):
+        return sum(rows.nbytes + counts.nbytes for rows, counts, _ in self.postings.values()) + self.lengths.nbytes
+
+
+class HybridRetriever(Retriever):
+    """向量 (exact) 與 BM25 以 Reciprocal Rank Fusion 融合"""
+
+    name = "hybrid_bm25_rrf"
+
+    def __init__(self, depth: int = 50, rrf_k: int = 60):
+        self.depth = depth
+        self.rrf_k = rrf_k
+        self.vector = ExactRetriever()
+        self.lexical = BM25Retriever()
+
+    def build(self, corpus):
+        self.vector.build(corpus)
+        self.lexical.build(corpus)
+
+    def search(self, vector, text, k):
+        fused = defaultdict(float)
+        for ranking in (self.vector.search(vector, text, self.depth), self.lexical.search(vector, text, self.depth)):
+            for rank, row in enumerate(ranking):
+                fused[row] += 1.0 / (self.rrf_k + rank + 1)
+        return sorted(fused, key=fused.get, reverse=True)[:k]
+
+    def index_bytes(self):
+        return self.vector.index_bytes() + self.lexical.index_bytes()
+
+
+class CentroidRetriever(Retriever):
+    """球面 k-means 分群路由 (IVF)：只在最近的 nprobe 個群內做精確比對"""
+
+    def __init__(self, nprobe: int, nlist: Optional[int] = None, iterations: int = 10, seed: int = 0):
+        self.nprobe = nprobe
+        self.nlist = nlist
+        self.iterations = iterations
+        self.seed = seed
+        self.name = f"centroid_nprobe{nprobe}"
+
+    def build(self, corpus):
+        import numpy as np
+
+        vectors = corpus["vectors"]
+        nlist = self.nlist or max(1, int(math.sqrt(len(vectors))))
+        rng = np.random.default_rng(self.seed)
+        centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+        for _ in range(self.iterations):
+            assignment = np.argmax(vectors @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = vectors[assignment == c]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    centroids[c] = centroid / (np.linalg.norm(centroid) + 1e-12)
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+
+        self.vectors = vectors
+        self.centroids = centroids
+        self.lists = [np.flatnonzero(assignment == c) for c in range(nlist)]
+
+    def search(self, vector, text, k):
+        import numpy as np
+
+        probes = np.argsort(-(self.centroids @ vector))[:self.nprobe]
+        rows = np.concatenate([self.lists[c] for c in probes])
+        if len(rows) == 0:
+            return []
+        scores = self.vectors[rows] @ vector
+        top = np.argsort(-scores)[:k]
+        return rows[top].tolist()
+
+    def index_bytes(self):
+        return self.vectors.nbytes + self.centroids.nbytes + sum(rows.nbytes for rows in self.lists)
+
+
+class CachedRetriever(Retriever):
+    """在內層配置前加上以查詢文本為鍵的 LRU 結果快取
+
+    評估時查詢集會重放兩次，延遲反映一半命中的情況；召回率與內層配置相同。
+    """
+
+    replay = 2
+
+    def __init__(self, inner: Retriever, size: int = 1024):
+        self.inner = inner
+        self.size = size
+        self.name = f"{inner.name}+cache"
+        self.cache = OrderedDict()
+
+    def build(self, corpus):
+        self.inner.build(corpus)
+
+    def search(self, vector, text, k):
+        key = (text, k)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        result = self.inner.search(vector, text, k)
+        self.cache[key] = result
+        if len(self.cache) > self.size:
+            self.cache.popitem(last=False)
+        return result
+
+    def index_bytes(self):
+        return self.inner.index_bytes()
+
+    def close(self):
+        self.inner.close()
+
+
+def default_configurations() -> List[Retriever]:
+    return [
+        ExactRetriever(),
+        ChromaRetriever("chroma_default"),
+        ChromaRetriever("chroma_ef10_m8", ef_search=10, max_neighbors=8),
+        ChromaRetriever("chroma_ef50_m16", ef_search=50, max_neighbors=16),
+        ChromaRetriever("chroma_ef200_m32", ef_search=200, max_neighbors=32, ef_construction=200),
+        Int8Retriever(),
+        Int8Retriever(rerank=50),
+        ProjectedRetriever(64),
+        ProjectedRetriever(128, rerank=0),
+        ProjectedRetriever(128),
+        ProjectedRetriever(256),
+        BM25Retriever(),
+        HybridRetriever(),
+        CentroidRetriever(nprobe=1),
+        CentroidRetriever(nprobe=4),
+        CentroidRetriever(nprobe=16),
+        CachedRetriever(ExactRetriever()),
+    ]
+
+
+# ---------------------------------------------------------------------------
+# 評估
+# ---------------------------------------------------------------------------
+
+def score_ranking(ranking: List[int], relevant: Dict[int, int]) -> Dict[str, float]:
+    """單一查詢的 recall@k、reciprocal rank 與 nDCG@EVAL_DEPTH"""
+    metrics = {}
+    for k in RECALL_CUTOFFS:
+        hits = sum(1 for row in ranking[:k] if row in relevant)
+        metrics[f"recall@{k}"] = hits / min(len(relevant), k)
+
+    metrics["mrr@10"] = 0.0
+    for rank, row in enumerate(ranking[:EVAL_DEPTH], 1):
+        if row in relevant:
+            metrics["mrr@10"] = 1.0 / rank
+            break
+
+    dcg = sum((2 ** relevant.get(row, 0) - 1) / math.log2(rank + 1) for rank, row in enumerate(ranking[:EVAL_DEPTH], 1))
+    ideal = sorted(relevant.values(), reverse=True)[:EVAL_DEPTH]
+    idcg = sum((2 ** grade - 1) / math.log2(rank + 1) for rank, grade in enumerate(ideal, 1))
+    metrics["ndcg@10"] = dcg / idcg if idcg else 0.0
+    return metrics
+
+
+def evaluate(retriever: Retriever, corpus: Dict[str, Any], queries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """建索引並跑完查詢集，返回品質、延遲與記憶體指標"""
+    import numpy as np
+
+    rss_before = _rss_bytes()
+    start = time.perf_counter()
+    retriever.build(corpus)
+    build_s = time.perf_counter() - start
+    rss_after = _rss_bytes()
+
+    totals = defaultdict(float)
+    latencies = []
+    for replay in range(getattr(retriever, "replay", 1)):
+        for query in queries:
+            begin = time.perf_counter()
+            ranking = retriever.search(query["vector"], query["text"], EVAL_DEPTH)
+            latencies.append(time.perf_counter() - begin)
+            if replay == 0:
+                for metric, value in score_ranking(ranking, query["relevant"]).items():
+                    totals[metric] += value
+    retriever.close()
+
+    samples = np.asarray(latencies) * 1000
+    result = {metric: value / len(queries) for metric, value in totals.items()}
+    result.update({
+        "config": retriever.name,
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p95_ms": float(np.percentile(samples, 95)),
+        "build_s": build_s,
+        "index_mb": retriever.index_bytes() / 2 ** 20 if retriever.index_bytes() is not None else None,
+        "rss_delta_mb": (rss_after - rss_before) / 2 ** 20 if rss_before is not None and rss_after is not None else None
+    })
+    return result
+
+
+def mark_pareto(results: List[Dict[str, Any]], quality: str = "recall@10", cost: str = "p50_ms"):
+    """標記 (cost 越低、quality 越高) 的 Pareto 前沿"""
+    for result in results:
+        result["pareto"] = not any(
+            other is not result
+            and other[cost] <= result[cost]
+            and other[quality] >= result[quality]
+            and (other[cost] < result[cost] or other[quality] > result[quality])
+            for other in results
+        )
+
+
+def format_embedder(embedder: Dict[str, Any]) -> str:
+    text = f"{embedder['kind']} ({embedder['model']})"
+    if "replayed" in embedder:
+        text += f"，重放 {embedder['replayed']} 條、合成 {embedder['synthesized']} 條"
+    if embedder["kind"] == "hashing" or embedder.get("synthesized"):
+        text += "；含特徵雜湊向量，召回率不代表生產環境的 embedding"
+    return text
+
+
+def print_table(results: List[Dict[str, Any]]):
+    print(
+        f"{'配置':<22}{'R@1':>7}{'R@5':>7}{'R@10':>7}{'MRR':>7}{'nDCG':>7}"
+        f"{'p50 ms':>9}{'p95 ms':>9}{'索引 MB':>9}{'RSS MB':>9}  Pareto"
+    )
+    for r in sorted(results, key=lambda item: item["p50_ms"]):
+        index_mb = f"{r['index_mb']:.1f}" if r["index_mb"] is not None else "-"
+        rss_mb = f"{r['rss_delta_mb']:.1f}" if r["rss_delta_mb"] is not None else "-"
+        print(
+            f"{r['config']:<22}{r['recall@1']:>7.3f}{r['recall@5']:>7.3f}{r['recall@10']:>7.3f}"
+            f"{r['mrr@10']:>7.3f}{r['ndcg@10']:>7.3f}{r['p50_ms']:>9.3f}{r['p95_ms']:>9.3f}"
+            f"{index_mb:>9}{rss_mb:>9}  {'★' if r['pareto'] else ''}"
+        )
+
+
+def main(configurations: Optional[List[Retriever]] = None):
+    parser = argparse.ArgumentParser(description="檢索品質 vs. 速度評估")
+    parser.add_argument("--corpus", choices=["records", "chunks"], default="records")
+    parser.add_argument("--replicate", type=int, default=1, help="語料合成複製倍數")
+    parser.add_argument("--queries", type=int, default=500, help="評估查詢數")
+    parser.add_argument("--embedder", choices=["hashing", "openai", "replay"], default="hashing",
+                        help="產生向量的 embedding (見模組說明)")
+    parser.add_argument("--cassette", default=os.environ.get("PROMPT_RAG_CASSETTE"), help="replay 使用的錄製文件")
+    parser.add_argument("--dimensions", type=int, default=1536, help="embedding 替身的向量維度")
+    parser.add_argument("--only", help="只評估名稱包含此字串的配置 (逗號分隔)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", dest="json_path", help="將結果寫入 JSON 文件")
+    args = parser.parse_args()
+
+    try:
+        embedding_function = Embedder(args.embedder, args.dimensions, args.cassette)
+    except ValueError as e:
+        parser.error(str(e))
+    print("建立語料與查詢...", file=sys.stderr)
+    corpus = load_corpus(args.corpus, args.replicate, embedding_function)
+    queries = build_queries(corpus, args.queries, args.seed, embedding_function)
+    embedder = embedding_function.describe()
+
+    configurations = configurations or default_configurations()
+    if args.only:
+        patterns = [p.strip() for p in args.only.split(",") if p.strip()]
+        configurations = [c for c in configurations if any(p in c.name for p in patterns)]
+
+    results = []
+    for retriever in configurations:
+        print(f"評估 {retriever.name}...", file=sys.stderr)
+        results.append(evaluate(retriever, corpus, queries))
+    mark_pareto(results)
+    print(f"embedding：{format_embedder(embedder)}")
+    print_table(results)
+
+    if args.json_path:
+        report = {
+            "settings": vars(args),
+            "embedder": embedder,
+            "documents": len(corpus["texts"]),
+            "queries": len(queries),
+            "results": results
+        }
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,415 @@
+# -*- coding: utf-8 -*-
+"""
+並發負載測試
+
+以數據集的 task_description、其改寫句與隨機拼接的上下文作為請求，
+對進程內的 PromptGeneratorRAGSystem 或 HTTP 前端 (POST <url>/query) 施壓。
+
+- 並發模型：threads / asyncio / processes
+- 到達模式：--rate > 0 為開環 Poisson 到達 (延遲從排定到達時間起算，包含排隊時間)；
+  --rate 0 為閉環，每個用戶完成一個請求後立即發出下一個
+- 進程內目標使用 embedding 替身，以 --embed-delay 指定模擬的 API 延遲分佈
+  (例如 lognormal:3.9:0.5)；目前引擎的查詢路徑不呼叫 LLM，因此只有 embedding 需要模擬。
+  --transport replay 時 embedding 經由共用 OpenAI 客戶端與重放替身，可以 --error-rate 注入錯誤
+- 按時間窗口報告吞吐量、p50/p95/p99 延遲、錯誤率與 embedding 快取命中率
+
+用法：
+    python -m benchmarks.loadtest --users 50 --rate 100 --duration 30 --model threads
+    python -m benchmarks.loadtest --users 200 --rate 0 --model asyncio --embed-delay lognormal:3.9:0.5
+    python -m benchmarks.loadtest --url http://localhost:8000 --users 100 --rate 200
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from benchmarks.common import DelayedEmbeddingFunction, HashingEmbeddingFunction, LatencyModel
+from benchmarks.suite import summarize
+
+PARAPHRASE_TEMPLATES = (
+    "{task}",
+    "Help me {lower}",
+    "I need a prompt to {lower}",
+    "Can you {lower}?",
+    "幫我{task}",
+    "Write a prompt that will {lower}",
+    "{task}, please keep it concise",
+)
+
+# 每筆請求記錄：(排定到達時間偏移, 延遲秒數, 是否成功)
+Record = Tuple[float, float, bool]
+# 快取統計取樣：(時間偏移, 累計命中數, 累計未命中數)
+CacheSample = Tuple[float, int, int]
+CACHE_SAMPLE_INTERVAL = 0.5
+
+
+def build_request_pool(size: int, context_ratio: float, seed: int) -> List[Dict[str, Any]]:
+    """以數據集描述、改寫句與上下文生成請求池"""
+    from source_code.chunk_store import open_chunk_store
+    from source_code.dataset_store import load_dataset
+
+    rng = random.Random(seed)
+    descriptions = load_dataset(["task_description"])["task_description"].dropna().tolist()
+    context_texts = list(open_chunk_store().iter_texts(chunk_type="context"))
+
+    pool = []
+    for _ in range(size):
+        task = rng.choice(descriptions).strip()
+        words = task.split()
+        # 隨機丟棄一個詞，產生更多樣的改寫
+        if len(words) > 4 and rng.random() < 0.3:
+            words.pop(rng.randrange(len(words)))
+        task = " ".join(words)
+        text = rng.choice(PARAPHRASE_TEMPLATES).format(task=task, lower=task[:1].lower() + task[1:])
+
+        context = None
+        if rng.random() < context_ratio:
+            context = "\n\n".join(rng.sample(context_texts, rng.randint(1, 4)))
+        pool.append({"query": text, "context": context})
+    return pool
+
+
+class InProcessTarget:
+    """直接呼叫進程內的引擎"""
+
+    def __init__(self, embed_delay: str, dimensions: int, seed: int, transport: str = "direct", error_rate: float = 0.0):
+        from source_code.prompt_rag_system import PromptGeneratorRAGSystem
+
+        # ingest 不加延遲，只有查詢時的 embedding 才模擬 API 延遲
+        self.embedding_function = HashingEmbeddingFunction(dimensions)
+        self.rag_system = PromptGeneratorRAGSystem(embedding_function=self.embedding_function)
+        if transport == "replay":
+            # 經由共用 OpenAI 客戶端 (並發上限、重試、在途合併) 與進程內重放替身
+            from source_code.openai_client import PooledEmbeddingFunction
+            from source_code.replay import ReplayOpenAIClient, Responder
+
+            responder = Responder(dimensions=dimensions, latency=embed_delay, error_rate=error_rate, seed=seed)
+            responder.embedding_function = self.embedding_function
+            self.rag_system.embedding_function = PooledEmbeddingFunction(ReplayOpenAIClient(responder))
+        else:
+            self.rag_system.embedding_function = DelayedEmbeddingFunction(
+                self.embedding_function, LatencyModel(embed_delay, seed)
+            )
+
+    def call(self, item: Dict[str, Any]) -> bool:
+        result = self.rag_system.query(item["query"], item.get("context"))
+        return "error" not in result
+
+    def cache_stats(self) -> Optional[Tuple[int, int]]:
+        stats = self.rag_system.embedding_cache_stats
+        return stats["hits"], stats["misses"]
+
+
+class HttpTarget:
+    """對 HTTP 前端發送 POST <url>/query"""
+
+    def __init__(self, url: str, timeout: float):
+        self.url = url.rstrip("/") + "/query"
+        self.timeout = timeout
+
+    def call(self, item: Dict[str, Any]) -> bool:
+        body = json.dumps({"query": item["query"], "context": item.get("context")}).encode("utf-8")
+        request = urllib.request.Request(self.url, data=body, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status == 200 and "error" not in json.loads(response.read())
+        except Exception:
+            return False
+
+    def cache_stats(self) -> Optional[Tuple[int, int]]:
+        return None
+
+
+def _arrivals(rate: float, duration: float, seed: int) -> List[float]:
+    """Poisson 到達時間偏移 (秒)"""
+    rng = random.Random(seed)
+    times, now = [], 0.0
+    while True:
+        now += rng.expovariate(rate)
+        if now >= duration:
+            return times
+        times.append(now)
+
+
+def _safe_call(target, item: Dict[str, Any]) -> bool:
+    try:
+        return target.call(item)
+    except Exception:
+        return False
+
+
+class _CacheSampler:
+    """背景線程定期取樣目標的累計快取統計"""
+
+    def __init__(self, target, start: float):
+        self.target = target
+        self.start = start
+        self.samples: List[CacheSample] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        stats = self.target.cache_stats()
+        if stats is not None:
+            self.samples.append((time.perf_counter() - self.start, stats[0], stats[1]))
+
+    def _run(self):
+        self._sample()
+        while not self._stop.wait(CACHE_SAMPLE_INTERVAL):
+            self._sample()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        return False
+
+
+def run_threads(target, pool: List[Dict[str, Any]], users: int, rate: float, duration: float, seed: int) -> Tuple[List[Record], List[CacheSample]]:
+    """線程模型：開環時由調度線程按到達時間放入隊列，users 個工作線程消費"""
+    start = time.perf_counter()
+    with _CacheSampler(target, start) as sampler:
+        records = _run_threads(target, pool, users, rate, duration, seed, start)
+    return records, sampler.samples
+
+
+def _run_threads(target, pool, users, rate, duration, seed, start) -> List[Record]:
+    records: List[Record] = []
+    lock = threading.Lock()
+    rng = random.Random(seed)
+
+    def record(offset: float, ok: bool):
+        with lock:
+            records.append((offset, time.perf_counter() - start - offset, ok))
+
+    if rate > 0:
+        jobs: "queue.Queue[Optional[float]]" = queue.Queue()
+
+        def worker():
+            while True:
+                offset = jobs.get()
+                if offset is None:
+                    return
+                record(offset, _safe_call(target, rng.choice(pool)))
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(users)]
+        for thread in threads:
+            thread.start()
+        for offset in _arrivals(rate, duration, seed):
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            jobs.put(offset)
+        for _ in threads:
+            jobs.put(None)
+    else:
+        def user():
+            while time.perf_counter() - start < duration:
+                offset = time.perf_counter() - start
+                record(offset, _safe_call(target, rng.choice(pool)))
+
+        threads = [threading.Thread(target=user, daemon=True) for _ in range(users)]
+        for thread in threads:
+            thread.start()
+
+    for thread in threads:
+        thread.join()
+    return records
+
+
+def run_asyncio(target, pool: List[Dict[str, Any]], users: int, rate: float, duration: float, seed: int) -> Tuple[List[Record], List[CacheSample]]:
+    """asyncio 模型：事件循環調度請求，同步的目標呼叫在 users 大小的線程池中執行"""
+    rng = random.Random(seed)
+
+    async def main() -> List[Record]:
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=users)
+        records: List[Record] = []
+        start = loop.time()
+
+        async def one(offset: float):
+            ok = await loop.run_in_executor(executor, _safe_call, target, rng.choice(pool))
+            records.append((offset, loop.time() - start - offset, ok))
+
+        if rate > 0:
+            tasks = []
+            for offset in _arrivals(rate, duration, seed):
+                delay = start + offset - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                tasks.append(asyncio.create_task(one(offset)))
+            await asyncio.gather(*tasks)
+        else:
+            async def user():
+                while loop.time() - start < duration:
+                    await one(loop.time() - start)
+            await asyncio.gather(*(user() for _ in range(users)))
+
+        executor.shutdown(wait=True)
+        return records
+
+    with _CacheSampler(target, time.perf_counter()) as sampler:
+        records = asyncio.run(main())
+    return records, sampler.samples
+
+
+def _process_worker(args: Dict[str, Any]) -> Tuple[List[Record], List[CacheSample]]:
+    """processes 模型的子進程：各自建立目標並以線程模型承擔一部分負載"""
+    target = _make_target(args)
+    pool = build_request_pool(args["pool_size"], args["context_ratio"], args["seed"])
+    return run_threads(target, pool, args["users"], args["rate"], args["duration"], args["seed"])
+
+
+def run_processes(args: Dict[str, Any], processes: int) -> Tuple[List[Record], List[List[CacheSample]]]:
+    """processes 模型：用戶數與到達率平均分給各子進程"""
+    import multiprocessing
+
+    shares = []
+    for index in range(processes):
+        share = dict(args)
+        share["users"] = max(1, args["users"] // processes)
+        share["rate"] = args["rate"] / processes
+        share["seed"] = args["seed"] + index
+        shares.append(share)
+    with multiprocessing.get_context("spawn").Pool(processes) as process_pool:
+        results = process_pool.map(_process_worker, shares)
+    records = [record for process_records, _ in results for record in process_records]
+    return records, [samples for _, samples in results]
+
+
+def _make_target(args: Dict[str, Any]):
+    if args.get("url"):
+        return HttpTarget(args["url"], args["timeout"])
+    return InProcessTarget(
+        args["embed_delay"], args["dimensions"], args["seed"], args["transport"], args["error_rate"]
+    )
+
+
+def build_report(records: List[Record], sample_sets: List[List[CacheSample]], window: float, duration: float) -> Dict[str, Any]:
+    """按完成時間切分時間窗口並整理報告"""
+    bucket_count = max(1, int((duration + window - 1e-9) // window) + 1)
+    buckets: List[List[Record]] = [[] for _ in range(bucket_count)]
+    for record in records:
+        index = min(bucket_count - 1, int((record[0] + record[1]) // window))
+        buckets[index].append(record)
+
+    # 相鄰取樣的差值歸入後一個取樣所在的窗口
+    cache_deltas = [[0, 0] for _ in range(bucket_count)]
+    for samples in sample_sets:
+        for previous, current in zip(samples, samples[1:]):
+            index = min(bucket_count - 1, int(current[0] // window))
+            cache_deltas[index][0] += current[1] - previous[1]
+            cache_deltas[index][1] += current[2] - previous[2]
+
+    def describe(items: List[Record], elapsed: float, hits: int, misses: int) -> Dict[str, Any]:
+        summary = summarize([item[1] for item in items], len(items), elapsed)
+        summary["error_rate"] = sum(1 for item in items if not item[2]) / len(items)
+        summary["cache_hit_rate"] = hits / (hits + misses) if sample_sets and hits + misses else None
+        return summary
+
+    windows = []
+    for index, items in enumerate(buckets):
+        if items:
+            entry = describe(items, window, *cache_deltas[index])
+            entry["window_start_s"] = index * window
+            windows.append(entry)
+
+    if not records:
+        return {"overall": {"items": 0}, "windows": windows}
+    elapsed = max(r[0] + r[1] for r in records)
+    total_hits = sum(delta[0] for delta in cache_deltas)
+    total_misses = sum(delta[1] for delta in cache_deltas)
+    return {"overall": describe(records, elapsed, total_hits, total_misses), "windows": windows}
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"{'窗口(s)':>8}{'請求':>8}{'吞吐/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'錯誤率':>8}{'快取命中':>10}")
+
+    def line(label: str, entry: Dict[str, Any]):
+        hit_rate = entry.get("cache_hit_rate")
+        print(
+            f"{label:>8}{entry['items']:>8}{entry['throughput_per_s']:>10.1f}{entry['p50_ms']:>10.1f}"
+            f"{entry['p95_ms']:>10.1f}{entry['p99_ms']:>10.1f}{entry['error_rate']:>8.1%}"
+            f"{(f'{hit_rate:.1%}' if hit_rate is not None else 'n/a'):>10}"
+        )
+
+    for entry in report["windows"]:
+        line(f"{entry['window_start_s']:.0f}", entry)
+    if report["overall"]["items"]:
+        line("總計", report["overall"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="並發負載測試")
+    parser.add_argument("--users", type=int, default=50, help="並發用戶數 (20-200)")
+    parser.add_argument("--rate", type=float, default=100.0, help="每秒到達請求數；0 表示閉環")
+    parser.add_argument("--duration", type=float, default=30.0, help="施壓秒數")
+    parser.add_argument("--model", choices=["threads", "asyncio", "processes"], default="threads")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 2, help="processes 模型的子進程數")
+    parser.add_argument("--url", help="HTTP 前端位址；未提供時對進程內引擎施壓")
+    parser.add_argument("--timeout", type=float, default=30.0, help="HTTP 請求逾時秒數")
+    parser.add_argument("--embed-delay", default="lognormal:3.9:0.5", help="模擬 embedding API 的延遲分佈")
+    parser.add_argument("--dimensions", type=int, default=1536, help="embedding 替身的向量維度")
+    parser.add_argument(
+        "--transport", choices=["direct", "replay"], default="direct",
+        help="direct 直接呼叫 embedding 替身；replay 經由共用 OpenAI 客戶端與重放替身"
+    )
+    parser.add_argument("--error-rate", type=float, default=0.0, help="replay 傳輸注入錯誤的比例")
+    parser.add_argument("--context-ratio", type=float, default=0.3, help="帶上下文的請求比例")
+    parser.add_argument("--pool-size", type=int, default=5000, help="請求池大小，越小快取命中率越高")
+    parser.add_argument("--window", type=float, default=5.0, help="報告時間窗口秒數")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", dest="json_path", help="將報告寫入 JSON 文件")
+    args = parser.parse_args()
+
+    settings = {
+        "url": args.url,
+        "timeout": args.timeout,
+        "embed_delay": args.embed_delay,
+        "dimensions": args.dimensions,
+        "transport": args.transport,
+        "error_rate": args.error_rate,
+        "context_ratio": args.context_ratio,
+        "pool_size": args.pool_size,
+        "users": args.users,
+        "rate": args.rate,
+        "duration": args.duration,
+        "seed": args.seed
+    }
+    LatencyModel(args.embed_delay)
+
+    if args.model == "processes":
+        print(f"以 {args.processes} 個子進程施壓...", file=sys.stderr)
+        records, sample_sets = run_processes(settings, args.processes)
+    else:
+        target = _make_target(settings)
+        pool = build_request_pool(args.pool_size, args.context_ratio, args.seed)
+        print(f"以 {args.model} 模型、{args.users} 個用戶施壓 {args.duration:.0f} 秒...", file=sys.stderr)
+        runner = run_threads if args.model == "threads" else run_asyncio
+        records, samples = runner(target, pool, args.users, args.rate, args.duration, args.seed)
+        sample_sets = [samples]
+
+    report = build_report(records, sample_sets, args.window, args.duration)
+    report["settings"] = dict(settings, model=args.model)
+    print_report(report)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+啟動時間基準測試
+
+在全新的 Python 子進程中量測：
+- 模組導入時間 (含 -X importtime 統計的最重依賴)
+- 首次查詢時間 (導入 → 系統初始化與數據載入 → 第一次查詢)
+
+使用離線 embedding 替身，不需要 OpenAI API Key。
+
+用法：
+    python -m benchmarks.startup [--repeat 3] [--json startup.json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Any, Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SCRIPT = """
+import time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+
+FIRST_QUERY_SCRIPT = """
+import json, time
+start = time.perf_counter()
+from source_code.prompt_rag_system import PromptGeneratorRAGSystem
+imported = time.perf_counter()
+from benchmarks.common import HashingEmbeddingFunction
+rag_system = PromptGeneratorRAGSystem(embedding_function=HashingEmbeddingFunction())
+initialized = time.perf_counter()
+result = rag_system.query("Write a creative story about space exploration")
+queried = time.perf_counter()
+print(json.dumps({
+    "import_s": imported - start,
+    "init_s": initialized - imported,
+    "first_query_s": queried - initialized,
+    "total_s": queried - start,
+    "query_ok": "error" not in result
+}))
+"""
+
+
+def _run(script: str, extra_args: List[str] = None) -> subprocess.CompletedProcess:
+    """在倉庫根目錄下以全新解釋器執行腳本"""
+    return subprocess.run(
+        [sys.executable] + (extra_args or []) + ["-c", script],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+
+
+def _parse_importtime(stderr: str) -> Dict[str, float]:
+    """解析 -X importtime 輸出，返回模組名稱與累計秒數"""
+    timings = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        timings[parts[2].strip()] = int(parts[1]) / 1e6
+    return timings
+
+
+def measure_import(module: str, repeat: int) -> Dict[str, Any]:
+    """量測模組在全新進程中的導入時間"""
+    timings = []
+    for _ in range(repeat):
+        output = _run(IMPORT_SCRIPT.format(module=module)).stdout.strip().splitlines()
+        timings.append(float(output[-1]))
+    
+    # 以 -X importtime 找出累計耗時最多的依賴（排除解釋器啟動本身就會導入的模組）
+    startup_modules = set(_parse_importtime(_run("pass", ["-X", "importtime"]).stderr))
+    timings_by_module = _parse_importtime(_run(IMPORT_SCRIPT.format(module=module), ["-X", "importtime"]).stderr)
+    top_level = [
+        (name, seconds) for name, seconds in timings_by_module.items()
+        if name not in startup_modules and name != module
+    ]
+    top_level.sort(key=lambda item: item[1], reverse=True)
+    
+    return {
+        "module": module,
+        "median_s": statistics.median(timings),
+        "min_s": min(timings),
+        "heaviest_imports": [{"module": name, "cumulative_s": seconds} for name, seconds in top_level[:8]]
+    }
+
+
+def measure_first_query(repeat: int) -> Dict[str, Any]:
+    """量測從進程啟動到第一次查詢完成的時間"""
+    runs = []
+    for _ in range(repeat):
+        output = _run(FIRST_QUERY_SCRIPT).stdout.strip().splitlines()
+        runs.append(json.loads(output[-1]))
+    
+    summary = {key: statistics.median(run[key] for run in runs) for key in ("import_s", "init_s", "first_query_s", "total_s")}
+    summary["query_ok"] = all(run["query_ok"] for run in runs)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="啟動時間基準測試")
+    parser.add_argument("--repeat", type=int, default=3, help="每項量測的重複次數")
+    parser.add_argument("--json", dest="json_path", help="將結果寫入 JSON 文件")
+    args = parser.parse_args()
+    
+    report = {
+        "python": sys.version.split()[0],
+        "imports": [measure_import("source_code.prompt_rag_system", args.repeat)],
+        "first_query": measure_first_query(args.repeat)
+    }
+    
+    for item in report["imports"]:
+        print(f"導入 {item['module']}: {item['median_s'] * 1000:.1f} ms (median)")
+        for heavy in item["heaviest_imports"]:
+            print(f"  {heavy['module']:<30} {heavy['cumulative_s'] * 1000:8.1f} ms")
+    
+    first_query = report["first_query"]
+    print(
+        f"首次查詢: 導入 {first_query['import_s'] * 1000:.1f} ms, "
+        f"初始化 {first_query['init_s'] * 1000:.1f} ms, "
+        f"查詢 {first_query['first_query_s'] * 1000:.1f} ms, "
+        f"合計 {first_query['total_s'] * 1000:.1f} ms"
+    )
+    
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
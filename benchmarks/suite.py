@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+"""
+離線基準測試套件
+
+以 processed_dataset.csv 與 chunk 存儲 (processed_chunks.json 的列式版本) 建立工作負載，
+使用確定性的 embedding 替身 (不呼叫 OpenAI)，在多個語料規模 (1x、10x、100x 合成複製) 下量測：
+- ingest: process_dataset 的吞吐量與每批延遲
+- no_context_query / context_query: query() 兩條檢索路徑
+- filtered_query: apply_user_filter()
+- batch_query: batch_query()，每批 BATCH_SIZE 個查詢
+
+每項報告吞吐量與 p50/p95/p99 延遲，結果寫成 JSON 基準；
+以 --compare 指定舊基準時，吞吐量下降或延遲上升超過門檻即標示為退化並以非零碼退出。
+
+用法：
+    python -m benchmarks.suite --scales 1,10,100 --output baseline.json
+    python -m benchmarks.suite --scales 1,10 --compare baseline.json --threshold 0.20
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Dict, List
+
+from benchmarks.common import HashingEmbeddingFunction
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BATCH_SIZE = 16
+CONTEXT_TARGET_CHARS = 3000
+
+# 比較時檢查的指標：(指標, 數值越大越好)
+COMPARED_METRICS = (("throughput_per_s", True), ("p50_ms", False), ("p95_ms", False))
+
+
+class _CallTimer:
+    """記錄每次 embedding 呼叫的開始時間
+
+    process_dataset 逐批「embedding → 寫入」，相鄰兩次呼叫的時間差即為一批的完整延遲。
+    """
+
+    def __init__(self, embedding_function):
+        self.embedding_function = embedding_function
+        self.starts = []
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        self.starts.append(time.perf_counter())
+        return self.embedding_function(input)
+
+
+def summarize(latencies: List[float], items: int, elapsed: float) -> Dict[str, Any]:
+    """整理延遲樣本 (秒) 為吞吐量與百分位數 (毫秒)"""
+    import numpy as np
+
+    samples = np.asarray(latencies, dtype=np.float64) * 1000
+    return {
+        "operations": len(latencies),
+        "items": items,
+        "throughput_per_s": items / elapsed if elapsed > 0 else 0.0,
+        "mean_ms": float(samples.mean()),
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p95_ms": float(np.percentile(samples, 95)),
+        "p99_ms": float(np.percentile(samples, 99))
+    }
+
+
+def load_workload(seed: int) -> Dict[str, Any]:
+    """從數據集與 chunk 文件建立查詢、上下文與過濾條件"""
+    import pandas as pd
+    from source_code.chunk_store import open_chunk_store
+    from source_code.config import PROCESSED_DATASET
+
+    df = pd.read_csv(PROCESSED_DATASET)
+
+    # 以 context 類型的 chunk 拼出接近真實長度的上下文
+    context_texts = list(open_chunk_store().iter_texts(chunk_type="context"))
+    rng = random.Random(seed)
+    contexts = []
+    for _ in range(len(df)):
+        parts, length = [], 0
+        while length < CONTEXT_TARGET_CHARS:
+            text = rng.choice(context_texts)
+            parts.append(text)
+            length += len(text)
+        contexts.append("\n\n".join(parts))
+
+    return {
+        "dataset": df,
+        "queries": df["task_description"].tolist(),
+        "contexts": contexts,
+        "filters": df[["prompt_type", "complexity"]].to_dict("records")
+    }
+
+
+def write_replicated_dataset(df, scale: int, path: str):
+    """將數據集合成複製 scale 倍；每個副本加上變體標記，使向量彼此不同"""
+    import pandas as pd
+
+    copies = []
+    for replica in range(scale):
+        copy = df.copy()
+        if replica:
+            copy["good_prompt"] = copy["good_prompt"] + f"\n\n(variant {replica})"
+            copy["record_id"] = copy["record_id"] + replica * len(df)
+        copies.append(copy)
+    pd.concat(copies, ignore_index=True).to_csv(path, index=False)
+
+
+def _reset_collection():
+    """刪除進程內共用的 prompts collection，讓下一個系統重新 ingest"""
+    import chromadb
+
+    try:
+        chromadb.Client().delete_collection("prompts")
+    except Exception:
+        pass
+
+
+def _time_calls(calls) -> Dict[str, Any]:
+    """依序執行 (callable, items) 並量測延遲"""
+    latencies, items = [], 0
+    start = time.perf_counter()
+    for call, count in calls:
+        begin = time.perf_counter()
+        result = call()
+        latencies.append(time.perf_counter() - begin)
+        items += count
+        if isinstance(result, dict) and "error" in result:
+            raise RuntimeError(result["error"])
+    return summarize(latencies, items, time.perf_counter() - start)
+
+
+def bench_scale(workload: Dict[str, Any], scale: int, n_queries: int, dimensions: int, seed: int) -> Dict[str, Any]:
+    """在單一語料規模下執行全部基準"""
+    from source_code.prompt_rag_system import PromptGeneratorRAGSystem
+
+    rng = random.Random(seed)
+    sample = rng.sample(range(len(workload["queries"])), min(n_queries, len(workload["queries"])))
+    queries = [workload["queries"][i] for i in sample]
+    contexts = [workload["contexts"][i] for i in sample]
+    filters = [workload["filters"][i] for i in sample]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dataset_path = os.path.join(tmp, f"dataset_{scale}x.csv")
+        write_replicated_dataset(workload["dataset"], scale, dataset_path)
+
+        _reset_collection()
+        timer = _CallTimer(HashingEmbeddingFunction(dimensions))
+        start = time.perf_counter()
+        # 複製語料的各副本只差變體標記，關閉近似重複合併以保持語料規模
+        rag_system = PromptGeneratorRAGSystem(embedding_function=timer, dataset_path=dataset_path, deduplicate=False)
+        end = time.perf_counter()
+
+    documents = rag_system.collection.count()
+    if documents == 0:
+        raise RuntimeError("數據集 ingest 失敗")
+    boundaries = timer.starts + [end]
+    batch_latencies = [boundaries[i + 1] - boundaries[i] for i in range(len(timer.starts))]
+    report = {"documents": documents, "ingest": summarize(batch_latencies, documents, end - start)}
+
+    # 每個查詢文本都不同，避免 embedding 快取影響結果；每項前先清空快取
+    rag_system._embedding_cache.clear()
+    report["no_context_query"] = _time_calls(
+        (lambda q=q: rag_system.query(q), 1) for q in queries
+    )
+    rag_system._embedding_cache.clear()
+    report["context_query"] = _time_calls(
+        (lambda q=q, c=c: rag_system.query(q, c), 1) for q, c in zip(queries, contexts)
+    )
+    rag_system._embedding_cache.clear()
+    report["filtered_query"] = _time_calls(
+        (lambda q=q, f=f: rag_system.apply_user_filter(q, f), 1) for q, f in zip(queries, filters)
+    )
+    rag_system._embedding_cache.clear()
+    batches = [queries[i:i + BATCH_SIZE] for i in range(0, len(queries), BATCH_SIZE)]
+    report["batch_query"] = _time_calls(
+        (lambda b=b: rag_system.batch_query([{"query": q} for q in b]), len(b)) for b in batches
+    )
+
+    _reset_collection()
+    return report
+
+
+def compare_reports(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """比較兩份報告，返回超過門檻的退化項目"""
+    regressions = []
+    for scale, operations in current["results"].items():
+        base_operations = baseline.get("results", {}).get(scale)
+        if not base_operations:
+            continue
+        for operation, metrics in operations.items():
+            base_metrics = base_operations.get(operation)
+            if not isinstance(metrics, dict) or not isinstance(base_metrics, dict):
+                continue
+            for metric, higher_is_better in COMPARED_METRICS:
+                old, new = base_metrics.get(metric), metrics.get(metric)
+                if not old or new is None:
+                    continue
+                change = (new - old) / old
+                if (higher_is_better and change < -threshold) or (not higher_is_better and change > threshold):
+                    regressions.append({
+                        "scale": scale,
+                        "operation": operation,
+                        "metric": metric,
+                        "baseline": old,
+                        "current": new,
+                        "change": change
+                    })
+    return regressions
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"{'規模':<6}{'項目':<18}{'吞吐量/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for scale, operations in report["results"].items():
+        for operation, metrics in operations.items():
+            if not isinstance(metrics, dict):
+                continue
+            print(
+                f"{scale:<6}{operation:<18}{metrics['throughput_per_s']:>12.1f}"
+                f"{metrics['p50_ms']:>10.2f}{metrics['p95_ms']:>10.2f}{metrics['p99_ms']:>10.2f}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="離線基準測試套件")
+    parser.add_argument("--scales", default="1,10,100", help="語料合成複製倍數，逗號分隔")
+    parser.add_argument("--queries", type=int, default=200, help="每項查詢基準的查詢數")
+    parser.add_argument("--dimensions", type=int, default=1536, help="embedding 替身的向量維度")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="將結果寫入 JSON 基準文件")
+    parser.add_argument("--compare", help="與指定的 JSON 基準比較")
+    parser.add_argument("--threshold", type=float, default=0.15, help="判定退化的相對變化門檻")
+    args = parser.parse_args()
+
+    scales = [int(s) for s in args.scales.split(",") if s.strip()]
+    workload = load_workload(args.seed)
+
+    report = {
+        "meta": {
+            "created_at": datetime.now().isoformat(),
+            "commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "queries": args.queries,
+            "dimensions": args.dimensions,
+            "batch_size": BATCH_SIZE,
+            "seed": args.seed
+        },
+        "results": {}
+    }
+    for scale in scales:
+        print(f"執行 {scale}x 規模基準...", file=sys.stderr)
+        report["results"][f"{scale}x"] = bench_scale(workload, scale, args.queries, args.dimensions, args.seed)
+
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_reports(report, baseline, args.threshold)
+        if regressions:
+            print(f"\n⚠️ 發現 {len(regressions)} 項退化 (門檻 {args.threshold:.0%})：")
+            for item in regressions:
+                print(
+                    f"  {item['scale']} {item['operation']} {item['metric']}: "
+                    f"{item['baseline']:.2f} → {item['current']:.2f} ({item['change']:+.1%})"
+                )
+            sys.exit(1)
+        print(f"\n✅ 與基準相比無退化 (門檻 {args.threshold:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+列式 chunk 存儲
+
+processed_chunks.json 是單一 JSON 陣列，取任何一個 chunk 都要解析整個文件，
+載入後每個 chunk 的 metadata 字典也佔用大量記憶體。這裡改用單一二進位文件：
+
+    magic (8 bytes) | header 長度 (uint64) | header (JSON) | 64 位元組對齊的資料區段
+
+- text_offsets / text: int64 offsets 表與 UTF-8 文本 blob
+- meta_<key>: 每個 metadata 欄位以字典編碼 (int16/int32，-1 表示缺值)，詞彙表存於 header
+- record_offsets / record_chunks: 按 source_record_id 分組的 chunk 索引 (CSR)，支援 O(1) 按記錄查詢
+
+整個文件以 mmap 開啟，只有實際讀到的頁面才會載入記憶體。
+
+用法：
+    python -m source_code.chunk_store --input processed_chunks.json --output processed_chunks.bin
+"""
+
+import argparse
+import json
+import os
+import struct
+from typing import Any, Dict, Iterator, List, Optional
+
+from source_code.config import CHUNK_STORE, PROCESSED_CHUNKS
+
+MAGIC = b"PRCHUNK1"
+ALIGNMENT = 64
+RECORD_KEY = "source_record_id"
+
+_MISSING = object()
+
+
+def _align(position: int) -> int:
+    return (position + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_chunk_store(chunks: List[Dict[str, Any]], path: str) -> Dict[str, Any]:
+    """將 chunk 列表 (與 processed_chunks.json 相同結構) 寫成列式文件
+
+    Returns:
+        文件 header
+    """
+    import numpy as np
+
+    count = len(chunks)
+    sections = {}
+
+    encoded = [chunk["text"].encode("utf-8") for chunk in chunks]
+    text_offsets = np.zeros(count + 1, dtype=np.int64)
+    text_offsets[1:] = np.cumsum([len(item) for item in encoded])
+    sections["text_offsets"] = text_offsets
+    sections["text"] = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+    # metadata 欄位按首次出現順序，詞彙表以 JSON 字串去重 (保留 bool / int / str 型別)
+    vocabularies = {}
+    for chunk in chunks:
+        for key, value in chunk["metadata"].items():
+            vocabulary = vocabularies.setdefault(key, {})
+            vocabulary.setdefault(json.dumps(value, ensure_ascii=False), len(vocabulary))
+
+    columns = {}
+    for key, vocabulary in vocabularies.items():
+        dtype = np.int16 if len(vocabulary) < np.iinfo(np.int16).max else np.int32
+        codes = np.full(count, -1, dtype=dtype)
+        for row, chunk in enumerate(chunks):
+            value = chunk["metadata"].get(key, _MISSING)
+            if value is not _MISSING:
+                codes[row] = vocabulary[json.dumps(value, ensure_ascii=False)]
+        sections[f"meta_{key}"] = codes
+        columns[key] = [json.loads(value) for value in vocabulary]
+
+    # 按 source_record_id 分組的 chunk 索引
+    if RECORD_KEY in vocabularies:
+        record_codes = sections[f"meta_{RECORD_KEY}"]
+        order = np.argsort(record_codes, kind="stable")
+        valid = order[record_codes[order] >= 0]
+        counts = np.bincount(record_codes[valid], minlength=len(vocabularies[RECORD_KEY]))
+        record_offsets = np.zeros(len(counts) + 1, dtype=np.int32)
+        record_offsets[1:] = np.cumsum(counts)
+        sections["record_offsets"] = record_offsets
+        sections["record_chunks"] = valid.astype(np.int32)
+
+    # 先計算各區段位置，header 長度以上限預留後回填
+    layout = {name: {"dtype": array.dtype.str, "length": int(array.size)} for name, array in sections.items()}
+    header = {"version": 1, "count": count, "columns": columns, "sections": layout}
+    for name in layout:
+        layout[name]["offset"] = 0
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    position = _align(len(MAGIC) + 8 + len(header_bytes) + 32 * len(layout))
+    for name, array in sections.items():
+        layout[name]["offset"] = position
+        position = _align(position + array.nbytes)
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    if len(MAGIC) + 8 + len(header_bytes) > min(spec["offset"] for spec in layout.values()):
+        raise ValueError("chunk 存儲 header 超出預留空間")
+
+    staging = f"{path}.tmp-{os.getpid()}"
+    with open(staging, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        for name, array in sections.items():
+            f.write(b"\0" * (layout[name]["offset"] - f.tell()))
+            f.write(array.tobytes())
+    os.replace(staging, path)
+    return header
+
+
+class ChunkStore:
+    """以 mmap 開啟的列式 chunk 文件
+
+    支援 len()、按索引取 chunk (與 JSON 相同的 {"text", "metadata"} 結構)、
+    按 source_record_id 查詢與串流迭代。
+    """
+
+    def __init__(self, path: str):
+        import numpy as np
+
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"不是 chunk 存儲文件：{path}")
+            (header_length,) = struct.unpack("<Q", f.read(8))
+            self.header = json.loads(f.read(header_length))
+
+        self._data = np.memmap(path, dtype=np.uint8, mode="r")
+        self._sections = {
+            name: np.frombuffer(self._data, dtype=np.dtype(spec["dtype"]), count=spec["length"], offset=spec["offset"])
+            for name, spec in self.header["sections"].items()
+        }
+        self.count = self.header["count"]
+        self.columns = self.header["columns"]
+        self._text_offsets = self._sections["text_offsets"]
+        self._text = self._sections["text"]
+        self._codes = {key: self._sections[f"meta_{key}"] for key in self.columns}
+        self._record_codes = None
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index: int) -> Dict[str, Any]:
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return {"text": self.text(index), "metadata": self.metadata(index)}
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return self.iter_chunks()
+
+    def text(self, index: int) -> str:
+        return self._text[self._text_offsets[index]:self._text_offsets[index + 1]].tobytes().decode("utf-8")
+
+    def metadata(self, index: int) -> Dict[str, Any]:
+        metadata = {}
+        for key, codes in self._codes.items():
+            code = codes[index]
+            if code >= 0:
+                metadata[key] = self.columns[key][code]
+        return metadata
+
+    def value(self, index: int, key: str) -> Any:
+        """單一 metadata 欄位的值，缺值時返回 None"""
+        codes = self._codes.get(key)
+        if codes is None or codes[index] < 0:
+            return None
+        return self.columns[key][codes[index]]
+
+    def select(self, **conditions) -> List[int]:
+        """按 metadata 等值條件篩選 chunk 索引 (向量化比較編碼)，例如 select(chunk_type="context")"""
+        import numpy as np
+
+        mask = np.ones(self.count, dtype=bool)
+        for key, value in conditions.items():
+            values = self.columns.get(key, [])
+            if value not in values:
+                return []
+            mask &= self._codes[key] == values.index(value)
+        return np.flatnonzero(mask).tolist()
+
+    def record_indices(self, record_id: str) -> List[int]:
+        """指定 source_record_id 的所有 chunk 索引 (按原始順序)"""
+        if "record_offsets" not in self._sections:
+            return []
+        if self._record_codes is None:
+            self._record_codes = {value: code for code, value in enumerate(self.columns[RECORD_KEY])}
+        code = self._record_codes.get(record_id)
+        if code is None:
+            return []
+        offsets = self._sections["record_offsets"]
+        return self._sections["record_chunks"][offsets[code]:offsets[code + 1]].tolist()
+
+    def by_record(self, record_id: str) -> List[Dict[str, Any]]:
+        return [self[index] for index in self.record_indices(record_id)]
+
+    def iter_chunks(self, indices: Optional[List[int]] = None) -> Iterator[Dict[str, Any]]:
+        """串流迭代 chunk，不一次展開全部"""
+        for index in (range(self.count) if indices is None else indices):
+            yield self[index]
+
+    def iter_texts(self, **conditions) -> Iterator[str]:
+        """串流迭代符合條件的 chunk 文本"""
+        indices = self.select(**conditions) if conditions else range(self.count)
+        for index in indices:
+            yield self.text(index)
+
+
+def open_chunk_store(path: Optional[str] = None, source: Optional[str] = None) -> ChunkStore:
+    """開啟 chunk 存儲；文件不存在或比 JSON 來源舊時先從 JSON 重建
+
+    Args:
+        path: 列式文件路徑，預設 CHUNK_STORE
+        source: JSON 來源路徑，預設 PROCESSED_CHUNKS
+    """
+    path = str(path or CHUNK_STORE)
+    source = str(source or PROCESSED_CHUNKS)
+    stale = not os.path.exists(path) or (
+        os.path.exists(source) and os.path.getmtime(source) > os.path.getmtime(path)
+    )
+    if stale:
+        with open(source, "r", encoding="utf-8") as f:
+            write_chunk_store(json.load(f), path)
+    return ChunkStore(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="將 processed_chunks.json 轉換為列式 chunk 存儲")
+    parser.add_argument("--input", default=str(PROCESSED_CHUNKS))
+    parser.add_argument("--output", default=str(CHUNK_STORE))
+    args = parser.parse_args()
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        chunks = json.load(f)
+    header = write_chunk_store(chunks, args.output)
+    print(
+        f"已寫入 {header['count']} 個 chunk 到 {args.output} "
+        f"({os.path.getsize(args.output) / 2 ** 20:.2f} MB，原始 {os.path.getsize(args.input) / 2 ** 20:.2f} MB)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+Prompt RAG 命令列工具
+
+非互動的批量入口，可用於腳本與管線：
+
+- ingest: 確認 (必要時重建) 向量快照
+- export: 將向量快照 (含向量、文檔、metadata、embedding 模型與校驗和) 複製為可攜備份
+- import: 校驗備份後安裝為本機快照，新節點不必重新 embedding
+- query:  從 JSONL 文件或 stdin 串流讀取查詢，結果以 JSONL 按輸入順序寫出
+- filter: 同 query，但每條查詢都以過濾搜索處理 (命令列的過濾條件作為預設值)
+
+輸入每行一個 JSON 物件 {"id": any?, "query": str, "context": str?, "filters": {...}?}，
+也接受純 JSON 字串作為 query；輸出每行 {"line": int, "id": any?, "result": {...}}，
+無法解析的行輸出 {"line": int, "error": str}。
+
+查詢逐批讀取 (每批合併為一次 embedding 呼叫)，最多 --workers 個批次同時處理，
+寫出端按輸入順序等待最早的批次，因此記憶體只與 workers × batch_size 有關，與輸入大小無關。
+進度與吞吐量輸出到 stderr；引擎的日誌也轉到 stderr，stdout 只有結果。
+
+用法：
+    python -m source_code.cli ingest --rebuild
+    python -m source_code.cli export --to /backups/prompts-2025-06
+    python -m source_code.cli import /backups/prompts-2025-06
+    python -m source_code.cli query -i queries.jsonl -o results.jsonl
+    cat queries.jsonl | python -m source_code.cli query --lazy > results.jsonl
+    python -m source_code.cli filter --prompt-type PROGRAMMING_CODE_GENERATION -i queries.jsonl
+"""
+
+import argparse
+import contextlib
+import itertools
+import json
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO
+
+from source_code.config import CLI_CONFIG, PROCESSED_DATASET, SERVER_CONFIG
+
+
+def read_requests(stream: Iterable[str], default_filters: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+    """逐行解析查詢 (惰性)；無效的行產生帶 error 的項目，在輸出中保留其位置
+
+    Args:
+        stream: 文本行來源
+        default_filters: 提供時每條查詢都走過濾搜索，行內的 filters 覆蓋同名條件
+    """
+    for number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield {"line": number, "error": f"JSON 解析失敗：{str(e)}"}
+            continue
+        if isinstance(item, str):
+            item = {"query": item}
+        if not isinstance(item, dict) or not isinstance(item.get("query"), str) or not item["query"].strip():
+            yield {"line": number, "error": "缺少 query"}
+            continue
+        if item.get("context") is not None and not isinstance(item["context"], str):
+            yield {"line": number, "error": "context 必須是字串"}
+            continue
+        if item.get("filters") is not None and not isinstance(item["filters"], dict):
+            yield {"line": number, "error": "filters 必須是物件"}
+            continue
+        if default_filters is not None:
+            item["filters"] = {**default_filters, **(item.get("filters") or {})}
+        item["line"] = number
+        yield item
+
+
+def process_batch(engine, batch: List[Dict[str, Any]], lazy: bool = False) -> List[Optional[Dict[str, Any]]]:
+    """以一次 batch_query 處理一批查詢，返回與 batch 對齊的結果 (無效行為 None)
+
+    整批失敗時逐條重試，單一有問題的查詢不會拖累同批的其他查詢。
+    """
+    valid = [
+        {key: item[key] for key in ("query", "context", "filters") if key in item}
+        for item in batch if "error" not in item
+    ]
+    try:
+        results = iter(engine.batch_query(valid, lazy=lazy))
+    except Exception:
+        results = iter(_process_each(engine, valid, lazy))
+    return [None if "error" in item else next(results) for item in batch]
+
+
+def _process_each(engine, queries: List[Dict[str, Any]], lazy: bool) -> List[Dict[str, Any]]:
+    results = []
+    for query in queries:
+        try:
+            results.append(engine.batch_query([query], lazy=lazy)[0])
+        except Exception as e:
+            results.append({"error": str(e)})
+    return results
+
+
+def _record(item: Dict[str, Any], result: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    record = {"line": item["line"]}
+    if "id" in item:
+        record["id"] = item["id"]
+    if "error" in item:
+        record["error"] = item["error"]
+    else:
+        record["result"] = result
+    return record
+
+
+def stream_results(
+    engine,
+    requests: Iterator[Dict[str, Any]],
+    output: TextIO,
+    batch_size: Optional[int] = None,
+    workers: Optional[int] = None,
+    lazy: bool = False,
+    progress_interval: Optional[float] = None
+) -> Dict[str, Any]:
+    """有界並行處理查詢串流，並按輸入順序寫出 JSONL
+
+    Returns:
+        統計 {"processed", "errors", "seconds", "throughput"}
+    """
+    batch_size = max(1, batch_size or CLI_CONFIG["batch_size"])
+    workers = max(1, workers or CLI_CONFIG["workers"])
+    progress_interval = CLI_CONFIG["progress_interval"] if progress_interval is None else progress_interval
+    stats = {"processed": 0, "errors": 0}
+    started = last_report = time.monotonic()
+
+    def write_oldest():
+        batch, future = pending.popleft()
+        for item, result in zip(batch, future.result()):
+            record = _record(item, result)
+            if "error" in record or "error" in (result or {}):
+                stats["errors"] += 1
+            output.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        output.flush()
+        stats["processed"] += len(batch)
+
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cli-batch") as executor:
+        # 每次只從輸入取一批；處理中的批次達到上限時先寫出最早的一批
+        for batch in iter(lambda: list(itertools.islice(requests, batch_size)), []):
+            pending.append((batch, executor.submit(process_batch, engine, batch, lazy)))
+            while len(pending) >= workers:
+                write_oldest()
+            now = time.monotonic()
+            if progress_interval and now - last_report >= progress_interval:
+                last_report = now
+                print(
+                    f"已處理 {stats['processed']} 條 (錯誤 {stats['errors']})，"
+                    f"{stats['processed'] / (now - started):.1f} 條/秒",
+                    file=sys.stderr
+                )
+        while pending:
+            write_oldest()
+
+    stats["seconds"] = round(time.monotonic() - started, 3)
+    stats["throughput"] = round(stats["processed"] / stats["seconds"], 1) if stats["seconds"] else 0.0
+    return stats
+
+
+def load_engine(snapshot_dir: str, dataset_path: str, rebuild: bool = False):
+    """確認向量快照後以唯讀快照建立引擎 (與 HTTP 服務的 worker 相同，快照有效時不重新 ingest)"""
+    from source_code.prompt_rag_system import PromptGeneratorRAGSystem
+    from source_code.server import ensure_snapshot
+    from source_code.vector_snapshot import SnapshotCollection
+
+    ensure_snapshot(snapshot_dir, dataset_path, rebuild=rebuild)
+    collection = SnapshotCollection(snapshot_dir)
+    collection.warm()
+    return PromptGeneratorRAGSystem(dataset_path=dataset_path, collection=collection)
+
+
+def _copy_snapshot(args: argparse.Namespace) -> int:
+    """export / import：校驗後原子複製快照目錄"""
+    from source_code.vector_snapshot import copy_snapshot
+
+    if args.command == "export":
+        from source_code.server import ensure_snapshot
+        ensure_snapshot(args.snapshot_dir, args.dataset, rebuild=args.rebuild)
+        source, target = args.snapshot_dir, args.to
+    else:
+        from source_code.vector_snapshot import embedding_model_name, read_manifest
+        source, target = args.backup, args.snapshot_dir
+        manifest, expected_model = read_manifest(source), embedding_model_name()
+        if manifest is not None and manifest.get("embedding_model") != expected_model:
+            print(f"❌ 備份的 embedding 模型為 {manifest.get('embedding_model')}，本機查詢將使用 {expected_model}")
+            return 1
+    try:
+        manifest = copy_snapshot(source, target)
+    except (OSError, ValueError) as e:
+        print(f"❌ {str(e)}")
+        return 1
+    print(f"✅ 已複製向量快照到 {target}：{manifest['count']} 條，{manifest['dimensions']} 維，"
+          f"embedding 模型 {manifest['embedding_model']}，{len(manifest['checksums'])} 個文件已校驗")
+    return 0
+
+
+def _add_common_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--snapshot-dir", default=SERVER_CONFIG["snapshot_dir"])
+    parser.add_argument("--dataset", default=str(PROCESSED_DATASET))
+    parser.add_argument("--rebuild", action="store_true", help="強制重建向量快照")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Prompt RAG 命令列工具")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest = commands.add_parser("ingest", help="ingest 數據集並匯出向量快照")
+    _add_common_arguments(ingest)
+
+    export = commands.add_parser("export", help="匯出可攜向量快照")
+    _add_common_arguments(export)
+    export.add_argument("--to", required=True, help="備份目錄")
+
+    restore = commands.add_parser("import", help="校驗並匯入向量快照備份")
+    restore.add_argument("backup", help="備份目錄")
+    restore.add_argument("--snapshot-dir", default=SERVER_CONFIG["snapshot_dir"])
+
+    for name, help_text in (("query", "串流處理 JSONL 查詢"), ("filter", "串流處理 JSONL 過濾搜索")):
+        command = commands.add_parser(name, help=help_text)
+        _add_common_arguments(command)
+        command.add_argument("-i", "--input", default="-", help="輸入 JSONL 文件 (- 為 stdin)")
+        command.add_argument("-o", "--output", default="-", help="輸出 JSONL 文件 (- 為 stdout)")
+        command.add_argument("--batch-size", type=int, default=CLI_CONFIG["batch_size"])
+        command.add_argument("--workers", type=int, default=CLI_CONFIG["workers"])
+        command.add_argument("--lazy", action="store_true", help="結果不附全文")
+        if name == "filter":
+            command.add_argument("--prompt-type", help="prompt_type 欄位值 (非介面標籤)，例如 PROGRAMMING_CODE_GENERATION")
+            command.add_argument("--complexity", help="low / medium / high")
+    args = parser.parse_args(argv)
+
+    output = sys.stdout
+    # 引擎與快照建立的日誌轉到 stderr，stdout 只保留 JSONL 結果
+    with contextlib.redirect_stdout(sys.stderr):
+        if args.command == "ingest":
+            from source_code.server import ensure_snapshot
+            ensure_snapshot(args.snapshot_dir, args.dataset, rebuild=args.rebuild)
+            return 0
+        if args.command in ("export", "import"):
+            return _copy_snapshot(args)
+
+        engine = load_engine(args.snapshot_dir, args.dataset, args.rebuild)
+        default_filters = None
+        if args.command == "filter":
+            default_filters = {
+                key: value for key, value in (("prompt_type", args.prompt_type), ("complexity", args.complexity)) if value
+            }
+
+        with contextlib.ExitStack() as stack:
+            source = sys.stdin if args.input == "-" else stack.enter_context(open(args.input, encoding="utf-8"))
+            if args.output != "-":
+                output = stack.enter_context(open(args.output, "w", encoding="utf-8"))
+            stats = stream_results(
+                engine, read_requests(source, default_filters), output,
+                batch_size=args.batch_size, workers=args.workers, lazy=args.lazy
+            )
+        print(
+            f"完成：{stats['processed']} 條 (錯誤 {stats['errors']})，"
+            f"{stats['seconds']:.1f}s，{stats['throughput']:.1f} 條/秒"
+        )
+    return 1 if stats["errors"] and stats["errors"] == stats["processed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
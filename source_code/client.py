@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Prompt RAG HTTP 服務的輕量客戶端
+
+介面與 PromptGeneratorRAGSystem 的 query / apply_user_filter / batch_query / get_documents / get_aliases 相同，
+Streamlit 介面可直接替換使用：UI 重跑留在 Streamlit 進程，檢索運算交給服務的 worker。
+"""
+
+import json
+import urllib.error
+import urllib.request
+from typing import Any, Dict, List, Optional
+
+from source_code.config import SERVER_CONFIG
+
+
+class RemoteRAGSystem:
+    """透過 HTTP 呼叫 source_code.server 的 RAG 系統"""
+
+    def __init__(self, base_url: Optional[str] = None, timeout: Optional[float] = None):
+        self.base_url = (base_url or SERVER_CONFIG["server_url"] or "").rstrip("/")
+        if not self.base_url:
+            raise ValueError("未設置 RAG 服務位址 (PROMPT_RAG_SERVER_URL)")
+        self.timeout = timeout or SERVER_CONFIG["request_timeout"]
+
+    def _request(self, path: str, payload: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8") if payload is not None else None
+        request = urllib.request.Request(
+            self.base_url + path,
+            data=data,
+            headers={"Content-Type": "application/json"},
+            method="POST" if data is not None else "GET"
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            try:
+                return json.loads(e.read())
+            except ValueError:
+                return {"error": f"HTTP {e.code}"}
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            return {"error": f"RAG 服務連線失敗：{str(e)}"}
+
+    def is_ready(self) -> bool:
+        """服務的索引是否已就緒"""
+        return self._request("/readyz").get("status") == "ready"
+
+    def warmup_status(self) -> Optional[Dict[str, Any]]:
+        """服務背景預熱的進度 (回應請求的那個 worker)"""
+        return self._request("/readyz").get("warmup")
+
+    def query(
+        self,
+        user_query: str,
+        context: Optional[str] = None,
+        profile: bool = False,
+        lazy: bool = False,
+        bundles: bool = False,
+        diversify: Optional[bool] = None
+    ) -> Dict[str, Any]:
+        return self._request("/query", {
+            "query": user_query, "context": context, "profile": profile, "lazy": lazy, "bundles": bundles,
+            "diversify": diversify
+        })
+
+    def apply_user_filter(
+        self,
+        query: str,
+        filters: Dict[str, Any],
+        lazy: bool = False,
+        page_size: Optional[int] = None,
+        cursor: Optional[str] = None,
+        bundles: bool = False
+    ) -> Dict[str, Any]:
+        # 游標只保存在建立它的 worker；請求落到其他 worker 時，服務以同一查詢與過濾條件重建候選
+        result = self._request("/filter", {
+            "query": query, "filters": filters, "lazy": lazy, "page_size": page_size, "cursor": cursor,
+            "bundles": bundles
+        })
+        if "error" in result:
+            result.setdefault("total_found", 0)
+            result.setdefault("results", [])
+        return result
+
+    def batch_query(self, queries: List[Dict[str, Any]], lazy: bool = False) -> List[Dict[str, Any]]:
+        result = self._request("/batch", {"queries": queries, "lazy": lazy})
+        if "results" in result:
+            return result["results"]
+        return [{"error": result.get("error", "批量查詢失敗")} for _ in queries]
+
+    def get_documents(self, ids: List[str]) -> Dict[str, str]:
+        """按文檔 id 取回全文；服務錯誤時返回空字典 (介面顯示為無法載入)"""
+        if not ids:
+            return {}
+        return self._request("/documents", {"ids": list(ids)}).get("documents", {})
+
+    def get_aliases(self, ids: List[str], with_text: bool = True) -> Dict[str, List[Dict[str, Any]]]:
+        """展開近似重複別名 (服務端總是附上全文)；服務錯誤時返回空字典"""
+        if not ids:
+            return {}
+        return self._request("/aliases", {"ids": list(ids)}).get("aliases", {})
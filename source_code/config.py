@@ -47,6 +47,16 @@ CHROMA_SETTINGS = {
 # 數據集文件
 ORIGINAL_DATASET = DATASET_DIR / "original_dataset.csv"
 PROCESSED_DATASET = DATASET_DIR / "processed_dataset.csv"
+PROCESSED_CHUNKS = BASE_DIR / "processed_chunks.json"
+CHUNK_STORE = BASE_DIR / "processed_chunks.bin"     # processed_chunks.json 的列式 mmap 版本，按需自動生成
+RECORD_INDEX = BASE_DIR / "record_index.json"       # record_id → 各 collection 的有序 chunk ID，ingest 時生成
+
+# 數據集快照：以 CSV 內容雜湊為鍵的列式快取 (預設位於 CSV 同目錄的 .cache/)，CSV 變更時自動重建
+DATASET_CACHE_CONFIG = {
+    "cache_dir": os.environ.get("PROMPT_RAG_DATASET_CACHE"),   # 未設置時使用 <CSV 目錄>/.cache
+    "categorical_columns": ["prompt_type", "complexity", "prompting_techniques"],
+    "keep_snapshots": 2                                        # 每個 CSV 保留的快照版本數
+}
 
 # 系統配置
 SYSTEM_CONFIG = {
@@ -57,10 +67,173 @@ SYSTEM_CONFIG = {
     "chunk_overlap": 200
 }
 
+# 有上下文查詢配置：長上下文切分後批量 embedding，並以加權 max-sim 聚合排序
+CONTEXT_QUERY_CONFIG = {
+    "chunk_max_chars": 1000,         # 每個上下文片段的最大字符數
+    "max_chunks": 8,                 # 上下文片段數上限，超過時均勻取樣
+    "candidates_per_vector": 10,     # 每個查詢向量召回的候選數
+    "top_k": 3,                      # 最終返回的來源 prompt 數
+    "query_weight": 0.4,             # 查詢向量相似度的權重，其餘分給上下文 max-sim
+    "embedding_cache_size": 1024,    # embedding LRU 快取條目數
+    "document_cache_size": 256       # get_documents 全文 LRU 快取條目數 (lazy 模式按需載入)
+}
+
+# 無上下文查詢的結果多樣化 (MMR)：多取 over_fetch 倍候選並連同向量返回，挑選兼顧相關度與差異的結果
+# (PROMPT_RAG_MMR=1 啟用；也可在 query(..., diversify=True) 單次指定)
+MMR_CONFIG = {
+    "enabled": os.environ.get("PROMPT_RAG_MMR", "").lower() in ("1", "true", "yes"),
+    "lambda": float(os.environ.get("PROMPT_RAG_MMR_LAMBDA", "0.7")),      # 相關度權重 (1 為不做多樣化)
+    "over_fetch": int(os.environ.get("PROMPT_RAG_MMR_OVER_FETCH", "4"))   # 候選數為返回數的倍數
+}
+
+# 第二階段重排：對第一階段的前 top_n 個候選批量重排 (none / features / cross-encoder)，
+# 每個請求限時 budget_ms，超出時保持第一階段順序
+RERANK_CONFIG = {
+    "reranker": os.environ.get("PROMPT_RAG_RERANKER", "none"),
+    "model": os.environ.get("PROMPT_RAG_RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2"),
+    "top_n": int(os.environ.get("PROMPT_RAG_RERANK_TOP_N", "30")),
+    "budget_ms": float(os.environ.get("PROMPT_RAG_RERANK_BUDGET_MS", "20")),
+    "weights": {                # FeatureReranker 的特徵權重
+        "similarity": 1.0,
+        "overlap": 0.3,
+        "technique": 0.15,
+        "complexity": 0.1
+    }
+}
+
+# 近似重複合併：ingest 時以 MinHash 將相同 prompt_type / complexity 內的近似重複 prompt 分群，
+# 只 embedding 與索引每群的代表，別名記錄在代表的 metadata (PROMPT_RAG_DEDUP=0 關閉)
+DEDUP_CONFIG = {
+    "enabled": os.environ.get("PROMPT_RAG_DEDUP", "1").lower() not in ("0", "false", "no"),
+    "threshold": float(os.environ.get("PROMPT_RAG_DEDUP_THRESHOLD", "0.9")),  # 估計 Jaccard 相似度門檻
+    "shingle_size": 5,               # 字元 shingle 長度
+    "num_perm": 64,                  # MinHash 排列數
+    "bands": 16                      # LSH 分帶數 (每帶 num_perm / bands 列)
+}
+
+# 降維檢索：匯出向量快照時擬合 PCA，第一階段在投影向量上搜索，前 rerank_depth 個候選以原始向量重排
+# (PROMPT_RAG_PROJECTION_DIM=0 關閉，例如 128 / 256)
+PROJECTION_CONFIG = {
+    "dimensions": int(os.environ.get("PROMPT_RAG_PROJECTION_DIM", "0")),
+    "rerank_depth": int(os.environ.get("PROMPT_RAG_PROJECTION_RERANK", "100"))
+}
+
+# 壓縮文檔存儲：prompt 全文與期望輸出以語料訓練的共用字典壓縮，命中時逐份解壓，
+# Chroma 與向量快照只保存 ID、向量與 metadata (PROMPT_RAG_DOC_STORE=0 關閉)
+DOC_STORE_CONFIG = {
+    "enabled": os.environ.get("PROMPT_RAG_DOC_STORE", "1").lower() not in ("0", "false", "no"),
+    "codec": os.environ.get("PROMPT_RAG_DOC_CODEC", "auto"),   # auto (有 zstandard 用 zstd，否則 zlib)、zstd、zlib
+    "dictionary_size": 32 * 1024,                               # 共用字典大小 (zlib 的上限即 32KB)
+    # 壓縮等級：引擎啟動時在進程內建立，zstd 6 的壓縮率接近 19 (2.75× vs 2.9×)，建立時間約 1/7
+    "level": int(os.environ.get("PROMPT_RAG_DOC_LEVEL", "6"))
+}
+
+# 啟動預熱：引擎載入後在背景以熱門查詢、USER_FRIENDLY_FILTERS 組合與數據集的 task_description
+# 預先 embedding 並執行檢索，不阻塞就緒 (PROMPT_RAG_WARMUP=0 關閉)
+WARMUP_CONFIG = {
+    "enabled": os.environ.get("PROMPT_RAG_WARMUP", "1").lower() not in ("0", "false", "no"),
+    # 每行一條查詢 (或 {"query", "context"?, "filters"?} JSON)，文件不存在時略過
+    "popular_queries": os.environ.get("PROMPT_RAG_POPULAR_QUERIES", str(DATASET_DIR / "popular_queries.txt")),
+    "max_queries": int(os.environ.get("PROMPT_RAG_WARMUP_MAX", "512")),     # 保持在 embedding 快取容量以內
+    "rate": float(os.environ.get("PROMPT_RAG_WARMUP_RATE", "20")),          # 每秒查詢數上限
+    "batch_size": 8                  # 每批合併為一次 embedding 呼叫
+}
+
+# 數據集熱重載：背景輪詢 processed_dataset.csv / processed_chunks.json，變更時建立新索引版本後原子切換
+# (PROMPT_RAG_HOT_RELOAD=0 關閉)
+HOT_RELOAD_CONFIG = {
+    "enabled": os.environ.get("PROMPT_RAG_HOT_RELOAD", "1").lower() not in ("0", "false", "no"),
+    "poll_interval": 2.0,            # 輪詢文件 size / mtime 的間隔 (秒)
+    "debounce": 1.0,                 # 文件需保持不變的時間 (秒)，避免讀到寫了一半的文件
+    "batch_size": 8,                 # 重建時每批寫入的筆數：collection.add 持有 GIL 約 1.5ms/筆，小批次限制查詢的等待時間
+    "batch_pause": 0.005             # 批次之間的暫停 (秒)
+}
+
+# 分片檢索：向量快照切分到多個常駐 worker 進程並行搜索 (PROMPT_RAG_SHARDS=0 或 1 關閉)
+SHARDING_CONFIG = {
+    "shards": int(os.environ.get("PROMPT_RAG_SHARDS", "0")),
+    "partition": os.environ.get("PROMPT_RAG_SHARD_BY", "hash")   # hash 或 prompt_type
+}
+
+# 過濾搜索分頁：首頁檢索一次取回排序候選並以游標保存，後續頁面直接切片
+PAGINATION_CONFIG = {
+    "page_size": 10,                 # 每頁結果數
+    "max_candidates": 200,           # 單次檢索保留的候選數上限 (可翻頁的總結果數)
+    "cursor_ttl": 600,               # 游標閒置過期時間 (秒)
+    "max_result_sets": 256,          # 同時保存的結果集數上限
+    "max_cached_candidates": 20000   # 所有結果集的候選總數上限 (記憶體上限)
+}
+
+# 可觀測性配置：exporter 為 none (預設，零開銷) / console / json / otlp
+TELEMETRY_CONFIG = {
+    "exporter": os.environ.get("PROMPT_RAG_TELEMETRY", "none"),
+    "json_path": os.environ.get("PROMPT_RAG_TELEMETRY_FILE"),  # json 模式輸出文件，未設置時寫到 stdout
+    "otlp_endpoint": os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4317"),
+    "service_name": "prompt-rag-system",
+    "metric_export_interval_ms": 10000
+}
+
+# 單次查詢 profiling：PROMPT_RAG_PROFILE=1 對每個請求啟用，或以取樣率抽樣；
+# 無論哪種方式都受每分鐘次數與文件數上限約束，可常駐於生產環境
+PROFILING_CONFIG = {
+    "enabled": os.environ.get("PROMPT_RAG_PROFILE", "").lower() in ("1", "true", "yes"),
+    "sample_rate": float(os.environ.get("PROMPT_RAG_PROFILE_SAMPLE_RATE", "0")),
+    "output_dir": os.environ.get("PROMPT_RAG_PROFILE_DIR", str(BASE_DIR / "profiles")),
+    "max_profiles_per_minute": 6,    # 每分鐘最多 profile 的請求數
+    "max_files": 50,                 # 輸出目錄最多保留的 profile 文件數，超過時刪除最舊的
+    "top_n": 15                      # 回應 debug 區塊中列出的函數數
+}
+
+# 共用 OpenAI 客戶端：keep-alive 連線池、並發上限、429/5xx 抖動指數退避與請求期限
+OPENAI_CLIENT_CONFIG = {
+    "base_url": os.environ.get("OPENAI_BASE_URL", "https://api.openai.com/v1"),
+    "max_connections": 8,            # 連線池保留的閒置連線數
+    "max_concurrency": int(os.environ.get("OPENAI_MAX_CONCURRENCY", "8")),  # 同時進行的請求數上限
+    "max_retries": 4,                # 429 / 5xx / 連線錯誤的重試次數
+    "backoff_base": 0.5,             # 退避基數 (秒)，第 n 次重試的上限為 base * 2^n
+    "backoff_max": 8.0,              # 單次退避上限 (秒)
+    "deadline": 60.0                 # 單一請求 (含排隊與重試) 的總期限 (秒)
+}
+
+# 離線重放：PROMPT_RAG_OFFLINE=1 時 embedding / chat 請求由進程內替身回答 (已錄製的回應優先，
+# 未見過的輸入合成確定性向量)；PROMPT_RAG_RECORD 指定文件時則經由真實 API 並錄製回應
+REPLAY_CONFIG = {
+    "offline": os.environ.get("PROMPT_RAG_OFFLINE", "").lower() in ("1", "true", "yes"),
+    "cassette_path": os.environ.get("PROMPT_RAG_CASSETTE"),         # 重放使用的錄製文件 (JSONL)
+    "record_path": os.environ.get("PROMPT_RAG_RECORD"),             # 錄製輸出文件 (JSONL)
+    "dimensions": 1536,                                             # 合成向量維度，與 text-embedding-ada-002 相同
+    "latency": os.environ.get("PROMPT_RAG_REPLAY_LATENCY", "none"), # 延遲分佈，例如 lognormal:3.9:0.5
+    "error_rate": float(os.environ.get("PROMPT_RAG_REPLAY_ERROR_RATE", "0")),  # 注入錯誤的比例
+    "error_status": 503,                                            # 注入錯誤的狀態碼
+    "offline_api_key": "sk-offline-replay-0000000000000000"
+}
+
+# HTTP 服務：多個 worker 進程共用同一份 mmap 唯讀向量快照；
+# 設置 PROMPT_RAG_SERVER_URL 時 Streamlit 介面改為呼叫該服務
+SERVER_CONFIG = {
+    "host": os.environ.get("PROMPT_RAG_SERVER_HOST", "127.0.0.1"),
+    "port": int(os.environ.get("PROMPT_RAG_SERVER_PORT", "8000")),
+    "workers": int(os.environ.get("PROMPT_RAG_SERVER_WORKERS", str(min(4, os.cpu_count() or 1)))),
+    "snapshot_dir": os.environ.get("PROMPT_RAG_SNAPSHOT_DIR", str(BASE_DIR / "index_snapshot")),
+    "server_url": os.environ.get("PROMPT_RAG_SERVER_URL"),
+    "request_timeout": 30,               # 客戶端請求逾時 (秒)
+    "max_body_bytes": 8 * 1024 * 1024    # 單一請求主體上限
+}
+
+# 命令列批量查詢 (python -m source_code.cli)：逐批讀取 JSONL，有界並行處理後按輸入順序寫出
+CLI_CONFIG = {
+    "batch_size": int(os.environ.get("PROMPT_RAG_CLI_BATCH", "32")),        # 每批查詢數 (一次 embedding 呼叫)
+    "workers": int(os.environ.get("PROMPT_RAG_CLI_WORKERS", "4")),          # 同時處理的批次數
+    "progress_interval": 5.0                                               # stderr 進度輸出間隔 (秒)
+}
+
 def get_openai_api_key():
     """獲取 OpenAI API Key"""
     # 優先從環境變量獲取
     api_key = os.environ.get("OPENAI_API_KEY")
+    if not api_key and REPLAY_CONFIG["offline"]:
+        # 離線模式不會呼叫真實 API，使用固定的佔位 key
+        api_key = REPLAY_CONFIG["offline_api_key"]
     if not api_key:
         # 如果環境變量中沒有，嘗試從 Streamlit secrets 獲取
         try:
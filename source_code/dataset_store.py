@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+數據集存取層
+
+processed_dataset.csv 含大量多行引號文本，每次 pd.read_csv 都要完整解析。
+這裡在首次讀取時建立以 CSV 內容雜湊 (sha256) 為鍵的列式快照：
+
+    <cache_dir>/<CSV 檔名>-<雜湊前 16 碼>/
+        manifest.json        來源路徑、雜湊、文件大小與 mtime、行數與欄位型別
+        <欄位>.pkl           每個欄位一個文件
+        documents.docs       引擎 ingest 時建立的壓縮文檔存儲 (見 doc_store.py)，下次啟動直接 mmap 開啟
+
+- prompt_type / complexity 等低基數欄位轉為 category，數值欄位向下轉型
+- 只讀取呼叫端要求的欄位，長文本欄位在被要求前不會載入
+- 已讀取的欄位保留在進程內，重複讀取為毫秒級
+- CSV 的大小或 mtime 改變時重新計算雜湊，內容不同即重建快照
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from typing import Any, Dict, List, Optional
+
+from source_code.config import DATASET_CACHE_CONFIG, PROCESSED_DATASET
+
+SNAPSHOT_VERSION = 1
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def _file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DatasetStore:
+    """單一 CSV 的快照存取"""
+
+    def __init__(self, csv_path: Optional[str] = None, cache_dir: Optional[str] = None):
+        self.csv_path = os.path.abspath(str(csv_path or PROCESSED_DATASET))
+        self.cache_dir = cache_dir or DATASET_CACHE_CONFIG["cache_dir"] or os.path.join(
+            os.path.dirname(self.csv_path), ".cache"
+        )
+        self._lock = threading.Lock()
+        self._stat = None
+        self._manifest = None
+        self._columns = {}
+
+    @property
+    def stem(self) -> str:
+        return os.path.splitext(os.path.basename(self.csv_path))[0]
+
+    def _snapshot_dir(self, sha256: str) -> str:
+        return os.path.join(self.cache_dir, f"{self.stem}-{sha256[:16]}")
+
+    def _current_manifest(self) -> Dict[str, Any]:
+        """確認快照與 CSV 一致並返回 manifest (呼叫端持鎖)"""
+        stat = os.stat(self.csv_path)
+        key = (stat.st_size, stat.st_mtime_ns)
+        if self._manifest is not None and self._stat == key:
+            return self._manifest
+
+        # 大小與 mtime 與現有快照相同時跳過雜湊計算
+        for manifest in self._existing_manifests():
+            if (manifest["size"], manifest["mtime_ns"]) == key:
+                return self._use(manifest, key)
+
+        sha256 = _file_hash(self.csv_path)
+        manifest = self._read_manifest(self._snapshot_dir(sha256))
+        if manifest is None:
+            manifest = self._build(sha256, stat)
+        elif (manifest["size"], manifest["mtime_ns"]) != key:
+            # 內容未變 (例如僅 touch)：更新記錄的 mtime，下次可直接命中
+            manifest.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+            self._write_manifest(self._snapshot_dir(sha256), manifest)
+        return self._use(manifest, key)
+
+    def _use(self, manifest: Dict[str, Any], key) -> Dict[str, Any]:
+        if self._manifest is None or self._manifest["sha256"] != manifest["sha256"]:
+            self._columns = {}
+        self._manifest = manifest
+        self._stat = key
+        return manifest
+
+    def _existing_manifests(self) -> List[Dict[str, Any]]:
+        if not os.path.isdir(self.cache_dir):
+            return []
+        manifests = []
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(f"{self.stem}-"):
+                manifest = self._read_manifest(os.path.join(self.cache_dir, name))
+                if manifest is not None and manifest["csv_path"] == self.csv_path:
+                    manifests.append(manifest)
+        return manifests
+
+    def _read_manifest(self, directory: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(os.path.join(directory, "manifest.json"), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            return manifest if manifest.get("version") == SNAPSHOT_VERSION else None
+        except (OSError, ValueError):
+            return None
+
+    def _write_manifest(self, directory: str, manifest: Dict[str, Any]):
+        path = os.path.join(directory, "manifest.json")
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(f"{path}.tmp", path)
+
+    def _build(self, sha256: str, stat) -> Dict[str, Any]:
+        """解析 CSV、轉換型別並寫出快照"""
+        import pandas as pd
+
+        print(f"建立數據集快照：{self.csv_path}")
+        df = pd.read_csv(self.csv_path)
+        for column in df.columns:
+            series = df[column]
+            if column in DATASET_CACHE_CONFIG["categorical_columns"]:
+                df[column] = series.astype("category")
+            elif pd.api.types.is_integer_dtype(series):
+                df[column] = pd.to_numeric(series, downcast="integer")
+            elif pd.api.types.is_float_dtype(series):
+                df[column] = pd.to_numeric(series, downcast="float")
+
+        directory = self._snapshot_dir(sha256)
+        staging = f"{directory}.tmp-{os.getpid()}"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        files = {}
+        for index, column in enumerate(df.columns):
+            files[column] = f"{index:03d}.pkl"
+            df[column].to_pickle(os.path.join(staging, files[column]))
+
+        manifest = {
+            "version": SNAPSHOT_VERSION,
+            "csv_path": self.csv_path,
+            "sha256": sha256,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "rows": len(df),
+            "columns": list(df.columns),
+            "dtypes": {column: str(dtype) for column, dtype in df.dtypes.items()},
+            "files": files
+        }
+        self._write_manifest(staging, manifest)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(staging, directory)
+        self._prune(keep=directory)
+
+        # 剛解析的欄位直接留在進程內
+        self._columns = {column: df[column] for column in df.columns}
+        return manifest
+
+    def _prune(self, keep: str):
+        """只保留最新的數個快照版本"""
+        directories = [
+            os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+            if name.startswith(f"{self.stem}-") and ".tmp-" not in name
+        ]
+        directories.sort(key=os.path.getmtime, reverse=True)
+        for directory in directories[DATASET_CACHE_CONFIG["keep_snapshots"]:]:
+            if directory != keep:
+                shutil.rmtree(directory, ignore_errors=True)
+
+    def _column(self, manifest: Dict[str, Any], column: str):
+        import pandas as pd
+
+        if column not in self._columns:
+            directory = self._snapshot_dir(manifest["sha256"])
+            self._columns[column] = pd.read_pickle(os.path.join(directory, manifest["files"][column]))
+        return self._columns[column]
+
+    def load(self, columns: Optional[List[str]] = None):
+        """讀取數據集 (型別化的 DataFrame)
+
+        Args:
+            columns: 需要的欄位，未提供時讀取全部欄位
+
+        Returns:
+            pandas.DataFrame
+        """
+        import pandas as pd
+
+        with self._lock:
+            manifest = self._current_manifest()
+            wanted = manifest["columns"] if columns is None else list(columns)
+            missing = [column for column in wanted if column not in manifest["files"]]
+            if missing:
+                raise KeyError(f"數據集缺少欄位：{missing}")
+            return pd.DataFrame({column: self._column(manifest, column) for column in wanted})
+
+    def column_names(self) -> List[str]:
+        """全部欄位名稱 (只讀 manifest)"""
+        with self._lock:
+            return list(self._current_manifest()["columns"])
+
+    def row_count(self) -> int:
+        """行數 (只讀 manifest)"""
+        with self._lock:
+            return self._current_manifest()["rows"]
+
+    def artifact_path(self, name: str) -> str:
+        """目前快照目錄中衍生文件的路徑 (例如壓縮文檔存儲)，隨快照以 CSV 內容為鍵並一併清理"""
+        with self._lock:
+            manifest = self._current_manifest()
+        return os.path.join(self._snapshot_dir(manifest["sha256"]), name)
+
+    def info(self) -> Dict[str, Any]:
+        """快照資訊：雜湊、行數、欄位型別"""
+        with self._lock:
+            manifest = dict(self._current_manifest())
+        manifest["snapshot_dir"] = self._snapshot_dir(manifest["sha256"])
+        return manifest
+
+
+def get_dataset_store(csv_path: Optional[str] = None) -> DatasetStore:
+    """進程內共用的 DatasetStore (每個 CSV 路徑一個)"""
+    path = os.path.abspath(str(csv_path or PROCESSED_DATASET))
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = DatasetStore(path)
+        return _stores[path]
+
+
+def load_dataset(columns: Optional[List[str]] = None, csv_path: Optional[str] = None):
+    """讀取數據集的指定欄位，取代直接呼叫 pd.read_csv"""
+    return get_dataset_store(csv_path).load(columns)
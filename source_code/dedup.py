@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+近似重複偵測
+
+以字元 shingle 的 MinHash 簽名估計文本間的 Jaccard 相似度，LSH 分帶找出候選對，
+相似度達門檻者以 union-find 合併成群。每群保留第一個出現的文本作為代表，
+其餘為別名 (alias)：ingest 時只 embedding 與索引代表，別名映射存於代表的 metadata。
+
+- shingle 雜湊與 MinHash 均以 numpy 向量化計算 (每個排列對全部文本一次 reduceat)
+- 只在相同分組 (例如 prompt_type + complexity) 內合併，過濾檢索的結果不受影響
+
+用法：
+    python -m source_code.dedup --source dataset
+    python -m source_code.dedup --source chunks --threshold 0.8
+"""
+
+import argparse
+import re
+from typing import Any, Dict, List, Optional, Sequence
+
+from source_code.config import DEDUP_CONFIG
+
+_WHITESPACE = re.compile(r"\s+")
+_MASK64 = (1 << 64) - 1
+
+
+def _normalize(text: str) -> str:
+    return _WHITESPACE.sub(" ", (text or "").lower()).strip()
+
+
+def _shingle_hashes(text: str, size: int):
+    """字元 size-gram 的 64 位元雜湊 (多項式滾動雜湊後以 splitmix64 打散)"""
+    import numpy as np
+
+    codes = np.frombuffer(_normalize(text).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    if len(codes) < size:
+        codes = np.concatenate([codes, np.zeros(size - len(codes), dtype=np.uint64)])
+    count = len(codes) - size + 1
+    hashes = np.zeros(count, dtype=np.uint64)
+    base = np.uint64(1099511628211)
+    with np.errstate(over="ignore"):
+        for offset in range(size):
+            hashes = hashes * base + codes[offset:offset + count]
+        hashes ^= hashes >> np.uint64(30)
+        hashes *= np.uint64(0xBF58476D1CE4E5B9)
+        hashes ^= hashes >> np.uint64(27)
+        hashes *= np.uint64(0x94D049BB133111EB)
+        hashes ^= hashes >> np.uint64(31)
+    return hashes
+
+
+def minhash_signatures(texts: Sequence[str], num_perm: Optional[int] = None, shingle_size: Optional[int] = None, seed: int = 0):
+    """計算 MinHash 簽名
+
+    Returns:
+        numpy.ndarray，形狀 (len(texts), num_perm)，dtype uint64
+    """
+    import numpy as np
+
+    num_perm = num_perm or DEDUP_CONFIG["num_perm"]
+    shingle_size = shingle_size or DEDUP_CONFIG["shingle_size"]
+    if not texts:
+        return np.zeros((0, num_perm), dtype=np.uint64)
+
+    parts = [_shingle_hashes(text, shingle_size) for text in texts]
+    offsets = np.zeros(len(parts), dtype=np.int64)
+    offsets[1:] = np.cumsum([len(part) for part in parts])[:-1]
+    hashes = np.concatenate(parts)
+
+    # multiply-add 排列：(a * h + b) mod 2^64，a 為奇數
+    rng = np.random.default_rng(seed)
+    multipliers = rng.integers(0, 1 << 63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    increments = rng.integers(0, 1 << 63, size=num_perm, dtype=np.uint64)
+
+    signatures = np.empty((len(texts), num_perm), dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for perm in range(num_perm):
+            permuted = hashes * multipliers[perm] + increments[perm]
+            signatures[:, perm] = np.minimum.reduceat(permuted, offsets)
+    return signatures
+
+
+def cluster_near_duplicates(
+    texts: Sequence[str],
+    groups: Optional[Sequence[Any]] = None,
+    threshold: Optional[float] = None,
+    bands: Optional[int] = None,
+    signatures=None
+) -> List[int]:
+    """將近似重複的文本分群
+
+    Args:
+        texts: 文本列表
+        groups: 與 texts 對應的分組鍵，只在同組內合併；未提供時視為同一組
+        threshold: 估計 Jaccard 相似度門檻
+        bands: LSH 分帶數 (num_perm 必須可被整除)
+        signatures: 可選的預先計算簽名
+
+    Returns:
+        每個文本所屬群的代表索引 (代表本身的值等於自己的索引，為群中最早出現者)
+    """
+    import numpy as np
+
+    threshold = DEDUP_CONFIG["threshold"] if threshold is None else threshold
+    bands = bands or DEDUP_CONFIG["bands"]
+    if signatures is None:
+        signatures = minhash_signatures(texts)
+    count, num_perm = signatures.shape
+    rows = num_perm // bands
+    groups = list(groups) if groups is not None else [None] * count
+
+    parent = list(range(count))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    checked = set()
+    for band in range(bands):
+        buckets = {}
+        band_bytes = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows])
+        for i in range(count):
+            buckets.setdefault((groups[i], band_bytes[i].tobytes()), []).append(i)
+        for members in buckets.values():
+            if len(members) < 2:
+                continue
+            first = members[0]
+            for other in members[1:]:
+                pair = (first, other)
+                if pair in checked:
+                    continue
+                checked.add(pair)
+                if np.mean(signatures[first] == signatures[other]) >= threshold:
+                    a, b = find(first), find(other)
+                    if a != b:
+                        # 以較早出現者為根，代表即群中最小索引
+                        parent[max(a, b)] = min(a, b)
+    return [find(i) for i in range(count)]
+
+
+def alias_map(ids: Sequence[str], representatives: Sequence[int]) -> Dict[str, List[str]]:
+    """代表 ID → 別名 ID 列表 (只包含有別名的代表)"""
+    aliases = {}
+    for i, representative in enumerate(representatives):
+        if representative != i:
+            aliases.setdefault(ids[representative], []).append(ids[i])
+    return aliases
+
+
+def main():
+    import time
+    from collections import Counter
+
+    parser = argparse.ArgumentParser(description="近似重複偵測報告")
+    parser.add_argument("--source", choices=["dataset", "chunks"], default="dataset")
+    parser.add_argument("--threshold", type=float, default=DEDUP_CONFIG["threshold"])
+    parser.add_argument("--top", type=int, default=5, help="列出最大的幾個群")
+    args = parser.parse_args()
+
+    if args.source == "dataset":
+        from source_code.dataset_store import load_dataset
+        df = load_dataset(["good_prompt", "prompt_type", "complexity"])
+        texts = df["good_prompt"].fillna("").tolist()
+        groups = list(zip(df["prompt_type"].astype(str), df["complexity"].astype(str)))
+        kinds = ["good_prompt"] * len(texts)
+    else:
+        from source_code.chunk_store import open_chunk_store
+        store = open_chunk_store()
+        texts = [store.text(i) for i in range(len(store))]
+        kinds = [store.value(i, "chunk_type") for i in range(len(store))]
+        groups = kinds
+
+    start = time.perf_counter()
+    representatives = cluster_near_duplicates(texts, groups=groups, threshold=args.threshold)
+    elapsed = time.perf_counter() - start
+
+    clusters = Counter(representatives)
+    collapsed = len(texts) - len(clusters)
+    print(f"{len(texts)} 個文本 → {len(clusters)} 個代表 (合併 {collapsed} 個，{collapsed / max(len(texts), 1):.1%})，耗時 {elapsed:.2f}s")
+    by_kind = Counter(kinds[i] for i, representative in enumerate(representatives) if representative != i)
+    for kind, count in by_kind.most_common():
+        print(f"  {kind}: {count} 個別名")
+    for representative, size in clusters.most_common(args.top):
+        if size > 1:
+            print(f"  群 #{representative} ({size} 個): {texts[representative][:80]!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+結果多樣化 (Maximal Marginal Relevance)
+
+無上下文查詢的前幾名常是同一 prompt_type 的近似副本。檢索時多取 over_fetch 倍候選並連同向量返回，
+再以 MMR 貪婪挑選：每一步選擇 λ · 與查詢的相似度 − (1 − λ) · 與已選結果的最大相似度 最高的候選。
+
+候選向量先正規化，兩兩相似度只計算一次 (一個 n × n 矩陣)；
+每一步以已選結果的相似度列更新「與已選集合的最大相似度」向量，整體 O(k · n)，不需額外 embedding 或檢索。
+"""
+
+from typing import List, Optional, Sequence
+
+
+def mmr_select(
+    query_vector: Sequence[float],
+    candidate_vectors,
+    k: int,
+    lambda_: float = 0.7,
+    relevance: Optional[Sequence[float]] = None
+) -> List[int]:
+    """以 MMR 從候選中挑選 k 個
+
+    Args:
+        query_vector: 查詢向量
+        candidate_vectors: 候選向量 (n × d，按原始相關度排序)
+        k: 挑選數量
+        lambda_: 相關度權重 (1 為純相關度排序，0 為純多樣性)
+        relevance: 可選的相關度分數 (例如重排分數)，取代與查詢的餘弦相似度；
+            線性縮放到餘弦相似度的範圍，使 λ 對兩項的權衡不受分數尺度影響
+
+    Returns:
+        被選候選的索引 (按挑選順序)
+    """
+    import numpy as np
+
+    candidates = np.asarray(candidate_vectors, dtype=np.float32)
+    if candidates.ndim != 2 or len(candidates) == 0:
+        return []
+    k = min(k, len(candidates))
+
+    candidates = candidates / (np.linalg.norm(candidates, axis=1, keepdims=True) + 1e-12)
+    query = np.asarray(query_vector, dtype=np.float32)
+    query = query / (np.linalg.norm(query) + 1e-12)
+    cosine = candidates @ query
+    if relevance is not None:
+        scores = np.asarray(relevance, dtype=np.float32)
+        spread = float(scores.max() - scores.min())
+        if spread > 0:
+            low, high = float(cosine.min()), float(cosine.max())
+            cosine = low + (scores - scores.min()) / spread * (high - low)
+    relevance = cosine
+    similarity = candidates @ candidates.T
+
+    selected = [int(np.argmax(relevance))]
+    redundancy = similarity[selected[0]].copy()
+    available = np.ones(len(candidates), dtype=bool)
+    available[selected[0]] = False
+    while len(selected) < k:
+        scores = lambda_ * relevance - (1 - lambda_) * redundancy
+        scores[~available] = -np.inf
+        chosen = int(np.argmax(scores))
+        selected.append(chosen)
+        available[chosen] = False
+        np.maximum(redundancy, similarity[chosen], out=redundancy)
+    return selected
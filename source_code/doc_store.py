@@ -0,0 +1,478 @@
+# -*- coding: utf-8 -*-
+"""
+壓縮文檔存儲
+
+prompt 全文 (good_prompt) 與期望輸出 (expected_answer) 高度重複 ("Imagine you are...",
+"First, ... Second, ...")，但每份只有數百位元組，逐份獨立壓縮幾乎沒有效果。
+這裡以整個語料訓練一個共用字典，每份文檔以該字典獨立壓縮成一個 frame，
+命中時才解壓單一文檔 (數微秒)：
+
+- 已安裝 zstandard 時使用 zstd 訓練的字典
+- 否則退回標準庫 zlib 的預設字典 (zdict)：從語料挑選高頻詞組拼成 32KB 字典
+
+文件格式與 chunk_store 相同：
+
+    magic (8 bytes) | header 長度 (uint64) | header (JSON) | 64 位元組對齊的資料區段
+
+- dictionary: 共用字典
+- <field>_offsets / <field>: 每個欄位的 int64 offsets 表與壓縮 frame blob
+
+DocumentStoreCollection 包裝 Chroma collection：向量索引只保存 ID、向量與 metadata，
+query / get 要求 documents 時從存儲解壓填回，對引擎而言 collection 介面不變。
+
+用法：
+    python -m source_code.doc_store --dataset dataset/processed_dataset.csv   # 壓縮率與解壓延遲
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+
+from source_code.config import DOC_STORE_CONFIG
+
+MAGIC = b"PRDOCS01"
+ALIGNMENT = 64
+DOCUMENT_FIELD = "document"
+
+
+def _align(position: int) -> int:
+    return (position + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _phrase_dictionary(samples: List[bytes], size: int) -> bytes:
+    """zlib 預設字典：出現在至少 3 份文檔的詞組，按 出現次數 × 長度 挑選
+
+    deflate 對較近的內容編碼較短，最常用的詞組放在字典末尾。
+    """
+    counts = Counter()
+    for sample in samples:
+        words = sample.decode("utf-8", errors="ignore").split()
+        seen = set()
+        for n in (8, 6, 4):
+            for i in range(len(words) - n + 1):
+                phrase = " ".join(words[i:i + n])
+                if phrase not in seen:
+                    seen.add(phrase)
+                    counts[phrase] += 1
+
+    chosen, used = [], 0
+    for _, phrase in sorted(((count * len(phrase), phrase) for phrase, count in counts.items() if count >= 3), reverse=True):
+        encoded = phrase.encode("utf-8")
+        if used + len(encoded) + 1 > size or any(phrase in other for other in chosen):
+            continue
+        chosen.append(phrase)
+        used += len(encoded) + 1
+        if used > size - 64:
+            break
+    return " ".join(reversed(chosen)).encode("utf-8")
+
+
+class _ZstdCodec:
+    """zstd + 訓練字典 (解壓器按線程快取，ZstdDecompressor 不可跨線程共用)"""
+
+    name = "zstd"
+
+    def __init__(self, dictionary: bytes, level: Optional[int] = None):
+        import zstandard
+
+        self.dictionary = dictionary
+        self.level = level or 19
+        self._zstd = zstandard
+        self._dict = zstandard.ZstdCompressionDict(dictionary)
+        self._compressor = None
+        self._local = threading.local()
+
+    @classmethod
+    def train(cls, samples: List[bytes], size: int, level: Optional[int] = None) -> "_ZstdCodec":
+        import zstandard
+
+        dictionary = zstandard.train_dictionary(size, samples, level=level or 19)
+        return cls(dictionary.as_bytes(), level)
+
+    def compress(self, data: bytes) -> bytes:
+        if self._compressor is None:
+            self._compressor = self._zstd.ZstdCompressor(
+                level=self.level, dict_data=self._dict, write_checksum=False, write_dict_id=False
+            )
+        return self._compressor.compress(data)
+
+    def decompress(self, frame: bytes) -> bytes:
+        decompressor = getattr(self._local, "decompressor", None)
+        if decompressor is None:
+            decompressor = self._local.decompressor = self._zstd.ZstdDecompressor(dict_data=self._dict)
+        return decompressor.decompress(frame)
+
+
+class _ZlibCodec:
+    """raw deflate + 預設字典 (標準庫，無額外依賴)"""
+
+    name = "zlib"
+
+    def __init__(self, dictionary: bytes, level: Optional[int] = None):
+        self.dictionary = dictionary
+        self.level = level or 9
+        self._options = {"zdict": dictionary} if dictionary else {}
+
+    @classmethod
+    def train(cls, samples: List[bytes], size: int, level: Optional[int] = None) -> "_ZlibCodec":
+        return cls(_phrase_dictionary(samples, size), level)
+
+    def compress(self, data: bytes) -> bytes:
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15, 9, **self._options)
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, frame: bytes) -> bytes:
+        return zlib.decompressobj(-15, **self._options).decompress(frame)
+
+
+CODECS = {"zstd": _ZstdCodec, "zlib": _ZlibCodec}
+
+
+def default_codec() -> str:
+    """DOC_STORE_CONFIG 指定的編碼；auto 時有 zstandard 用 zstd，否則 zlib"""
+    codec = DOC_STORE_CONFIG["codec"]
+    if codec != "auto":
+        return codec
+    try:
+        import zstandard  # noqa: F401
+        return "zstd"
+    except ImportError:
+        return "zlib"
+
+
+def content_digest(ids: List[str], fields: Dict[str, List[Optional[str]]]) -> str:
+    """ID 與各欄位文本的 SHA-256，用於判斷已保存的存儲能否直接重用"""
+    digest = hashlib.sha256()
+    for doc_id in ids:
+        digest.update(str(doc_id).encode("utf-8") + b"\0")
+    for name in sorted(fields):
+        digest.update(name.encode("utf-8") + b"\1")
+        for text in fields[name]:
+            digest.update((text or "").encode("utf-8") + b"\0")
+    return digest.hexdigest()
+
+
+class DocStore:
+    """以共用字典壓縮、按文檔解壓的文本存儲
+
+    每個欄位 (預設 "document"，另可有 "expected_output" 等) 是一組與 ids 對齊的壓縮 frame。
+    以 build() 在記憶體中建立，save() / open() 寫出與 mmap 開啟。
+    """
+
+    def __init__(self, ids: List[str], codec, sections: Dict[str, Any], raw_bytes: Dict[str, int], digest: Optional[str] = None):
+        self.ids = ids
+        self.digest = digest
+        self.codec = codec
+        self._sections = sections
+        self.raw_bytes = raw_bytes
+        self.fields = [name for name in sections if not name.endswith("_offsets")]
+        self._rows = None
+        # 預設欄位的壓縮 blob (與 _StringColumn.data 相同用途：預熱 page cache)
+        self.data = sections.get(DOCUMENT_FIELD, next(iter(sections.values()), None))
+
+    @classmethod
+    def build(
+        cls,
+        ids: List[str],
+        fields: Dict[str, List[Optional[str]]],
+        codec: Optional[str] = None,
+        dictionary_size: Optional[int] = None,
+        level: Optional[int] = None
+    ) -> "DocStore":
+        """以全部欄位的文本訓練共用字典並壓縮
+
+        Args:
+            ids: 文檔 ID
+            fields: {欄位名: 與 ids 對齊的文本列表}，None 視為空字串
+            codec: "zstd" 或 "zlib"，未提供時依 DOC_STORE_CONFIG
+            dictionary_size: 字典大小上限 (位元組)
+            level: 壓縮等級
+        """
+        import numpy as np
+
+        codec = codec or default_codec()
+        dictionary_size = dictionary_size or DOC_STORE_CONFIG["dictionary_size"]
+        level = level or DOC_STORE_CONFIG["level"]
+        encoded = {name: [(text or "").encode("utf-8") for text in texts] for name, texts in fields.items()}
+        samples = [item for texts in encoded.values() for item in texts if item]
+
+        try:
+            compressor = CODECS[codec].train(samples, dictionary_size, level)
+        except Exception as e:
+            # 語料太少時 zstd 無法訓練字典：改用 zlib 詞組字典
+            if codec == "zlib":
+                raise
+            print(f"zstd 字典訓練失敗，改用 zlib：{str(e)}")
+            compressor = _ZlibCodec.train(samples, dictionary_size, level)
+
+        sections = {}
+        for name, texts in encoded.items():
+            frames = [compressor.compress(item) if item else b"" for item in texts]
+            offsets = np.zeros(len(frames) + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum([len(frame) for frame in frames])
+            sections[f"{name}_offsets"] = offsets
+            sections[name] = np.frombuffer(b"".join(frames), dtype=np.uint8)
+        raw_bytes = {name: sum(map(len, texts)) for name, texts in encoded.items()}
+        return cls(list(ids), compressor, sections, raw_bytes, content_digest(ids, fields))
+
+    @classmethod
+    def open(cls, path: str) -> "DocStore":
+        """以 mmap 開啟存儲文件"""
+        import numpy as np
+
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"不是文檔存儲文件：{path}")
+            (header_length,) = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(header_length))
+
+        data = np.memmap(path, dtype=np.uint8, mode="r")
+        sections = {
+            name: np.frombuffer(data, dtype=np.dtype(spec["dtype"]), count=spec["length"], offset=spec["offset"])
+            for name, spec in header["sections"].items()
+        }
+        dictionary = sections.pop("dictionary").tobytes()
+        codec = CODECS[header["codec"]](dictionary, header["level"])
+        return cls(header["ids"], codec, sections, header["raw_bytes"], header.get("digest"))
+
+    def save(self, path: str) -> Dict[str, Any]:
+        """寫出存儲文件 (先寫臨時文件再替換)，返回 header"""
+        import numpy as np
+
+        sections = {"dictionary": np.frombuffer(self.codec.dictionary, dtype=np.uint8)}
+        sections.update(self._sections)
+        layout = {name: {"dtype": array.dtype.str, "length": int(array.size), "offset": 0} for name, array in sections.items()}
+        header = {
+            "version": 1,
+            "codec": self.codec.name,
+            "level": self.codec.level,
+            "ids": self.ids,
+            "raw_bytes": self.raw_bytes,
+            "digest": self.digest,
+            "sections": layout
+        }
+        # 先以佔位 offset 計算 header 長度，區段位置確定後回填
+        header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        position = _align(len(MAGIC) + 8 + len(header_bytes) + 32 * len(layout))
+        for name, array in sections.items():
+            layout[name]["offset"] = position
+            position = _align(position + array.nbytes)
+        header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        if len(MAGIC) + 8 + len(header_bytes) > min(spec["offset"] for spec in layout.values()):
+            raise ValueError("文檔存儲 header 超出預留空間")
+
+        staging = f"{path}.tmp-{os.getpid()}"
+        with open(staging, "wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<Q", len(header_bytes)))
+            f.write(header_bytes)
+            for name, array in sections.items():
+                f.write(b"\0" * (layout[name]["offset"] - f.tell()))
+                f.write(array.tobytes())
+        os.replace(staging, path)
+        return header
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, row: int) -> str:
+        return self.text(row)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return self.row(doc_id) is not None
+
+    def row(self, doc_id: str) -> Optional[int]:
+        if self._rows is None:
+            self._rows = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        return self._rows.get(doc_id)
+
+    def text(self, row: int, field: str = DOCUMENT_FIELD) -> str:
+        """解壓單一文檔"""
+        offsets = self._sections[f"{field}_offsets"]
+        start, end = int(offsets[row]), int(offsets[row + 1])
+        if start == end:
+            return ""
+        return self.codec.decompress(self._sections[field][start:end].tobytes()).decode("utf-8")
+
+    def get(self, doc_id: str, field: str = DOCUMENT_FIELD) -> Optional[str]:
+        row = self.row(doc_id)
+        return None if row is None or field not in self.fields else self.text(row, field)
+
+    def get_many(self, ids: Iterable[str], field: str = DOCUMENT_FIELD) -> Dict[str, str]:
+        """{文檔 id: 文本}，不存在的 id (或欄位) 不出現在結果中"""
+        if field not in self.fields:
+            return {}
+        found = {}
+        for doc_id in ids:
+            row = self.row(doc_id)
+            if row is not None:
+                found[doc_id] = self.text(row, field)
+        return found
+
+    def stats(self) -> Dict[str, Any]:
+        raw = sum(self.raw_bytes.values())
+        compressed = sum(int(self._sections[name].nbytes) for name in self.fields) + len(self.codec.dictionary)
+        return {
+            "codec": self.codec.name,
+            "documents": len(self.ids),
+            "fields": self.fields,
+            "raw_bytes": raw,
+            "compressed_bytes": compressed,
+            "dictionary_bytes": len(self.codec.dictionary),
+            "ratio": round(raw / compressed, 2) if compressed else 0.0
+        }
+
+
+def _open_saved(path: str, digest: str) -> Optional[DocStore]:
+    """開啟已保存且內容與編碼相符的存儲，否則返回 None"""
+    if not os.path.exists(path):
+        return None
+    try:
+        store = DocStore.open(path)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"忽略無效的文檔存儲 {path}：{str(e)}")
+        return None
+    level = DOC_STORE_CONFIG["level"]
+    if store.digest != digest or store.codec.name != default_codec() or (level and store.codec.level != level):
+        return None
+    return store
+
+
+class DocumentStoreCollection:
+    """包裝 Chroma collection：全文存於 DocStore，collection 只保存 ID、向量與 metadata
+
+    add 時暫存全文 (不寫入 collection)，seal() 以全部文檔訓練字典並建立存儲 (ingest 結束時呼叫)。
+    collection 內若有未經包裝寫入的文檔 (尚無暫存也無存儲)，照常從 collection 讀取。
+    其餘屬性與方法轉交底層 collection。
+    """
+
+    def __init__(self, collection, store: Optional[DocStore] = None):
+        self.collection = collection
+        self.store = store
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name: str):
+        return getattr(self.collection, name)
+
+    @property
+    def _holds_documents(self) -> bool:
+        return self.store is not None or bool(self._pending)
+
+    def add(self, ids: List[str], embeddings=None, metadatas=None, documents=None, fields=None, **kwargs):
+        """與 collection.add 相同；fields 為額外的文本欄位 {欄位名: 與 ids 對齊的文本}"""
+        with self._lock:
+            if documents is not None:
+                self._pending.setdefault(DOCUMENT_FIELD, {}).update(zip(ids, documents))
+            for name, texts in (fields or {}).items():
+                self._pending.setdefault(name, {}).update(zip(ids, texts))
+        self.collection.add(ids=ids, embeddings=embeddings, metadatas=metadatas, **kwargs)
+
+    def seal(self, path: Optional[str] = None) -> Optional[DocStore]:
+        """將暫存的全文 (連同既有存儲的內容) 壓縮為新的存儲
+
+        Args:
+            path: 可選的存儲文件。文件的內容摘要與編碼都相符時直接以 mmap 開啟，不重新訓練字典與壓縮；
+                否則建立後寫出到該路徑，供下次啟動重用
+        """
+        with self._lock:
+            if not self._pending:
+                return self.store
+            fields = {name: dict(texts) for name, texts in self._pending.items()}
+            if self.store is not None:
+                for name in self.store.fields:
+                    existing = {doc_id: self.store.text(row, name) for row, doc_id in enumerate(self.store.ids)}
+                    existing.update(fields.get(name, {}))
+                    fields[name] = existing
+            ids = list(dict.fromkeys(doc_id for texts in fields.values() for doc_id in texts))
+            columns = {name: [texts.get(doc_id) for doc_id in ids] for name, texts in fields.items()}
+            self.store = _open_saved(path, content_digest(ids, columns)) if path else None
+            if self.store is None:
+                self.store = DocStore.build(ids, columns)
+                if path:
+                    try:
+                        self.store.save(path)
+                        # 改以 mmap 開啟剛寫出的文件，釋放建立時的記憶體副本
+                        self.store = DocStore.open(path)
+                    except OSError as e:
+                        print(f"文檔存儲無法保存到 {path}：{str(e)}")
+            self._pending = {}
+            return self.store
+
+    def field(self, ids: List[str], field: str) -> Dict[str, str]:
+        """按 id 取回指定文本欄位，例如 field(ids, "expected_output")"""
+        pending = self._pending.get(field, {})
+        found = {doc_id: pending[doc_id] for doc_id in ids if doc_id in pending}
+        if self.store is not None:
+            found.update(self.store.get_many([doc_id for doc_id in ids if doc_id not in found], field))
+        return found
+
+    def _fill_documents(self, ids: List[str]) -> List[Optional[str]]:
+        found = self.field(ids, DOCUMENT_FIELD)
+        return [found.get(doc_id) for doc_id in ids]
+
+    def query(self, query_embeddings=None, n_results: int = 10, where=None, include=("metadatas", "documents", "distances"), **kwargs):
+        include = list(include)
+        if "documents" not in include or not self._holds_documents:
+            return self.collection.query(query_embeddings=query_embeddings, n_results=n_results, where=where, include=include, **kwargs)
+        results = self.collection.query(
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            where=where,
+            include=[key for key in include if key != "documents"],
+            **kwargs
+        )
+        results["documents"] = [self._fill_documents(row) for row in results["ids"]]
+        return results
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=("metadatas", "documents"), **kwargs):
+        include = list(include)
+        if "documents" not in include or not self._holds_documents:
+            return self.collection.get(ids=ids, where=where, limit=limit, offset=offset, include=include, **kwargs)
+        results = self.collection.get(
+            ids=ids, where=where, limit=limit, offset=offset,
+            include=[key for key in include if key != "documents"],
+            **kwargs
+        )
+        results["documents"] = self._fill_documents(results["ids"])
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="文檔存儲壓縮率與解壓延遲")
+    parser.add_argument("--dataset", default=None, help="數據集 CSV，預設 dataset/processed_dataset.csv")
+    parser.add_argument("--codec", choices=sorted(CODECS), default=None)
+    parser.add_argument("--dictionary-size", type=int, default=DOC_STORE_CONFIG["dictionary_size"])
+    args = parser.parse_args()
+
+    from source_code.config import PROCESSED_DATASET
+    from source_code.dataset_store import get_dataset_store
+
+    df = get_dataset_store(args.dataset or str(PROCESSED_DATASET)).load(["good_prompt", "expected_answer"])
+    ids = [str(i) for i in range(len(df))]
+    for column in ("good_prompt", "expected_answer"):
+        texts = [text if isinstance(text, str) else "" for text in df[column]]
+        start = time.perf_counter()
+        store = DocStore.build(ids, {DOCUMENT_FIELD: texts}, codec=args.codec, dictionary_size=args.dictionary_size)
+        build_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        for row in range(len(store)):
+            store.text(row)
+        decompress_us = (time.perf_counter() - start) / max(1, len(store)) * 1e6
+        stats = store.stats()
+        print(
+            f"{column}: {stats['codec']} {stats['raw_bytes'] / 1024:.0f} KB → {stats['compressed_bytes'] / 1024:.0f} KB "
+            f"(×{stats['ratio']}，含字典 {stats['dictionary_bytes'] / 1024:.0f} KB)，"
+            f"建立 {build_seconds:.2f}s，單文檔解壓 {decompress_us:.1f}µs"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+數據集熱重載
+
+更新 dataset/processed_dataset.csv 或 processed_chunks.json 後不必重啟應用：
+
+- VersionedIndex: 持有目前的索引版本 (collection + 記錄索引 + 版本號)。查詢開始時 acquire 一個版本，
+  整個查詢都在該版本上執行；swap 原子地替換目前版本，進行中的查詢照常在舊版本上完成，
+  舊版本在最後一個讀者釋放後才 retire (刪除舊 collection、清除以該版本為鍵的快取)。
+- DatasetWatcher: 在背景線程輪詢數據集與 chunk 文件的 size / mtime，變更穩定 debounce 秒後
+  呼叫 engine.reload()：新版本在背景建立 (未變更的 prompt 重用舊版本的 embedding)，完成後才切換，
+  期間查詢繼續由舊版本服務。
+
+用法：
+    watcher = DatasetWatcher(rag_system).start()
+    watcher.status()    # {"state": "idle" | "pending" | "reloading" | "failed", "version": ...}
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+from source_code.config import HOT_RELOAD_CONFIG, PROCESSED_CHUNKS
+
+
+class IndexVersion:
+    """一個不可變的索引版本
+
+    Args:
+        number: 版本號 (單調遞增)
+        collection: 該版本的 collection
+        record_index: 記錄層級索引；None 表示首次使用時載入，False 表示不可用
+        on_retire: 版本被替換且沒有讀者後呼叫的清理函數 (接收本版本)
+    """
+
+    def __init__(self, number: int, collection, record_index=None, on_retire: Optional[Callable] = None):
+        self.number = number
+        self.collection = collection
+        self.record_index = record_index
+        self.on_retire = on_retire
+        self.created_at = time.time()
+        self.owns_collection = True   # 下一版本沿用同一 collection 時設為 False，retire 時不刪除
+        self.readers = 0
+        self.retired = False
+
+
+class VersionedIndex:
+    """可原子替換的索引版本句柄 (線程安全)"""
+
+    def __init__(self, initial: IndexVersion):
+        self._current = initial
+        self._lock = threading.Lock()
+
+    @property
+    def current(self) -> IndexVersion:
+        return self._current
+
+    @contextmanager
+    def acquire(self):
+        """取得目前版本並在離開前保持其有效 (不會被 retire)"""
+        with self._lock:
+            version = self._current
+            version.readers += 1
+        try:
+            yield version
+        finally:
+            self._release(version)
+
+    def swap(self, version: IndexVersion) -> IndexVersion:
+        """將目前版本替換為 version，返回舊版本；舊版本沒有讀者時立即 retire"""
+        with self._lock:
+            previous, self._current = self._current, version
+            previous.retired = True
+            idle = previous.readers == 0
+        if idle:
+            self._retire(previous)
+        return previous
+
+    def _release(self, version: IndexVersion):
+        with self._lock:
+            version.readers -= 1
+            idle = version.retired and version.readers == 0
+        if idle:
+            self._retire(version)
+
+    def _retire(self, version: IndexVersion):
+        if version.on_retire is not None:
+            try:
+                version.on_retire(version)
+            except Exception as e:
+                print(f"索引版本 v{version.number} 清理失敗：{str(e)}")
+
+
+def file_signature(path: str):
+    """文件的 (size, mtime_ns)，不存在時返回 None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+class DatasetWatcher:
+    """輪詢數據集與 chunk 文件，變更時在背景觸發 engine.reload()
+
+    Args:
+        engine: PromptGeneratorRAGSystem
+        dataset_path: 數據集 CSV，預設為引擎的數據集
+        chunks_path: chunk JSON，預設 PROCESSED_CHUNKS
+        interval: 輪詢間隔 (秒)
+        debounce: 文件簽名需保持不變的時間 (秒)，避免在寫入途中重建
+    """
+
+    def __init__(
+        self,
+        engine,
+        dataset_path: Optional[str] = None,
+        chunks_path: Optional[str] = None,
+        interval: Optional[float] = None,
+        debounce: Optional[float] = None
+    ):
+        self.engine = engine
+        self.paths = {
+            "dataset": str(dataset_path or engine.dataset_path),
+            "chunks": str(chunks_path or PROCESSED_CHUNKS)
+        }
+        self.interval = interval if interval is not None else HOT_RELOAD_CONFIG["poll_interval"]
+        self.debounce = debounce if debounce is not None else HOT_RELOAD_CONFIG["debounce"]
+        self._baseline = {name: file_signature(path) for name, path in self.paths.items()}
+        self._pending = {}
+        self._failed = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._status = {"state": "idle", "reloads": 0, "last_reload": None, "last_error": None}
+
+    def start(self) -> "DatasetWatcher":
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="dataset-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def status(self) -> Dict[str, Any]:
+        status = dict(self._status)
+        status["version"] = self.engine.index.current.number
+        return status
+
+    def poll(self) -> Optional[Dict[str, Any]]:
+        """檢查一次文件變更；變更已穩定時同步執行重載並返回其結果，否則返回 None"""
+        now = time.monotonic()
+        for name, path in self.paths.items():
+            signature = file_signature(path)
+            if signature == self._baseline[name] or signature == self._failed.get(name):
+                self._pending.pop(name, None)
+            elif name not in self._pending or self._pending[name][0] != signature:
+                # 新的變更 (或寫入仍在進行)：重新計時
+                self._pending[name] = (signature, now)
+
+        if not self._pending:
+            if self._status["state"] == "pending":
+                self._status["state"] = "idle"
+            return None
+        if any(now - since < self.debounce for _, since in self._pending.values()):
+            self._status["state"] = "pending"
+            return None
+
+        changed = dict(self._pending)
+        self._pending.clear()
+        self._status["state"] = "reloading"
+        result = self.engine.reload(dataset_changed="dataset" in changed, chunks_changed="chunks" in changed)
+        if "error" in result:
+            # 保留舊基準；同一份文件不再重試，文件再次變更時才重建
+            self._failed.update({name: signature for name, (signature, _) in changed.items()})
+            self._status.update(state="failed", last_error=result["error"])
+        else:
+            self._failed.clear()
+            for name, (signature, _) in changed.items():
+                self._baseline[name] = signature
+            self._status.update(state="idle", last_error=None, last_reload=result)
+            self._status["reloads"] += 1
+        return result
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"數據集熱重載錯誤：{str(e)}")
+                self._status.update(state="failed", last_error=str(e))
@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+"""
+共用的 OpenAI HTTP 客戶端
+
+所有 embedding 與 chat 請求經由同一個 OpenAIClient：
+- keep-alive 連線池 (http.client)，避免每個請求重新握手
+- 以信號量限制同時進行的請求數
+- 429 / 5xx / 連線中斷時以抖動指數退避重試，優先遵循 Retry-After
+- 每個請求有總期限，排隊、重試與等待都計入
+- 相同的並發 embedding 請求在途合併，同一批輸入只發出一次 API 呼叫
+
+base_url 可指向本地替身服務 (OPENAI_BASE_URL)，便於離線測試。
+"""
+
+import http.client
+import json
+import os
+import random
+import ssl
+import threading
+import time
+import weakref
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+from source_code.config import OPENAI_CLIENT_CONFIG, SYSTEM_CONFIG
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_clients = weakref.WeakSet()
+_default = {"client": None}
+_default_lock = threading.Lock()
+
+
+class OpenAIClientError(Exception):
+    """OpenAI 請求失敗 (不可重試的錯誤、重試用盡或超過期限)"""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class _InFlight:
+    """一個在途的 embedding 請求，供相同請求等待其結果"""
+
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class OpenAIClient:
+    """帶連線池、並發上限、重試與在途合併的 OpenAI 客戶端"""
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        max_connections: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        deadline: Optional[float] = None
+    ):
+        config = OPENAI_CLIENT_CONFIG
+        self.api_key = api_key
+        self.base_url = (base_url or config["base_url"]).rstrip("/")
+        parts = urlsplit(self.base_url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.path_prefix = parts.path.rstrip("/")
+        self.max_connections = max_connections or config["max_connections"]
+        self.max_concurrency = max_concurrency or config["max_concurrency"]
+        self.max_retries = config["max_retries"] if max_retries is None else max_retries
+        self.deadline = deadline or config["deadline"]
+        self.stats = {"requests": 0, "retries": 0, "coalesced": 0, "connections_opened": 0}
+        self._reset_state()
+        _clients.add(self)
+
+    def _reset_state(self):
+        """建立連線池與鎖 (fork 後的子進程也會重新調用，不沿用父進程的 socket)"""
+        self._idle = []
+        self._pool_lock = threading.Lock()
+        self._semaphore = threading.BoundedSemaphore(self.max_concurrency)
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key: str, value: int = 1):
+        with self._stats_lock:
+            self.stats[key] += value
+
+    # ------------------------------------------------------------------
+    # 連線池
+    # ------------------------------------------------------------------
+
+    def _acquire_connection(self, timeout: float) -> http.client.HTTPConnection:
+        with self._pool_lock:
+            connection = self._idle.pop() if self._idle else None
+        if connection is None:
+            if self.scheme == "https":
+                connection = http.client.HTTPSConnection(
+                    self.host, self.port, timeout=timeout, context=ssl.create_default_context()
+                )
+            else:
+                connection = http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+            self._count("connections_opened")
+        connection.timeout = timeout
+        if connection.sock is not None:
+            connection.sock.settimeout(timeout)
+        return connection
+
+    def _release_connection(self, connection: http.client.HTTPConnection, reusable: bool):
+        if reusable:
+            with self._pool_lock:
+                if len(self._idle) < self.max_connections:
+                    self._idle.append(connection)
+                    return
+        connection.close()
+
+    def close(self):
+        """關閉所有閒置連線"""
+        with self._pool_lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+    # ------------------------------------------------------------------
+    # 請求
+    # ------------------------------------------------------------------
+
+    def _backoff(self, attempt: int, retry_after: Optional[str]) -> float:
+        """抖動指數退避 (full jitter)；伺服器給出 Retry-After 時以其為準"""
+        if retry_after:
+            try:
+                return min(float(retry_after), OPENAI_CLIENT_CONFIG["backoff_max"])
+            except ValueError:
+                pass
+        cap = min(OPENAI_CLIENT_CONFIG["backoff_max"], OPENAI_CLIENT_CONFIG["backoff_base"] * (2 ** attempt))
+        return random.uniform(0, cap)
+
+    def _send(self, path: str, body: bytes, headers: Dict[str, str], timeout: float):
+        """經由連線池發送一次請求 (傳輸層，不含重試)
+
+        Returns:
+            (狀態碼, Retry-After 標頭, 回應主體)
+        """
+        connection = self._acquire_connection(timeout)
+        try:
+            connection.request("POST", self.path_prefix + path, body=body, headers=headers)
+            response = connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            # 閒置連線可能已被伺服器關閉，丟棄後由呼叫端重試
+            connection.close()
+            raise
+        self._release_connection(connection, not response.will_close)
+        return response.status, response.getheader("Retry-After"), data
+
+    def request(self, path: str, payload: Dict[str, Any], deadline: Optional[float] = None) -> Dict[str, Any]:
+        """發送 JSON POST 請求
+
+        Args:
+            path: API 路徑，例如 /embeddings
+            payload: 請求主體
+            deadline: 總期限 (秒)，預設取自 OPENAI_CLIENT_CONFIG
+
+        Returns:
+            回應 JSON
+        """
+        expires = time.monotonic() + (deadline or self.deadline)
+        body = json.dumps(payload).encode("utf-8")
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key or os.environ.get('OPENAI_API_KEY', '')}"
+        }
+
+        if not self._semaphore.acquire(timeout=max(0.0, expires - time.monotonic())):
+            raise OpenAIClientError("等待可用請求槽逾時")
+        try:
+            attempt = 0
+            while True:
+                remaining = expires - time.monotonic()
+                if remaining <= 0:
+                    raise OpenAIClientError("請求超過期限")
+
+                self._count("requests")
+                retry_after = None
+                try:
+                    status, retry_after, data = self._send(path, body, headers, remaining)
+                except (OSError, http.client.HTTPException) as e:
+                    status, message = None, f"連線錯誤：{str(e)}"
+                else:
+                    if status < 300:
+                        return json.loads(data)
+                    try:
+                        message = json.loads(data).get("error", {}).get("message") or data.decode("utf-8", "replace")
+                    except (ValueError, AttributeError):
+                        message = data.decode("utf-8", "replace")
+                    if status not in RETRY_STATUSES:
+                        raise OpenAIClientError(f"OpenAI 請求失敗 ({status})：{message}", status)
+
+                if attempt >= self.max_retries:
+                    raise OpenAIClientError(f"重試 {attempt} 次後仍失敗：{message}", status)
+                delay = self._backoff(attempt, retry_after)
+                if time.monotonic() + delay >= expires:
+                    raise OpenAIClientError(f"請求超過期限：{message}", status)
+                attempt += 1
+                self._count("retries")
+                time.sleep(delay)
+        finally:
+            self._semaphore.release()
+
+    def embedding_model_id(self, model: str) -> str:
+        """實際產生向量的模型 (記錄於向量快照，供載入時比對)；真實 API 即為請求的模型"""
+        return model
+
+    def embed(self, texts: List[str], model: Optional[str] = None, deadline: Optional[float] = None) -> List[List[float]]:
+        """取得文本向量；相同 (模型, 輸入) 的並發請求共用一次 API 呼叫"""
+        model = model or SYSTEM_CONFIG["embedding_model"]
+        key = (model, tuple(texts))
+
+        with self._inflight_lock:
+            pending = self._inflight.get(key)
+            leader = pending is None
+            if leader:
+                pending = self._inflight[key] = _InFlight()
+
+        if not leader:
+            self._count("coalesced")
+            if not pending.done.wait(deadline or self.deadline):
+                raise OpenAIClientError("等待合併中的 embedding 請求逾時")
+            if pending.error is not None:
+                raise pending.error
+            return pending.result
+
+        try:
+            response = self.request("/embeddings", {"model": model, "input": list(texts)}, deadline)
+            pending.result = [item["embedding"] for item in sorted(response["data"], key=lambda item: item["index"])]
+            return pending.result
+        except Exception as e:
+            pending.error = e
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+            pending.done.set()
+
+    def chat(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        temperature: Optional[float] = None,
+        deadline: Optional[float] = None,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """Chat completion，返回完整回應 JSON"""
+        payload = {
+            "model": model or SYSTEM_CONFIG["llm_model"],
+            "messages": messages,
+            "temperature": SYSTEM_CONFIG["temperature"] if temperature is None else temperature
+        }
+        payload.update(kwargs)
+        return self.request("/chat/completions", payload, deadline)
+
+
+class PooledEmbeddingFunction:
+    """以共用客戶端實作的 embedding 函數 (接收文本列表、返回向量列表)"""
+
+    def __init__(self, client: Optional[OpenAIClient] = None, model: Optional[str] = None):
+        self.client = client or get_client()
+        self.model = model or SYSTEM_CONFIG["embedding_model"]
+
+    @property
+    def model_id(self) -> str:
+        """向量的來源模型：離線重放時為合成向量的標識，而非請求的模型名稱"""
+        return self.client.embedding_model_id(self.model)
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        return self.client.embed(list(input), self.model)
+
+
+def get_client() -> OpenAIClient:
+    """進程內共用的預設客戶端
+
+    離線模式 (PROMPT_RAG_OFFLINE) 使用進程內的重放傳輸；
+    設置 PROMPT_RAG_RECORD 時經由真實 API 並錄製回應。
+    """
+    with _default_lock:
+        if _default["client"] is None:
+            from source_code.config import REPLAY_CONFIG
+            if REPLAY_CONFIG["offline"]:
+                from source_code.replay import ReplayOpenAIClient
+                _default["client"] = ReplayOpenAIClient()
+            elif REPLAY_CONFIG["record_path"]:
+                from source_code.replay import RecordingOpenAIClient
+                _default["client"] = RecordingOpenAIClient()
+            else:
+                _default["client"] = OpenAIClient()
+        return _default["client"]
+
+
+def _after_fork_in_child():
+    # 子進程不可沿用父進程的連線與鎖
+    global _default_lock
+    _default_lock = threading.Lock()
+    for client in list(_clients):
+        client._reset_state()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+過濾搜索的游標分頁
+
+第一頁執行一次向量檢索，取回至多 max_candidates 個排序好的候選 (只保存 id、距離與精簡 metadata)，
+以隨機結果集 ID 存入 CursorStore；之後的頁面直接從候選列表切片，不再 embedding 或檢索。
+
+游標格式為 "<結果集 ID>.<偏移>.<每頁結果數>"：只帶游標的後續請求沿用首頁的每頁結果數
+(游標落到其他 worker、需要重建候選時亦同)。結果集受 TTL、條目數與候選總數上限約束，
+超出時淘汰最久未使用的結果集。結果集記錄建立時的索引版本，熱重載切換版本後視為未命中。
+"""
+
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from source_code.config import PAGINATION_CONFIG
+
+
+def make_cursor(result_set_id: str, offset: int, page_size: int) -> str:
+    return f"{result_set_id}.{offset}.{page_size}"
+
+
+def parse_cursor(cursor: str) -> Tuple[str, int, Optional[int]]:
+    """解析游標為 (結果集 ID, 偏移, 每頁結果數)，格式錯誤時拋出 ValueError
+
+    不含每頁結果數的舊格式游標 "<結果集 ID>.<偏移>" 仍可解析，每頁結果數為 None。
+    """
+    parts = cursor.split(".")
+    if len(parts) not in (2, 3) or not parts[0] or not all(part.isdigit() for part in parts[1:]):
+        raise ValueError(f"無效的游標：{cursor}")
+    page_size = int(parts[2]) if len(parts) == 3 else None
+    return parts[0], int(parts[1]), page_size
+
+
+class CursorStore:
+    """保存排序候選列表的 LRU + TTL 存儲 (線程安全)"""
+
+    def __init__(
+        self,
+        ttl: Optional[float] = None,
+        max_result_sets: Optional[int] = None,
+        max_items: Optional[int] = None
+    ):
+        self.ttl = ttl or PAGINATION_CONFIG["cursor_ttl"]
+        self.max_result_sets = max_result_sets or PAGINATION_CONFIG["max_result_sets"]
+        self.max_items = max_items or PAGINATION_CONFIG["max_cached_candidates"]
+        self._entries = OrderedDict()
+        self._items = 0
+        self._lock = threading.Lock()
+        self.stats = {"created": 0, "hits": 0, "misses": 0, "evicted": 0}
+
+    def put(self, candidates: List[Dict[str, Any]], version: int = 0) -> str:
+        """保存候選列表 (version 為建立時的索引版本)，返回結果集 ID"""
+        result_set_id = secrets.token_urlsafe(9)
+        with self._lock:
+            self._expire(time.monotonic())
+            self._entries[result_set_id] = (time.monotonic() + self.ttl, candidates, version)
+            self._items += len(candidates)
+            self.stats["created"] += 1
+            # 條目數或候選總數超出上限時淘汰最舊的結果集 (剛放入的除外)
+            while len(self._entries) > 1 and (
+                len(self._entries) > self.max_result_sets or self._items > self.max_items
+            ):
+                self._pop_oldest()
+        return result_set_id
+
+    def get(self, result_set_id: str, version: int = 0) -> Optional[List[Dict[str, Any]]]:
+        """取回候選列表並延長 TTL；不存在、已過期或屬於其他索引版本時返回 None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(result_set_id)
+            if entry is None or entry[0] < now or entry[2] != version:
+                if entry is not None:
+                    self._remove(result_set_id)
+                self.stats["misses"] += 1
+                return None
+            self._entries[result_set_id] = (now + self.ttl, entry[1], version)
+            self._entries.move_to_end(result_set_id)
+            self.stats["hits"] += 1
+            return entry[1]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def drop_version(self, version: int):
+        """淘汰指定索引版本的所有結果集"""
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if entry[2] == version]
+            for key in stale:
+                self._remove(key)
+            self.stats["evicted"] += len(stale)
+
+    def _expire(self, now: float):
+        expired = [key for key, entry in self._entries.items() if entry[0] < now]
+        for key in expired:
+            self._remove(key)
+            self.stats["evicted"] += 1
+
+    def _pop_oldest(self):
+        key = next(iter(self._entries))
+        self._remove(key)
+        self.stats["evicted"] += 1
+
+    def _remove(self, key: str):
+        _, candidates, _ = self._entries.pop(key)
+        self._items -= len(candidates)
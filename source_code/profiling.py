@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+單次查詢 profiling
+
+以 cProfile 包裹一個請求，將 profile 以請求 ID 命名寫入 PROFILING_CONFIG["output_dir"]，
+並整理出累計耗時最高的函數，供回應的 debug 區塊使用。
+
+觸發方式：
+- 環境變數 PROMPT_RAG_PROFILE=1：每個請求都嘗試 profile
+- 環境變數 PROMPT_RAG_PROFILE_SAMPLE_RATE=0.01：按比例抽樣
+- query(..., profile=True)：單次請求強制嘗試
+
+開銷上限：同一時間只 profile 一個請求，每分鐘次數與輸出文件數均有上限，
+超出時請求照常執行、不做 profile。
+"""
+
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from source_code.config import PROFILING_CONFIG
+
+_lock = threading.Lock()
+_active = threading.Lock()
+_bucket = {"tokens": float(PROFILING_CONFIG["max_profiles_per_minute"]), "updated": time.monotonic()}
+
+
+class ProfileSession:
+    """一次 profiling 的結果"""
+
+    def __init__(self, request_id: str):
+        import cProfile
+
+        self.request_id = request_id
+        self.path = None
+        self.summary = None
+        self._profiler = cProfile.Profile()
+        self._start = None
+
+    def start(self):
+        self._start = time.perf_counter()
+        self._profiler.enable()
+
+    def finish(self):
+        """停止 profiling、寫出文件並整理摘要"""
+        self._profiler.disable()
+        wall_ms = (time.perf_counter() - self._start) * 1000
+
+        output_dir = PROFILING_CONFIG["output_dir"]
+        os.makedirs(output_dir, exist_ok=True)
+        self.path = os.path.join(output_dir, f"query-{self.request_id}.prof")
+        self._profiler.dump_stats(self.path)
+        _prune_profiles(output_dir, PROFILING_CONFIG["max_files"])
+
+        self.summary = {
+            "request_id": self.request_id,
+            "profile_path": self.path,
+            "wall_ms": round(wall_ms, 3),
+            "top_functions": self._top_functions(PROFILING_CONFIG["top_n"])
+        }
+
+    def _top_functions(self, top_n: int) -> List[Dict[str, Any]]:
+        """按累計時間排序的熱點函數"""
+        import pstats
+
+        stats = pstats.Stats(self._profiler)
+        rows = []
+        for (filename, line, name), (_, calls, total, cumulative, _) in stats.stats.items():
+            rows.append({
+                "function": f"{os.path.basename(filename)}:{line}({name})",
+                "calls": calls,
+                "total_ms": round(total * 1000, 3),
+                "cumulative_ms": round(cumulative * 1000, 3)
+            })
+        rows.sort(key=lambda row: row["cumulative_ms"], reverse=True)
+        return rows[:top_n]
+
+
+def _take_token() -> bool:
+    """每分鐘次數上限 (token bucket)"""
+    capacity = PROFILING_CONFIG["max_profiles_per_minute"]
+    with _lock:
+        now = time.monotonic()
+        _bucket["tokens"] = min(capacity, _bucket["tokens"] + (now - _bucket["updated"]) * capacity / 60.0)
+        _bucket["updated"] = now
+        if _bucket["tokens"] < 1:
+            return False
+        _bucket["tokens"] -= 1
+        return True
+
+
+def _prune_profiles(output_dir: str, max_files: int):
+    """只保留最新的 max_files 個 profile 文件"""
+    try:
+        paths = [
+            os.path.join(output_dir, name) for name in os.listdir(output_dir)
+            if name.endswith(".prof")
+        ]
+        if len(paths) <= max_files:
+            return
+        paths.sort(key=os.path.getmtime)
+        for path in paths[:len(paths) - max_files]:
+            os.remove(path)
+    except OSError as e:
+        print(f"清理 profile 文件失敗：{str(e)}")
+
+
+def should_profile(force: bool = False) -> bool:
+    """判斷本次請求是否 profile (開關、抽樣、次數上限)"""
+    if not force and not PROFILING_CONFIG["enabled"]:
+        sample_rate = PROFILING_CONFIG["sample_rate"]
+        if sample_rate <= 0 or random.random() >= sample_rate:
+            return False
+    return _take_token()
+
+
+@contextmanager
+def profile_request(request_id: str, force: bool = False):
+    """可能對請求做 profiling 的 context manager
+
+    Args:
+        request_id: 請求 ID，用於命名 profile 文件
+        force: 單次請求強制嘗試 (仍受次數上限約束)
+
+    Yields:
+        ProfileSession 或 None (未被選中時)；區塊結束後 session.summary 可用
+    """
+    if not should_profile(force) or not _active.acquire(blocking=False):
+        yield None
+        return
+
+    session: Optional[ProfileSession] = None
+    try:
+        session = ProfileSession(request_id)
+        session.start()
+        yield session
+    finally:
+        try:
+            if session is not None:
+                session.finish()
+        except Exception as e:
+            print(f"profile 輸出失敗：{str(e)}")
+        finally:
+            _active.release()
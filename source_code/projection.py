@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+降維檢索向量
+
+幾千筆 prompt 文檔用不到 1536 維的 ada-002 向量做第一階段檢索。這裡在 ingest (匯出快照) 時
+擬合 PCA 並與 collection 一起保存：第一階段在 128 / 256 維的投影向量上搜索，
+前 rerank_depth 個候選再以原始向量計算精確距離重排；查詢向量即時投影。
+
+投影到正交子空間後的 L2 距離不大於原始 L2 距離 (下界)，
+因此重排深度足夠時結果與全精度搜索一致。
+"""
+
+import os
+from typing import Optional
+
+PROJECTION_FILE = "projection.npz"
+
+
+class PCAProjection:
+    """以主成分投影向量：(x - mean) @ components"""
+
+    def __init__(self, mean, components, explained_variance: Optional[float] = None):
+        self.mean = mean
+        self.components = components
+        self.explained_variance = explained_variance
+
+    @property
+    def dimensions(self) -> int:
+        return int(self.components.shape[1])
+
+    @classmethod
+    def fit(cls, vectors, dimensions: int) -> "PCAProjection":
+        """擬合 PCA
+
+        Args:
+            vectors: (n, d) 向量矩陣
+            dimensions: 目標維度，超過 min(n, d) 時截斷
+        """
+        import numpy as np
+
+        matrix = np.asarray(vectors, dtype=np.float64)
+        mean = matrix.mean(axis=0)
+        centered = matrix - mean
+        dimensions = max(1, min(dimensions, *centered.shape))
+
+        if centered.shape[0] < centered.shape[1]:
+            # 文檔數少於維度：對資料矩陣做 SVD
+            _, singular, vt = np.linalg.svd(centered, full_matrices=False)
+            variances = singular ** 2
+            components = vt[:dimensions].T
+        else:
+            # 文檔數多：對 d × d 協方差矩陣做特徵分解
+            variances, vectors_ = np.linalg.eigh(centered.T @ centered)
+            order = np.argsort(variances)[::-1]
+            variances = variances[order]
+            components = vectors_[:, order[:dimensions]]
+
+        total = float(variances.sum()) or 1.0
+        explained = float(variances[:dimensions].sum()) / total
+        return cls(mean.astype(np.float32), components.astype(np.float32), explained)
+
+    def transform(self, vectors):
+        import numpy as np
+
+        matrix = np.asarray(vectors, dtype=np.float32)
+        return (matrix - self.mean) @ self.components
+
+    def save(self, directory: str):
+        import numpy as np
+
+        np.savez(
+            os.path.join(directory, PROJECTION_FILE),
+            mean=self.mean,
+            components=self.components,
+            explained_variance=np.float64(self.explained_variance or 0.0)
+        )
+
+    @classmethod
+    def load(cls, directory: str) -> "PCAProjection":
+        import numpy as np
+
+        with np.load(os.path.join(directory, PROJECTION_FILE)) as data:
+            return cls(data["mean"], data["components"], float(data["explained_variance"]))
+
+
+def two_stage_search(query, query_projected, projected, projected_norms, vectors, norms, k: int, depth: int, rows=None):
+    """投影空間粗排 + 原始向量精確重排
+
+    Args:
+        query / query_projected: 原始查詢向量 (d,) 與其投影
+        projected / projected_norms: 投影後的文檔向量與平方範數
+        vectors / norms: 原始文檔向量與平方範數 (可為 mmap，只讀取候選行)
+        k: 返回數
+        depth: 重排的候選數 (0 表示不重排，直接以投影距離排序)
+        rows: 可選的候選行號 (例如 where 過濾後)，None 表示全部
+
+    Returns:
+        (行號列表, 平方 L2 距離列表)，按距離遞增
+    """
+    import numpy as np
+
+    if rows is not None:
+        projected, projected_norms = projected[rows], projected_norms[rows]
+    count = len(projected_norms)
+    if count == 0 or k <= 0:
+        return [], []
+
+    coarse = projected_norms + float(query_projected @ query_projected) - 2 * (projected @ query_projected)
+    keep = min(max(k, depth), count)
+    top = np.argpartition(coarse, keep - 1)[:keep]
+    candidates = top if rows is None else rows[top]
+
+    if depth:
+        order = np.sort(candidates)  # 按行號順序讀取 mmap，減少隨機 I/O
+        exact = norms[order] + float(query @ query) - 2 * (vectors[order] @ query)
+        best = np.argsort(exact)[:k]
+        return order[best].tolist(), [float(max(d, 0.0)) for d in exact[best]]
+
+    best = np.argsort(coarse[top])[:k]
+    return candidates[best].tolist(), [float(max(d, 0.0)) for d in coarse[top][best]]
@@ -15,48 +15,135 @@ Prompt 生成器 RAG 系統
 創建日期：2025-06-17
 """
 
+import functools
 import os
-import pandas as pd
-import numpy as np
 import re
+import threading
+import time
 import uuid
-import chromadb
-from chromadb.config import Settings
-from chromadb.utils import embedding_functions
+from collections import OrderedDict
 from typing import List, Dict, Any, Optional
 
-# LlamaIndex 導入
-from llama_index.core import VectorStoreIndex, StorageContext
-from llama_index.core.schema import TextNode
-from llama_index.vector_stores.chroma import ChromaVectorStore
-from llama_index.embeddings.openai import OpenAIEmbedding
-from llama_index.llms.openai import OpenAI
-from llama_index.core import Settings as LlamaSettings
+from source_code.config import (
+    CONTEXT_QUERY_CONFIG,
+    DEDUP_CONFIG,
+    DOC_STORE_CONFIG,
+    HOT_RELOAD_CONFIG,
+    MMR_CONFIG,
+    OPENAI_CLIENT_CONFIG,
+    PAGINATION_CONFIG,
+    PROCESSED_DATASET,
+    REPLAY_CONFIG,
+    RERANK_CONFIG
+)
+from source_code.hot_reload import IndexVersion, VersionedIndex
+from source_code.pagination import CursorStore, make_cursor, parse_cursor
+from source_code.profiling import profile_request
+from source_code.telemetry import stage
+
+# pandas、numpy、chromadb 與 LlamaIndex 均為重量級依賴，
+# 延遲到實際需要的功能第一次被調用時才導入，以縮短冷啟動時間
 
 # 系統配置
 def setup_environment(openai_api_key: str):
     """設置環境和 LlamaIndex 配置"""
+    from llama_index.core import Settings as LlamaSettings
+    from llama_index.embeddings.openai import OpenAIEmbedding
+    from llama_index.llms.openai import OpenAI
+    
     os.environ["OPENAI_API_KEY"] = openai_api_key
-    LlamaSettings.llm = OpenAI(model="gpt-3.5-turbo", temperature=0.1)
-    LlamaSettings.embed_model = OpenAIEmbedding(model="text-embedding-ada-002")
+    # LlamaIndex 使用自己的 HTTP 傳輸，但端點、重試次數與期限與共用客戶端一致
+    client_options = {
+        "api_base": OPENAI_CLIENT_CONFIG["base_url"],
+        "max_retries": OPENAI_CLIENT_CONFIG["max_retries"],
+        "timeout": OPENAI_CLIENT_CONFIG["deadline"]
+    }
+    if REPLAY_CONFIG["offline"]:
+        # 離線模式：LlamaIndex 改為呼叫進程內的重放替身服務
+        from source_code.replay import ensure_standin_server
+        client_options["api_base"] = ensure_standin_server()
+    LlamaSettings.llm = OpenAI(model="gpt-3.5-turbo", temperature=0.1, **client_options)
+    LlamaSettings.embed_model = OpenAIEmbedding(model="text-embedding-ada-002", **client_options)
+
+def pinned_version(method):
+    """在單一索引版本上執行方法：熱重載切換版本時，進行中的呼叫仍使用開始時的版本"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if getattr(self._pinned, "version", None) is not None:
+            return method(self, *args, **kwargs)
+        with self.index.acquire() as version:
+            self._pinned.version = version
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                self._pinned.version = None
+    return wrapper
 
 # [在這裡插入所有的類定義：SmartChunkingStrategy, ChromaMixedArchitectureFixed, HybridSearchStrategy, PromptGeneratorRAGSystem]
 
 class PromptGeneratorRAGSystem:
-    def __init__(self):
-        """初始化 RAG 系統"""
+    def __init__(
+        self,
+        embedding_function=None,
+        dataset_path: Optional[str] = None,
+        collection=None,
+        deduplicate: Optional[bool] = None,
+        reranker=None
+    ):
+        """初始化 RAG 系統
+        
+        Args:
+            embedding_function: 可選的 embedding 函數 (接收文本列表、返回向量列表)，
+                未提供時經由共用的 OpenAI 客戶端使用 text-embedding-ada-002
+            dataset_path: 可選的數據集 CSV 路徑，預設為 dataset/processed_dataset.csv
+            collection: 可選的預建 collection (例如唯讀的 SnapshotCollection)，
+                提供時不建立 Chroma 客戶端
+            deduplicate: ingest 時是否合併近似重複的 prompt，未提供時依 DEDUP_CONFIG
+            reranker: 可選的第二階段 reranker (見 source_code/rerank.py)，未提供時依 RERANK_CONFIG
+        """
         try:
-            # 初始化 Chroma 客戶端
-            self.chroma_client = chromadb.Client()
-            
-            # 創建或獲取 collection
-            self.collection = self.chroma_client.get_or_create_collection(
-                name="prompts",
-                embedding_function=embedding_functions.OpenAIEmbeddingFunction(
-                    api_key=os.getenv("OPENAI_API_KEY"),
-                    model_name="text-embedding-ada-002"
-                )
-            )
+            self.dataset_path = dataset_path or str(PROCESSED_DATASET)
+            self.deduplicate = DEDUP_CONFIG["enabled"] if deduplicate is None else deduplicate
+            
+            # 初始化 embedding 函數與 LRU 快取
+            if embedding_function is None:
+                from source_code.openai_client import PooledEmbeddingFunction
+                embedding_function = PooledEmbeddingFunction(model="text-embedding-ada-002")
+            self.embedding_function = embedding_function
+            self._embedding_cache = OrderedDict()
+            self._embedding_lock = threading.Lock()
+            self.embedding_cache_stats = {"hits": 0, "misses": 0}
+            self._document_cache = OrderedDict()
+            self._document_lock = threading.Lock()
+            self.document_cache_stats = {"hits": 0, "misses": 0}
+            self.cursor_store = CursorStore()
+            self._record_index_lock = threading.Lock()
+            self._reload_lock = threading.Lock()
+            self._pinned = threading.local()
+            
+            # 第二階段重排 (在請求路徑之外先載入模型或特徵數據)
+            if reranker is None:
+                from source_code.rerank import build_reranker
+                reranker = build_reranker(dataset_path=self.dataset_path)
+            if reranker is not None and hasattr(reranker, "prepare"):
+                reranker.prepare()
+            self.reranker = reranker
+            self._rerank_lock = threading.Lock()
+            self.rerank_stats = {"requests": 0, "applied": 0, "fallbacks": 0, "total_ms": 0.0}
+            
+            # 創建 collection（向量由系統自行計算後傳入，collection 不綁定 embedding 函數）
+            # chromadb.Client() 為進程共用：名稱帶隨機後綴，每個引擎只建立、替換與刪除自己的 collection
+            if collection is not None:
+                self.chroma_client = None
+            else:
+                import chromadb
+                self.chroma_client = chromadb.Client()
+                collection = self._document_collection(self.chroma_client.create_collection(
+                    name=f"prompts_{uuid.uuid4().hex[:8]}",
+                    embedding_function=None
+                ))
+            # 查詢經由版本句柄取得 collection，熱重載時原子替換
+            self.index = VersionedIndex(IndexVersion(1, collection, on_retire=self._retire_version))
             
             # 初始化系統狀態
             self._initialize_system()
@@ -64,6 +151,72 @@ class PromptGeneratorRAGSystem:
         except Exception as e:
             raise Exception(f"RAG 系統初始化失敗：{str(e)}")
     
+    @property
+    def version(self) -> IndexVersion:
+        """目前的索引版本 (查詢進行中為查詢開始時固定的版本)"""
+        return getattr(self._pinned, "version", None) or self.index.current
+    
+    @property
+    def collection(self):
+        return self.version.collection
+    
+    @classmethod
+    def from_backup(
+        cls,
+        backup_dir: str,
+        embedding_function=None,
+        dataset_path: Optional[str] = None,
+        writable: bool = False,
+        verify: bool = True
+    ) -> "PromptGeneratorRAGSystem":
+        """由可攜向量快照 (見 source_code/vector_snapshot.py) 啟動，不重新 embedding 數據集
+        
+        Args:
+            backup_dir: 快照目錄 (python -m source_code.cli export 的輸出)
+            embedding_function: 查詢使用的 embedding 函數，須與快照的 embedding 模型一致
+            dataset_path: 熱重載時使用的數據集 CSV
+            writable: False 時以 mmap 唯讀開啟快照 (最快)；True 時批量載入新的 Chroma collection，
+                之後可熱重載 (未變更的 prompt 沿用快照中的向量)
+            verify: 是否先校驗文件的 SHA-256
+        
+        Raises:
+            ValueError: 快照無效、校驗失敗或 embedding 模型不符
+        """
+        from source_code.vector_snapshot import (
+            SnapshotCollection, embedding_model_name, import_snapshot, read_manifest, verify_snapshot
+        )
+        
+        manifest = verify_snapshot(backup_dir) if verify else read_manifest(backup_dir)
+        if manifest is None:
+            raise ValueError(f"無效的向量快照：{backup_dir}")
+        expected_model = embedding_model_name(embedding_function)
+        if manifest.get("embedding_model") != expected_model:
+            raise ValueError(f"快照的 embedding 模型為 {manifest.get('embedding_model')}，查詢將使用 {expected_model}")
+        
+        if not writable:
+            collection = SnapshotCollection(backup_dir)
+            collection.warm()
+            return cls(embedding_function=embedding_function, dataset_path=dataset_path, collection=collection)
+        
+        import chromadb
+        client = chromadb.Client()
+        collection = cls._document_collection(
+            client.create_collection(name=f"prompts_{uuid.uuid4().hex[:8]}", embedding_function=None)
+        )
+        import_snapshot(backup_dir, collection)
+        system = cls(embedding_function=embedding_function, dataset_path=dataset_path, collection=collection)
+        # 引擎擁有這個 collection：熱重載建立新版本並在舊版本 retire 時刪除
+        system.chroma_client = client
+        return system
+    
+    @staticmethod
+    def _document_collection(collection):
+        """DOC_STORE_CONFIG 啟用時以壓縮文檔存儲包裝 Chroma collection (全文不寫入 Chroma)"""
+        if not DOC_STORE_CONFIG["enabled"]:
+            return collection
+        from source_code.doc_store import DocumentStoreCollection
+        return DocumentStoreCollection(collection)
+    
     def _initialize_system(self):
         """初始化系統狀態"""
         try:
@@ -73,73 +226,296 @@ class PromptGeneratorRAGSystem:
         except Exception as e:
             raise Exception(f"系統狀態初始化失敗：{str(e)}")
     
-    def process_dataset(self):
-        """處理並載入數據集到 Chroma"""
+    def process_dataset(self, dataset_path: Optional[str] = None):
+        """處理並載入數據集到 Chroma
+        
+        Args:
+            dataset_path: 可選的數據集 CSV 路徑，未提供時使用初始化時的路徑
+        """
         try:
-            # 讀取數據集
-            df = pd.read_csv("dataset/processed_dataset.csv")
-            
-            # 準備數據
-            documents = df["prompt_text"].tolist()
-            metadatas = df[["prompt_type", "complexity"]].to_dict('records')
-            ids = [str(uuid.uuid4()) for _ in range(len(df))]
+            with stage("rag.process_dataset") as ingest_stage:
+                prepared = self._prepare_dataset(dataset_path)
+                ingest_stage.set_attribute("documents", len(prepared["documents"]))
+                self._ingest(self.collection, prepared)
             
-            # 批量添加到 collection
-            self.collection.add(
-                documents=documents,
-                metadatas=metadatas,
-                ids=ids
-            )
+            print(f"成功載入 {len(prepared['indexed'])} 條數據到 Chroma")
             
-            print(f"成功載入 {len(documents)} 條數據到 Chroma")
+            # 預設數據集以 record_id 為文檔 ID 時，一併重建記錄層級索引
+            if self._uses_default_dataset(prepared["ids"], dataset_path):
+                try:
+                    from source_code.record_index import build_record_index
+                    with stage("rag.ingest.record_index"):
+                        self.version.record_index = build_record_index(prompt_ids=prepared["ids"])
+                except Exception as e:
+                    print(f"記錄索引建立失敗：{str(e)}")
+            else:
+                # 其他數據集的文檔 ID 與預設數據集的記錄無關，不可載入預設的記錄索引
+                self.version.record_index = False
             return True
             
         except Exception as e:
             print(f"數據集處理錯誤：{str(e)}")
             return False
     
-    def apply_user_filter(self, query: str, filters: Dict[str, Any]) -> Dict[str, Any]:
+    def _prepare_dataset(self, dataset_path: Optional[str] = None) -> Dict[str, Any]:
+        """讀取數據集並準備文檔、metadata 與 ID (含近似重複合併)
+        
+        Returns:
+            {"ids", "documents", "metadatas", "indexed", "expected_outputs", "doc_store_path"}，
+            indexed 為需要索引的行號 (每群的代表)；expected_outputs 與 doc_store_path 只在啟用壓縮文檔存儲時提供，否則為 None
+        """
+        from source_code.dataset_store import get_dataset_store
+        
+        # 讀取數據集 (型別化快照，只載入需要的欄位)
+        with stage("rag.ingest.read"):
+            store = get_dataset_store(dataset_path or self.dataset_path)
+            wanted = ["good_prompt", "prompt_type", "complexity", "record_id"]
+            if DOC_STORE_CONFIG["enabled"]:
+                wanted.append("expected_answer")
+            df = store.load([column for column in wanted if column in store.column_names()])
+        
+        # 準備數據
+        documents = df["good_prompt"].tolist()
+        metadatas = df[["prompt_type", "complexity"]].to_dict('records')
+        # 以 record_id 作為穩定的文檔 ID，與 processed_chunks.json 的 source_record_id 一致
+        if "record_id" in df.columns and df["record_id"].is_unique:
+            ids = [f"record_{record_id}" for record_id in df["record_id"]]
+            for metadata, doc_id in zip(metadatas, ids):
+                metadata["source_record_id"] = doc_id
+        else:
+            ids = [str(uuid.uuid4()) for _ in range(len(df))]
+        
+        # 近似重複合併：只 embedding 與索引每群的代表，別名記錄在代表的 metadata
+        indexed = list(range(len(documents)))
+        if self.deduplicate and len(documents) > 1:
+            from source_code.dedup import alias_map, cluster_near_duplicates
+            with stage("rag.ingest.dedup") as dedup_stage:
+                representatives = cluster_near_duplicates(
+                    [text if isinstance(text, str) else "" for text in documents],
+                    groups=[(metadata["prompt_type"], metadata["complexity"]) for metadata in metadatas]
+                )
+                aliases = alias_map(ids, representatives)
+                indexed = [i for i, representative in enumerate(representatives) if representative == i]
+                for i in indexed:
+                    if ids[i] in aliases:
+                        metadatas[i]["alias_count"] = len(aliases[ids[i]])
+                        metadatas[i]["aliases"] = ",".join(aliases[ids[i]])
+                dedup_stage.set_attribute("collapsed", len(documents) - len(indexed))
+            if len(indexed) < len(documents):
+                print(f"近似重複合併：{len(documents)} 條 → {len(indexed)} 個代表")
+        
+        expected_outputs = None
+        if "expected_answer" in df.columns:
+            expected_outputs = [text if isinstance(text, str) else None for text in df["expected_answer"]]
+        
+        return {
+            "ids": ids,
+            "documents": documents,
+            "metadatas": metadatas,
+            "indexed": indexed,
+            "expected_outputs": expected_outputs,
+            # 壓縮文檔存儲放在數據集快照旁，內容不變時下次啟動直接開啟
+            "doc_store_path": store.artifact_path("documents.docs") if expected_outputs is not None else None
+        }
+    
+    def _ingest(self, collection, prepared: Dict[str, Any], previous=None, batch_size: int = 500) -> Dict[str, int]:
+        """將準備好的數據分批 embedding 後添加到 collection
+        
+        提供 previous (上一版本的 collection) 時，ID 與文本都未變的 prompt 直接重用其 embedding。
+        collection 為壓縮文檔存儲包裝時，期望輸出一併寫入存儲，全部寫入後才壓縮 (seal)。
+        
+        Returns:
+            {"documents", "reused", "embedded"}
+        """
+        ids, documents, metadatas = prepared["ids"], prepared["documents"], prepared["metadatas"]
+        indexed = prepared["indexed"]
+        expected_outputs = prepared.get("expected_outputs") if hasattr(collection, "seal") else None
+        reused = 0
+        for start in range(0, len(indexed), batch_size):
+            batch = indexed[start:start + batch_size]
+            texts = [documents[i] for i in batch]
+            batch_ids = [ids[i] for i in batch]
+            
+            embeddings = [None] * len(batch)
+            if previous is not None:
+                old = previous.get(ids=batch_ids, include=["embeddings", "documents"])
+                known = dict(zip(old["ids"], zip(old["documents"], old["embeddings"])))
+                for j, doc_id in enumerate(batch_ids):
+                    if doc_id in known and known[doc_id][0] == texts[j]:
+                        vector = known[doc_id][1]
+                        embeddings[j] = vector.tolist() if hasattr(vector, "tolist") else list(vector)
+            missing = [j for j, vector in enumerate(embeddings) if vector is None]
+            reused += len(batch) - len(missing)
+            if missing:
+                with stage("rag.embed", texts=len(missing)):
+                    fresh = self.embedding_function([texts[j] for j in missing])
+                for j, vector in zip(missing, fresh):
+                    embeddings[j] = vector
+            
+            extra = {}
+            if expected_outputs is not None:
+                extra["fields"] = {"expected_output": [expected_outputs[i] for i in batch]}
+            with stage("rag.ingest.add", documents=len(batch)):
+                collection.add(
+                    documents=texts,
+                    embeddings=embeddings,
+                    metadatas=[metadatas[i] for i in batch],
+                    ids=batch_ids,
+                    **extra
+                )
+            if previous is not None:
+                # 背景重建：批次之間暫停，讓等待 GIL 的查詢線程先完成
+                time.sleep(HOT_RELOAD_CONFIG["batch_pause"])
+        if hasattr(collection, "seal"):
+            with stage("rag.ingest.doc_store", documents=len(indexed)):
+                collection.seal(prepared.get("doc_store_path"))
+        return {"documents": len(indexed), "reused": reused, "embedded": len(indexed) - reused}
+    
+    def _uses_default_dataset(self, ids: Optional[List[str]] = None, dataset_path: Optional[str] = None) -> bool:
+        """是否為以 record_id 為文檔 ID 的預設數據集 (記錄層級索引只對應預設數據集)；未提供 ids 時只比較數據集路徑"""
+        if ids is not None and not (ids and ids[0].startswith("record_")):
+            return False
+        return os.path.abspath(dataset_path or self.dataset_path) == os.path.abspath(PROCESSED_DATASET)
+    
+    def reload(self, dataset_changed: bool = True, chunks_changed: bool = True) -> Dict[str, Any]:
+        """建立新的索引版本並原子切換 (熱重載，通常由 DatasetWatcher 在背景線程呼叫)
+        
+        數據集變更時建立新 collection，ID 與文本都未變的 prompt 重用目前版本的 embedding，
+        只對新增或修改的 prompt 呼叫 embedding；只有 chunk 文件變更時沿用目前的 collection，
+        僅重建記錄層級索引。建立期間查詢照常由目前版本服務，任何步驟失敗時保留目前版本。
+        
+        Args:
+            dataset_changed: 數據集 CSV 是否變更
+            chunks_changed: processed_chunks.json 是否變更
+            
+        Returns:
+            {"version", "documents", "reused", "embedded", "duration"}；失敗時為 {"error"}
+        """
+        if self.chroma_client is None:
+            return {"error": "預建的 collection (例如唯讀快照) 不支援熱重載"}
+        
+        with self._reload_lock:
+            started = time.perf_counter()
+            current = self.index.current
+            number = current.number + 1
+            collection, prepared = current.collection, None
+            try:
+                with stage("rag.reload", version=number, dataset_changed=dataset_changed, chunks_changed=chunks_changed):
+                    summary = {"documents": current.collection.count(), "reused": 0, "embedded": 0}
+                    if dataset_changed:
+                        prepared = self._prepare_dataset()
+                        collection = self._document_collection(self.chroma_client.create_collection(
+                            name=f"prompts_v{number}_{uuid.uuid4().hex[:8]}",
+                            embedding_function=None
+                        ))
+                        summary = self._ingest(
+                            collection, prepared,
+                            previous=current.collection,
+                            batch_size=HOT_RELOAD_CONFIG["batch_size"]
+                        )
+                    
+                    record_index = None
+                    if self._uses_default_dataset(prepared["ids"] if prepared else None):
+                        from source_code.record_index import build_record_index
+                        with stage("rag.ingest.record_index"):
+                            record_index = build_record_index(prompt_ids=prepared["ids"] if prepared else None)
+            except Exception as e:
+                if collection is not current.collection:
+                    try:
+                        self.chroma_client.delete_collection(collection.name)
+                    except Exception:
+                        pass
+                print(f"熱重載失敗，繼續使用 v{current.number}：{str(e)}")
+                return {"error": str(e)}
+            
+            version = IndexVersion(number, collection, record_index, on_retire=self._retire_version)
+            if collection is current.collection:
+                # collection 由新版本接管 (連同是否擁有)，舊版本 retire 時不刪除
+                version.owns_collection = current.owns_collection
+                current.owns_collection = False
+            self.index.swap(version)
+        
+        summary.update(version=number, duration=round(time.perf_counter() - started, 3))
+        print(
+            f"索引已更新至 v{number}：{summary['documents']} 條 "
+            f"(重用 {summary['reused']}，新 embedding {summary['embedded']})，耗時 {summary['duration']:.2f}s"
+        )
+        return summary
+    
+    def _retire_version(self, version: IndexVersion):
+        """舊索引版本不再有查詢使用時：刪除其 collection，清除以該版本為鍵的快取"""
+        if version.owns_collection and self.chroma_client is not None:
+            self.chroma_client.delete_collection(version.collection.name)
+        with self._document_lock:
+            for key in [key for key in self._document_cache if key[0] == version.number]:
+                del self._document_cache[key]
+        self.cursor_store.drop_version(version.number)
+    
+    @pinned_version
+    def apply_user_filter(
+        self,
+        query: str,
+        filters: Dict[str, Any],
+        lazy: bool = False,
+        page_size: Optional[int] = None,
+        cursor: Optional[str] = None,
+        bundles: bool = False
+    ) -> Dict[str, Any]:
         """執行過濾搜索
         
+        提供 page_size 或 cursor 時為分頁模式：首頁檢索一次並保存排序候選，
+        之後以返回的 next_cursor 取下一頁，不再重新 embedding 或檢索。
+        游標過期 (或由另一個 worker 建立) 時以相同查詢重新檢索，從游標的偏移繼續。
+        
         Args:
             query: 用戶搜索查詢
             filters: 過濾條件，包含 prompt_type 和 complexity
+            lazy: 為 True 時結果只含 id、分數與 metadata，全文以 get_documents 按需載入
+            page_size: 每頁結果數，未提供時沿用游標記錄的值，首頁則使用 PAGINATION_CONFIG (僅分頁模式)
+            cursor: 上一頁返回的 next_cursor
+            bundles: 為 True 時每個結果附帶同一記錄的上下文、prompt 與期望輸出 (bundle)
             
         Returns:
-            搜索結果字典
+            搜索結果字典；分頁模式下 total_found 為可翻頁的候選總數，並附帶 offset 與 next_cursor
         """
         try:
-            # 構建查詢條件
-            where_clause = {}
-            if "prompt_type" in filters and filters["prompt_type"]:
-                where_clause["prompt_type"] = filters["prompt_type"]
-            if "complexity" in filters and filters["complexity"]:
-                where_clause["complexity"] = filters["complexity"]
-            
-            # 執行向量搜索
-            results = self.collection.query(
-                query_texts=[query],
-                n_results=10,
-                where=where_clause if where_clause else None
-            )
+            where_clause = self._build_where(filters)
             
-            # 格式化結果
-            formatted_results = []
-            if results['ids'] and len(results['ids'][0]) > 0:
-                for i in range(len(results['ids'][0])):
-                    formatted_results.append({
-                        "text": results['documents'][0][i],
-                        "score": float(results['distances'][0][i]),
-                        "metadata": {
-                            "prompt_type": results['metadatas'][0][i].get('prompt_type'),
-                            "complexity": results['metadatas'][0][i].get('complexity')
-                        }
-                    })
+            if page_size is not None or cursor:
+                page = self._filtered_page(query, where_clause, lazy, page_size, cursor)
+                if bundles:
+                    self._attach_bundles(page["results"])
+                return page
             
-            return {
+            with stage("rag.apply_user_filter", has_filters=bool(where_clause), query_length=len(query)):
+                # 執行向量搜索 (啟用重排時多取 top_n 個候選，重排後保留前 10 個)
+                results = self._vector_search(
+                    query_embeddings=self._embed_texts([query]),
+                    n_results=max(10, RERANK_CONFIG["top_n"]) if self.reranker is not None else 10,
+                    where=where_clause if where_clause else None,
+                    include=self._search_include(lazy)
+                )
+                results, rerank_report = self._rerank(query, results, keep=10)
+                
+                # 格式化結果
+                with stage("rag.format"):
+                    formatted_results = []
+                    if results['ids'] and len(results['ids'][0]) > 0:
+                        for i in range(len(results['ids'][0])):
+                            item = self._filter_item(results, i)
+                            if not lazy:
+                                item["text"] = results['documents'][0][i]
+                            formatted_results.append(item)
+                    if bundles:
+                        self._attach_bundles(formatted_results)
+            
+            response = {
                 "total_found": len(formatted_results),
                 "results": formatted_results
             }
+            if rerank_report is not None:
+                response["rerank"] = rerank_report
+            return response
             
         except Exception as e:
             print(f"搜索錯誤：{str(e)}")
@@ -149,33 +525,143 @@ class PromptGeneratorRAGSystem:
                 "error": str(e)
             }
     
-    def query(self, user_query: str, context: Optional[str] = None) -> Dict[str, Any]:
+    def _build_where(self, filters: Dict[str, Any]) -> Dict[str, Any]:
+        """由過濾條件構建 Chroma where 子句"""
+        where_clause = {}
+        if "prompt_type" in filters and filters["prompt_type"]:
+            where_clause["prompt_type"] = filters["prompt_type"]
+        if "complexity" in filters and filters["complexity"]:
+            where_clause["complexity"] = filters["complexity"]
+        # Chroma 的 where 只允許一個運算子，多個條件需以 $and 組合
+        if len(where_clause) > 1:
+            where_clause = {"$and": [{key: value} for key, value in where_clause.items()]}
+        return where_clause
+    
+    def _filter_item(self, results: Dict, i: int) -> Dict[str, Any]:
+        """過濾搜索的結果項 (不含全文)"""
+        item = {
+            "id": results['ids'][0][i],
+            "score": float(results['distances'][0][i]),
+            "metadata": {
+                "prompt_type": results['metadatas'][0][i].get('prompt_type'),
+                "complexity": results['metadatas'][0][i].get('complexity')
+            }
+        }
+        if results['metadatas'][0][i].get('alias_count'):
+            item["alias_count"] = results['metadatas'][0][i]['alias_count']
+        return item
+    
+    def _filtered_page(
+        self,
+        query: str,
+        where_clause: Dict[str, Any],
+        lazy: bool,
+        page_size: Optional[int],
+        cursor: Optional[str]
+    ) -> Dict[str, Any]:
+        """分頁模式的過濾搜索：從游標保存的候選列表切出一頁 (未提供 page_size 時沿用游標記錄的每頁結果數)"""
+        candidates, result_set_id, offset, rerank_report = None, None, 0, None
+        if cursor:
+            result_set_id, offset, cursor_page_size = parse_cursor(cursor)
+            page_size = page_size or cursor_page_size
+            candidates = self.cursor_store.get(result_set_id, version=self.version.number)
+        page_size = max(1, page_size or PAGINATION_CONFIG["page_size"])
+        
+        with stage("rag.apply_user_filter", has_filters=bool(where_clause), query_length=len(query),
+                   paged=True, cursor_hit=candidates is not None):
+            if candidates is None:
+                results = self._vector_search(
+                    query_embeddings=self._embed_texts([query]),
+                    n_results=PAGINATION_CONFIG["max_candidates"],
+                    where=where_clause if where_clause else None,
+                    include=self._search_include(lazy=True)
+                )
+                # 只在建立候選列表時重排一次，之後的頁面沿用保存的順序
+                results, rerank_report = self._rerank(query, results, keep=len(results['ids'][0]))
+                candidates = [self._filter_item(results, i) for i in range(len(results['ids'][0]))]
+                result_set_id = self.cursor_store.put(candidates, version=self.version.number)
+            
+            # 候選由多個請求共用，返回副本以免呼叫端寫入全文時改動存儲內容
+            page = [dict(item) for item in candidates[offset:offset + page_size]]
+            if not lazy and page:
+                documents = self.get_documents([item["id"] for item in page])
+                for item in page:
+                    item["text"] = documents.get(item["id"], "")
+        
+        next_offset = offset + page_size
+        response = {
+            "total_found": len(candidates),
+            "results": page,
+            "offset": offset,
+            "next_cursor": make_cursor(result_set_id, next_offset, page_size) if next_offset < len(candidates) else None
+        }
+        if rerank_report is not None:
+            response["rerank"] = rerank_report
+        return response
+    
+    @pinned_version
+    def query(
+        self,
+        user_query: str,
+        context: Optional[str] = None,
+        profile: bool = False,
+        lazy: bool = False,
+        bundles: bool = False,
+        diversify: Optional[bool] = None
+    ) -> Dict[str, Any]:
         """處理用戶查詢
         
         Args:
             user_query: 用戶查詢
             context: 可選的上下文內容
+            profile: 是否對本次查詢做 profiling (受 PROFILING_CONFIG 的次數上限約束)
+            lazy: 為 True 時 prompt 列表只含 id、分數與 metadata，不附全文
+            bundles: 為 True 時每個 prompt 附帶同一記錄的上下文、prompt 與期望輸出 (bundle)
+            diversify: 無上下文查詢是否以 MMR 多樣化結果，未提供時依 MMR_CONFIG
             
         Returns:
-            查詢結果字典
+            查詢結果字典；被 profile 時附帶 debug.profile 熱點摘要
         """
-        try:
-            # 根據是否有上下文選擇不同的處理邏輯
-            if context:
-                return self._handle_context_query(user_query, context)
-            else:
-                return self._handle_no_context_query(user_query)
-        except Exception as e:
-            return {"error": str(e)}
+        request_id = uuid.uuid4().hex[:16]
+        scenario = "context" if context else "no_context"
+        context_length = len(context) if isinstance(context, str) else 0
+        query_length = len(user_query) if isinstance(user_query, str) else 0
+        with stage("rag.query", scenario=scenario, context_length=context_length, query_length=query_length):
+            with profile_request(request_id, force=profile) as profile_session:
+                try:
+                    if not isinstance(user_query, str) or (context is not None and not isinstance(context, str)):
+                        raise TypeError("query 與 context 必須是字串")
+                    # 根據是否有上下文選擇不同的處理邏輯
+                    if context:
+                        result = self._handle_context_query(user_query, context, lazy=lazy)
+                    else:
+                        result = self._handle_no_context_query(user_query, lazy=lazy, diversify=diversify)
+                    if bundles and "formatted_response" in result:
+                        response = result["formatted_response"]
+                        items = response.get("source_prompts", [])
+                        for category in response.get("categories", {}).values():
+                            items = items + category["prompts"]
+                        self._attach_bundles(items)
+                except Exception as e:
+                    result = {"error": str(e)}
+        
+        if profile_session is not None and profile_session.summary:
+            result["debug"] = {"request_id": request_id, "profile": profile_session.summary}
+        return result
     
-    def _handle_context_query(self, query: str, context: str) -> Dict[str, Any]:
-        """處理有上下文的查詢"""
+    def _handle_context_query(self, query: str, context: str, lazy: bool = False) -> Dict[str, Any]:
+        """處理有上下文的查詢
+        
+        上下文切分為有界片段後與查詢一起批量 embedding，每個向量各自檢索，
+        候選以「查詢相似度 + 上下文片段 max-sim」加權聚合後排序。
+        """
         try:
-            # 使用上下文和查詢進行搜索
-            results = self.collection.query(
-                query_texts=[f"{query} {context}"],
-                n_results=3
+            context_chunks = self._split_context(context)
+            top_k = CONTEXT_QUERY_CONFIG["top_k"]
+            results = self._search_with_context_chunks(
+                query, context_chunks, lazy=lazy, n_results=self._rerank_candidates(top_k)
             )
+            results, rerank_report = self._rerank(query, results, keep=top_k)
             
             if not results['ids'] or len(results['ids'][0]) == 0:
                 return {
@@ -184,24 +670,33 @@ class PromptGeneratorRAGSystem:
                     "error": "未找到相關結果"
                 }
             
+            with stage("rag.customize", scenario="context"):
+                customized_prompt = self._generate_custom_prompt(query, context, results)
+                context_analysis = self._analyze_context(context)
+                context_analysis["chunk_count"] = len(context_chunks)
+                expected_outputs = self._expected_outputs(results['ids'][0][:1])
+            
             # 返回客製化結果
-            return {
+            response = {
                 "scenario": "context",
                 "response_mode": "customization",
                 "formatted_response": {
-                    "customized_prompt": self._generate_custom_prompt(query, context, results),
-                    "context_analysis": self._analyze_context(context),
+                    "customized_prompt": customized_prompt,
+                    "context_analysis": context_analysis,
                     "source_prompts": [
-                        {
+                        self._compact_item(results, i, {
                             "score": float(results['distances'][0][i]),
                             "prompt_type": results['metadatas'][0][i].get('prompt_type'),
-                            "complexity": results['metadatas'][0][i].get('complexity'),
-                            "original_text": results['documents'][0][i]
-                        }
+                            "complexity": results['metadatas'][0][i].get('complexity')
+                        }, text_key="original_text")
                         for i in range(len(results['ids'][0]))
-                    ]
+                    ],
+                    "expected_outputs": expected_outputs
                 }
             }
+            if rerank_report is not None:
+                response["rerank"] = rerank_report
+            return response
         except Exception as e:
             return {
                 "scenario": "context",
@@ -209,14 +704,224 @@ class PromptGeneratorRAGSystem:
                 "error": str(e)
             }
     
-    def _handle_no_context_query(self, query: str) -> Dict[str, Any]:
-        """處理無上下文的查詢"""
+    def _split_context(self, context: str) -> List[str]:
+        """將長上下文切分為有界片段
+        
+        依段落、換行、句號的優先順序尋找切分點，找不到時硬切；
+        片段數超過上限時均勻取樣，確保成本與延遲不隨上下文長度增長。
+        """
+        max_chars = CONTEXT_QUERY_CONFIG["chunk_max_chars"]
+        max_chunks = CONTEXT_QUERY_CONFIG["max_chunks"]
+        
+        # 以位置遍歷原字串，每個片段只複製一次視窗，整體成本與上下文長度成線性
+        chunks = []
+        position, end = 0, len(context)
+        while position < end:
+            window = context[position:position + max_chars]
+            if position + max_chars >= end:
+                cut = len(window)
+            else:
+                cut = -1
+                for boundary in ("\n\n", "\n", "。", ". ", "！", "？", " "):
+                    found = window.rfind(boundary)
+                    if found > max_chars // 2:
+                        cut = found + len(boundary)
+                        break
+                if cut <= 0:
+                    cut = max_chars
+            
+            chunk = window[:cut].strip()
+            if chunk:
+                chunks.append(chunk)
+            position += cut
+        
+        if len(chunks) > max_chunks:
+            if max_chunks <= 1:
+                chunks = chunks[:max(max_chunks, 0)]
+            else:
+                step = (len(chunks) - 1) / (max_chunks - 1)
+                chunks = [chunks[round(i * step)] for i in range(max_chunks)]
+        
+        return chunks
+    
+    def _embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """批量取得文本向量，未命中 LRU 快取的文本合併為一次 embedding 呼叫"""
+        cache_size = CONTEXT_QUERY_CONFIG["embedding_cache_size"]
+        
+        # 快取讀寫持鎖 (多線程並發查詢)，embedding 呼叫本身不持鎖
+        with self._embedding_lock:
+            cached = {}
+            for text in dict.fromkeys(texts):
+                if text in self._embedding_cache:
+                    self._embedding_cache.move_to_end(text)
+                    cached[text] = self._embedding_cache[text]
+            missing = [text for text in dict.fromkeys(texts) if text not in cached]
+            self.embedding_cache_stats["hits"] += len(texts) - len(missing)
+            self.embedding_cache_stats["misses"] += len(missing)
+        
+        with stage("rag.embed", texts=len(texts), cache_hit=not missing, cache_misses=len(missing)):
+            fresh = dict(zip(missing, self.embedding_function(missing))) if missing else {}
+        
+        with self._embedding_lock:
+            for text, embedding in fresh.items():
+                self._embedding_cache[text] = embedding
+            while len(self._embedding_cache) > cache_size:
+                self._embedding_cache.popitem(last=False)
+        
+        return [cached[text] if text in cached else fresh[text] for text in texts]
+    
+    def _search_with_context_chunks(
+        self,
+        query: str,
+        context_chunks: List[str],
+        lazy: bool = False,
+        n_results: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """以查詢向量和上下文片段向量檢索，並用加權 max-sim 聚合候選
+        
+        Args:
+            lazy: 為 True 時不取回候選全文，結果的 documents 為 None
+            n_results: 返回的候選數，未提供時為 CONTEXT_QUERY_CONFIG["top_k"]
+        
+        Returns:
+            與 collection.query 相同結構的結果字典（單一查詢），按聚合分數排序；
+            distances 為聚合相似度換算的 L2 距離 (2 - 2 * sim)，與其他檢索路徑同一尺度
+        """
+        import numpy as np
+        
+        top_k = n_results or CONTEXT_QUERY_CONFIG["top_k"]
+        query_weight = CONTEXT_QUERY_CONFIG["query_weight"]
+        
+        vectors = self._embed_texts([query] + context_chunks)
+        raw = self._vector_search(
+            query_embeddings=vectors,
+            n_results=CONTEXT_QUERY_CONFIG["candidates_per_vector"],
+            include=["metadatas", "embeddings"] if lazy else ["documents", "metadatas", "embeddings"]
+        )
+        
+        # 合併所有查詢向量召回的候選
+        candidates = OrderedDict()
+        for row in range(len(raw['ids'])):
+            for i, doc_id in enumerate(raw['ids'][row]):
+                if doc_id not in candidates:
+                    candidates[doc_id] = (
+                        None if lazy else raw['documents'][row][i],
+                        raw['metadatas'][row][i],
+                        raw['embeddings'][row][i]
+                    )
+        
+        if not candidates:
+            return {"ids": [[]], "documents": None if lazy else [[]], "metadatas": [[]], "distances": [[]]}
+        
+        # 候選 × 查詢向量的餘弦相似度矩陣
+        candidate_matrix = np.asarray([c[2] for c in candidates.values()], dtype=np.float32)
+        query_matrix = np.asarray(vectors, dtype=np.float32)
+        candidate_matrix /= np.linalg.norm(candidate_matrix, axis=1, keepdims=True) + 1e-12
+        query_matrix /= np.linalg.norm(query_matrix, axis=1, keepdims=True) + 1e-12
+        similarities = candidate_matrix @ query_matrix.T
+        
+        if similarities.shape[1] > 1:
+            scores = query_weight * similarities[:, 0] + (1 - query_weight) * similarities[:, 1:].max(axis=1)
+        else:
+            scores = similarities[:, 0]
+        
+        order = np.argsort(-scores)[:top_k]
+        items = list(candidates.items())
+        return {
+            "ids": [[items[i][0] for i in order]],
+            "documents": None if lazy else [[items[i][1][0] for i in order]],
+            "metadatas": [[items[i][1][1] for i in order]],
+            "distances": [[float(2 - 2 * scores[i]) for i in order]]
+        }
+    
+    @pinned_version
+    def batch_query(self, queries: List[Dict[str, Any]], lazy: bool = False) -> List[Dict[str, Any]]:
+        """批量處理查詢
+        
+        所有查詢文本與上下文片段先合併為一次 embedding 呼叫 (之後各查詢命中快取)，
+        無上下文的查詢再合併為一次向量檢索；帶 filters 的查詢以 apply_user_filter 處理。
+        
+        Args:
+            queries: 查詢列表，每項包含 query 與可選的 context 或 filters
+            lazy: 為 True 時結果不附全文 (同 query 的 lazy)
+            
+        Returns:
+            與輸入順序一致的查詢結果列表
+        """
+        with stage("rag.batch_query", batch_size=len(queries)):
+            results = [None] * len(queries)
+            try:
+                texts = []
+                for item in queries:
+                    texts.append(item["query"])
+                    if item.get("context"):
+                        texts.extend(self._split_context(item["context"]))
+                if texts:
+                    self._embed_texts(texts)
+                
+                no_context = [
+                    i for i, item in enumerate(queries)
+                    if not item.get("context") and item.get("filters") is None
+                ]
+                if no_context:
+                    query_embeddings = self._embed_texts([queries[i]["query"] for i in no_context])
+                    raw = self._vector_search(
+                        query_embeddings=query_embeddings,
+                        **self._no_context_search(lazy, MMR_CONFIG["enabled"])
+                    )
+                    for row, i in enumerate(no_context):
+                        single = {
+                            key: [raw[key][row]] if raw.get(key) is not None else None
+                            for key in ("ids", "documents", "metadatas", "distances", "embeddings")
+                        }
+                        results[i] = self._handle_no_context_query(
+                            queries[i]["query"], results=single, lazy=lazy, query_embedding=query_embeddings[row]
+                        )
+            except Exception as e:
+                print(f"批量查詢錯誤：{str(e)}")
+            
+            # 過濾查詢、有上下文的查詢 (以及批量檢索失敗時) 逐一處理
+            for i, item in enumerate(queries):
+                if results[i] is not None:
+                    continue
+                if item.get("filters") is not None:
+                    results[i] = self.apply_user_filter(item["query"], item["filters"], lazy=lazy)
+                else:
+                    results[i] = self.query(item["query"], item.get("context"), lazy=lazy)
+            return results
+    
+    def _handle_no_context_query(
+        self,
+        query: str,
+        results: Optional[Dict[str, Any]] = None,
+        lazy: bool = False,
+        query_embedding: Optional[List[float]] = None,
+        diversify: Optional[bool] = None
+    ) -> Dict[str, Any]:
+        """處理無上下文的查詢
+        
+        Args:
+            query: 用戶查詢
+            results: 可選的已檢索結果 (批量查詢時傳入)，未提供時執行檢索
+            lazy: 為 True 時分類結果不附全文
+            query_embedding: 可選的查詢向量 (批量查詢時傳入)
+            diversify: 是否以 MMR 從多取的候選中挑選結果，未提供時依 MMR_CONFIG
+        """
+        diversify = MMR_CONFIG["enabled"] if diversify is None else diversify
         try:
             # 執行基本搜索
-            results = self.collection.query(
-                query_texts=[query],
-                n_results=5
-            )
+            if results is None:
+                query_embedding = self._embed_texts([query])[0]
+                results = self._vector_search(
+                    query_embeddings=[query_embedding],
+                    **self._no_context_search(lazy, diversify)
+                )
+            keep = 5 * max(1, MMR_CONFIG["over_fetch"]) if diversify else 5
+            results, rerank_report = self._rerank(query, results, keep=keep)
+            if diversify and results.get('embeddings') is not None:
+                if query_embedding is None:
+                    query_embedding = self._embed_texts([query])[0]
+                results = self._diversify(results, query_embedding, lazy)
             
             if not results['ids'] or len(results['ids'][0]) == 0:
                 return {
@@ -226,16 +931,21 @@ class PromptGeneratorRAGSystem:
                 }
             
             # 對結果進行分類
-            categories = self._categorize_results(results)
+            with stage("rag.categorize", scenario="no_context"):
+                categories = self._categorize_results(results)
+                filter_suggestions = self._generate_filter_suggestions(results)
             
-            return {
+            response = {
                 "scenario": "no_context",
                 "response_mode": "categorization",
                 "formatted_response": {
                     "categories": categories,
-                    "filter_suggestions": self._generate_filter_suggestions(results)
+                    "filter_suggestions": filter_suggestions
                 }
             }
+            if rerank_report is not None:
+                response["rerank"] = rerank_report
+            return response
         except Exception as e:
             return {
                 "scenario": "no_context",
@@ -243,10 +953,248 @@ class PromptGeneratorRAGSystem:
                 "error": str(e)
             }
     
+    def _no_context_search(self, lazy: bool, diversify: bool) -> Dict[str, Any]:
+        """無上下文檢索的參數：多樣化時多取 over_fetch 倍候選並連同向量返回 (全文在挑選後才載入)；
+        啟用重排時至少取 top_n 個候選"""
+        if not diversify:
+            return {"n_results": self._rerank_candidates(5), "include": self._search_include(lazy)}
+        return {
+            "n_results": self._rerank_candidates(5 * max(1, MMR_CONFIG["over_fetch"])),
+            "include": ["metadatas", "distances", "embeddings"]
+        }
+    
+    def _diversify(self, results: Dict[str, Any], query_embedding, lazy: bool, k: int = 5) -> Dict[str, Any]:
+        """以 MMR 從多取的候選 (單一查詢、含 embeddings) 挑選 k 個，非 lazy 時為選中的結果載入全文
+        
+        結果帶有 rerank_scores (重排已生效) 時以重排分數作為 MMR 的相關度，而非原始 embedding 相似度。
+        """
+        from source_code.diversify import mmr_select
+        
+        with stage("rag.diversify", candidates=len(results['ids'][0])):
+            order = mmr_select(
+                query_embedding, results['embeddings'][0], k, MMR_CONFIG["lambda"],
+                relevance=results.get('rerank_scores')
+            )
+        selected = {
+            key: [[results[key][0][i] for i in order]] if results.get(key) is not None else None
+            for key in ("ids", "documents", "metadatas", "distances")
+        }
+        if not lazy and selected["documents"] is None:
+            documents = self.get_documents(selected["ids"][0])
+            selected["documents"] = [[documents.get(doc_id, "") for doc_id in selected["ids"][0]]]
+        return selected
+    
+    def _rerank_candidates(self, keep: int) -> int:
+        """第一階段的檢索數：啟用重排時至少 top_n 個，重排後再截到 keep 個"""
+        return max(keep, RERANK_CONFIG["top_n"]) if self.reranker is not None else keep
+    
+    def _rerank(self, query: str, results: Dict[str, Any], keep: int):
+        """第二階段重排 (單一查詢的結果)：重排前 top_n 個候選後保留 keep 個
+        
+        超出 RERANK_CONFIG 的時間預算時保持第一階段順序。結果沒有全文 (lazy 或多樣化檢索) 時
+        以 get_documents 取得候選全文供打分，返回的結果結構不變。
+        
+        Returns:
+            (結果, 報告)；未啟用 reranker 時結果原樣返回、報告為 None。
+            重排生效時結果另帶與排序對齊的 rerank_scores (top_n 之後的候選取最低分)，供 MMR 使用
+        """
+        if self.reranker is None or not results['ids'] or not results['ids'][0]:
+            return results, None
+        from source_code.rerank import rerank
+        
+        started = time.perf_counter()
+        count = len(results['ids'][0])
+        ids = results['ids'][0][:RERANK_CONFIG["top_n"]]
+        if results.get('documents') is not None:
+            texts = results['documents'][0][:len(ids)]
+        else:
+            documents = self.get_documents(ids)
+            texts = [documents.get(doc_id, "") for doc_id in ids]
+        candidates = [
+            {
+                "id": doc_id,
+                "text": texts[i],
+                "metadata": results['metadatas'][0][i] if results.get('metadatas') is not None else {},
+                "distance": results['distances'][0][i]
+            }
+            for i, doc_id in enumerate(ids)
+        ]
+        
+        with stage("rag.rerank", reranker=getattr(self.reranker, "name", ""), candidates=len(candidates)) as rerank_stage:
+            order, scores, report = rerank(self.reranker, query, candidates)
+            # ms 為打分耗時 (受預算約束)，stage_ms 另含取得候選全文的時間
+            report["stage_ms"] = round((time.perf_counter() - started) * 1000, 3)
+            rerank_stage.set_attribute("applied", report["applied"])
+            rerank_stage.set_attribute("rerank_ms", report["stage_ms"])
+        with self._rerank_lock:
+            self.rerank_stats["requests"] += 1
+            self.rerank_stats["applied" if report["applied"] else "fallbacks"] += 1
+            self.rerank_stats["total_ms"] += report["stage_ms"]
+        
+        # top_n 之後的候選保持第一階段順序
+        order = (order + list(range(len(ids), count)))[:keep]
+        reranked = {
+            key: [[results[key][0][i] for i in order]] if results.get(key) is not None else None
+            for key in ("ids", "documents", "metadatas", "distances", "embeddings")
+        }
+        if scores is not None:
+            floor = min(scores)
+            reranked['rerank_scores'] = [scores[i] if i < len(scores) else floor for i in order]
+        return reranked, report
+    
+    def _vector_search(self, query_embeddings: List[List[float]], n_results: int, **kwargs) -> Dict[str, Any]:
+        """執行 collection 向量檢索 (單一入口，便於觀測)"""
+        with stage(
+            "rag.vector_search",
+            n_results=n_results,
+            query_vectors=len(query_embeddings),
+            has_filters=bool(kwargs.get("where"))
+        ):
+            return self.collection.query(query_embeddings=query_embeddings, n_results=n_results, **kwargs)
+    
+    def _search_include(self, lazy: bool) -> List[str]:
+        """檢索需要取回的欄位：lazy 模式不取全文"""
+        return ["metadatas", "distances"] if lazy else ["documents", "metadatas", "distances"]
+    
+    def _compact_item(self, results: Dict, i: int, item: Dict[str, Any], text_key: str = "text") -> Dict[str, Any]:
+        """為結果項加上文檔 id；結果帶有全文時一併附上"""
+        item["id"] = results['ids'][0][i]
+        if results['metadatas'][0][i].get('alias_count'):
+            item["alias_count"] = results['metadatas'][0][i]['alias_count']
+        if results.get('documents') is not None:
+            item[text_key] = results['documents'][0][i]
+        return item
+    
+    @pinned_version
+    def get_documents(self, ids: List[str]) -> Dict[str, str]:
+        """按文檔 id 批量取回全文 (lazy 查詢結果的按需載入)
+        
+        未命中 LRU 快取的 id 合併為一次 collection.get。
+        
+        Args:
+            ids: 文檔 id 列表
+            
+        Returns:
+            {文檔 id: 全文}，不存在的 id 不出現在結果中
+        """
+        cache_size = CONTEXT_QUERY_CONFIG["document_cache_size"]
+        wanted = list(dict.fromkeys(ids))
+        number = self.version.number
+        
+        with self._document_lock:
+            found = {}
+            for doc_id in wanted:
+                # 快取以 (索引版本, 文檔 id) 為鍵，熱重載後不會返回舊版本的全文
+                key = (number, doc_id)
+                if key in self._document_cache:
+                    self._document_cache.move_to_end(key)
+                    found[doc_id] = self._document_cache[key]
+            missing = [doc_id for doc_id in wanted if doc_id not in found]
+            self.document_cache_stats["hits"] += len(wanted) - len(missing)
+            self.document_cache_stats["misses"] += len(missing)
+        
+        if missing:
+            with stage("rag.get_documents", documents=len(missing)):
+                fetched = self.collection.get(ids=missing, include=["documents"])
+            fresh = dict(zip(fetched["ids"], fetched["documents"]))
+            with self._document_lock:
+                for doc_id, text in fresh.items():
+                    self._document_cache[(number, doc_id)] = text
+                while len(self._document_cache) > cache_size:
+                    self._document_cache.popitem(last=False)
+            found.update(fresh)
+        
+        return {doc_id: found[doc_id] for doc_id in wanted if doc_id in found}
+    
+    @pinned_version
+    def get_aliases(self, ids: List[str], with_text: bool = True) -> Dict[str, List[Dict[str, Any]]]:
+        """展開代表文檔的近似重複別名
+        
+        Args:
+            ids: 代表文檔 id 列表
+            with_text: 是否從數據集附上別名全文 (別名未被索引，只能以 record_id 回查)
+            
+        Returns:
+            {代表 id: [{"id", "text"}]}，沒有別名的 id 不出現在結果中
+        """
+        fetched = self.collection.get(ids=list(dict.fromkeys(ids)), include=["metadatas"])
+        aliases = {
+            doc_id: metadata["aliases"].split(",")
+            for doc_id, metadata in zip(fetched["ids"], fetched["metadatas"])
+            if metadata and metadata.get("aliases")
+        }
+        texts = {}
+        if with_text and aliases:
+            from source_code.dataset_store import load_dataset
+            df = load_dataset(["record_id", "good_prompt"], csv_path=self.dataset_path)
+            wanted = {alias for values in aliases.values() for alias in values}
+            texts = {
+                f"record_{record_id}": text
+                for record_id, text in zip(df["record_id"], df["good_prompt"])
+                if f"record_{record_id}" in wanted
+            }
+        return {
+            doc_id: [{"id": alias, "text": texts.get(alias)} for alias in values]
+            for doc_id, values in aliases.items()
+        }
+    
+    def get_record_index(self):
+        """目前索引版本的記錄層級索引 (首次使用時載入)；chunk 文件不可用或引擎不是使用預設數據集時返回 None"""
+        version = self.version
+        with self._record_index_lock:
+            if version.record_index is None and not self._uses_default_dataset():
+                version.record_index = False
+            if version.record_index is None:
+                try:
+                    from source_code.record_index import open_record_index
+                    version.record_index = open_record_index()
+                except Exception as e:
+                    print(f"記錄索引不可用：{str(e)}")
+                    version.record_index = False
+            return version.record_index or None
+    
+    @pinned_version
+    def get_bundles(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """按文檔 id 取回同一記錄的上下文 (含壞範例)、優質 prompt 與期望輸出
+        
+        Returns:
+            {文檔 id: bundle}，不在索引中的 id 不出現在結果中
+        """
+        index = self.get_record_index()
+        if index is None:
+            return {}
+        with stage("rag.bundles", documents=len(ids)):
+            found = {doc_id: index.bundle(doc_id) for doc_id in dict.fromkeys(ids)}
+        return {doc_id: bundle for doc_id, bundle in found.items() if bundle is not None}
+    
+    def _attach_bundles(self, items: List[Dict[str, Any]]):
+        """為結果項附上 bundle (依 item["id"])"""
+        found = self.get_bundles([item["id"] for item in items if item.get("id")])
+        for item in items:
+            if item.get("id") in found:
+                item["bundle"] = found[item["id"]]
+    
+    def _expected_outputs(self, ids: List[str]) -> List[str]:
+        """來源 prompt 所屬記錄的期望輸出 (壓縮文檔存儲優先，否則按 chunk 順序重組)"""
+        field = getattr(self.collection, "field", None)
+        if field is not None:
+            found = field(ids, "expected_output")
+            if found:
+                return [found[doc_id] for doc_id in ids if found.get(doc_id)]
+        index = self.get_record_index()
+        if index is None:
+            return []
+        outputs = [index.reassemble(doc_id, "expected_output") for doc_id in ids]
+        return [output for output in outputs if output]
+    
     def _generate_custom_prompt(self, query: str, context: str, results: Dict) -> str:
         """生成客製化 prompt"""
-        # 使用最相關的 prompt 作為模板
-        template = results['documents'][0][0]
+        # 使用最相關的 prompt 作為模板 (lazy 檢索時只載入這一篇全文)
+        if results.get('documents') is not None:
+            template = results['documents'][0][0]
+        else:
+            top_id = results['ids'][0][0]
+            template = self.get_documents([top_id]).get(top_id, "")
         return template.replace("[Context Placeholder]", context)
     
     def _analyze_context(self, context: str) -> Dict[str, Any]:
@@ -272,11 +1220,10 @@ class PromptGeneratorRAGSystem:
                 }
             
             categories[prompt_type]["count"] += 1
-            categories[prompt_type]["prompts"].append({
-                "text": results['documents'][0][i],
+            categories[prompt_type]["prompts"].append(self._compact_item(results, i, {
                 "score": float(results['distances'][0][i]),
                 "complexity": results['metadatas'][0][i].get('complexity', 'medium')
-            })
+            }))
         
         return categories
     
@@ -306,63 +1253,9 @@ class PromptGeneratorRAGSystem:
         return suggestions
 
 def main():
-    """主函數 - 系統初始化和測試"""
-    # 設置 API Key
-    api_key = input("請輸入您的 OpenAI API Key: ")
-    setup_environment(api_key)
-    
-    # 載入資料
-    dataset_path = input("請輸入資料集路徑: ")
-    df = pd.read_csv(dataset_path)
-    
-    print(f"載入資料：{len(df)} 筆記錄")
-    
-    # 初始化系統
-    chunking_strategy = SmartChunkingStrategy(max_tokens=1024)
-    
-    # 執行切分
-    all_chunks, stats = process_all_records(df, chunking_strategy)
-    print(f"切分完成：{stats['total_chunks']} 個 chunks")
-    
-    # 初始化 Chroma
-    chroma_arch = ChromaMixedArchitectureFixed()
-    if chroma_arch.initialize_chroma_client():
-        if chroma_arch.create_collections():
-            collection_chunks = chroma_arch.prepare_chunks_for_collections(all_chunks)
-            if chroma_arch.add_chunks_to_collections(collection_chunks):
-                print("✅ Chroma 數據庫初始化完成")
-            else:
-                print("❌ 數據載入失敗")
-                return
-        else:
-            print("❌ Collection 創建失敗")
-            return
-    else:
-        print("❌ Chroma 客戶端初始化失敗")
-        return
-    
-    # 初始化檢索系統
-    hybrid_search = HybridSearchStrategy(chroma_arch)
-    rag_system = PromptGeneratorRAGSystem()
-    
-    print("🎉 系統初始化完成！")
-    
-    # 測試查詢
-    while True:
-        user_input = input("\n請輸入查詢 (輸入 'quit' 退出): ")
-        if user_input.lower() == 'quit':
-            break
-        
-        context = input("請輸入上下文 (可選，直接按 Enter 跳過): ")
-        context = context if context.strip() else None
-        
-        result = rag_system.query(user_input, context)
-        
-        if "error" in result:
-            print(f"❌ 查詢失敗：{result['error']}")
-        else:
-            print(f"✅ 查詢成功，場景：{result['scenario']}")
-            # 顯示結果摘要...
+    """命令列入口：轉交非互動的批量工具 (見 source_code/cli.py)"""
+    from source_code.cli import main as cli_main
+    return cli_main()
 
 if __name__ == "__main__":
-    main()
+    raise SystemExit(main())
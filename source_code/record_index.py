@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+記錄層級索引
+
+chunk 以 source_record_id 與 chunk_index ("2/3") 標記所屬記錄，但從檢索到的 prompt
+找回同一記錄的上下文 (含壞範例)、優質 prompt 與期望輸出，原本要對每個結果做一次
+metadata 過濾的 get。這裡在 ingest 時建立並持久化一份索引：
+
+    record_id → {collection: [按 chunk_index 排序的 chunk ID]}
+
+- prompts: 引擎 collection 的文檔 ID (record_<id>)
+- context / good_prompt / expected_output / complete: processed_chunks.json 的 chunk ID
+  (chunk_<在文件中的位置>)，對應 README 中的 prompt_contexts / prompt_examples / expected_outputs
+
+多 chunk 記錄可按順序重組，每個檢索結果以 O(1) 取得完整的「上下文 + prompt + 期望輸出」。
+
+用法：
+    python -m source_code.record_index            # 重建並保存
+"""
+
+import argparse
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+from source_code.config import CHUNK_STORE, RECORD_INDEX
+
+INDEX_VERSION = 1
+CHUNK_COLLECTIONS = ("context", "good_prompt", "expected_output", "complete")
+PROMPT_COLLECTION = "prompts"
+
+
+def chunk_id(index: int) -> str:
+    return f"chunk_{index}"
+
+
+def chunk_position(chunk_id_value: str) -> int:
+    return int(chunk_id_value.rpartition("_")[2])
+
+
+def _chunk_order(chunk_index: Optional[str]) -> int:
+    """chunk_index "2/3" 的序號，缺值或格式錯誤時排在最後"""
+    try:
+        return int(str(chunk_index).split("/")[0])
+    except ValueError:
+        return 1 << 30
+
+
+def _source_fingerprint(store_path: str, dataset_sha256: Optional[str]) -> Dict[str, Any]:
+    stat = os.stat(store_path)
+    return {"chunk_store_size": stat.st_size, "chunk_store_mtime_ns": stat.st_mtime_ns, "dataset_sha256": dataset_sha256}
+
+
+class RecordIndex:
+    """record_id → 各 collection 的有序 chunk ID"""
+
+    def __init__(self, records: Dict[str, Dict[str, List[str]]], source: Optional[Dict[str, Any]] = None, store=None):
+        self.records = records
+        self.source = source or {}
+        self._store = store
+
+    @classmethod
+    def build(cls, store, prompt_ids: Optional[List[str]] = None, source: Optional[Dict[str, Any]] = None) -> "RecordIndex":
+        """由 chunk 存儲 (及引擎 collection 的文檔 ID) 建立索引
+
+        Args:
+            store: ChunkStore
+            prompt_ids: 引擎 collection 中的文檔 ID (record_<id>)，未提供時不建立 prompts 映射
+        """
+        records = {}
+        if prompt_ids is not None:
+            for doc_id in prompt_ids:
+                records.setdefault(doc_id, {})[PROMPT_COLLECTION] = [doc_id]
+
+        for record_id in store.columns.get("source_record_id", []):
+            indices = sorted(store.record_indices(record_id), key=lambda i: (_chunk_order(store.value(i, "chunk_index")), i))
+            entry = records.setdefault(record_id, {})
+            for index in indices:
+                entry.setdefault(store.value(index, "chunk_type") or "unknown", []).append(chunk_id(index))
+        return cls(records, source=source, store=store)
+
+    @classmethod
+    def load(cls, path: str, store=None) -> "RecordIndex":
+        with open(path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        if payload.get("version") != INDEX_VERSION:
+            raise ValueError(f"不支援的記錄索引版本：{payload.get('version')}")
+        return cls(payload["records"], source=payload.get("source"), store=store)
+
+    def save(self, path: str):
+        staging = f"{path}.tmp-{os.getpid()}"
+        with open(staging, "w", encoding="utf-8") as f:
+            json.dump({"version": INDEX_VERSION, "source": self.source, "records": self.records}, f, ensure_ascii=False)
+        os.replace(staging, path)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __contains__(self, record_id: str) -> bool:
+        return record_id in self.records
+
+    @property
+    def store(self):
+        if self._store is None:
+            from source_code.chunk_store import open_chunk_store
+            self._store = open_chunk_store()
+        return self._store
+
+    def chunk_ids(self, record_id: str, collection: Optional[str] = None):
+        """記錄在指定 collection 的有序 chunk ID；未指定時返回所有 collection 的映射"""
+        entry = self.records.get(record_id, {})
+        if collection is None:
+            return {name: list(ids) for name, ids in entry.items()}
+        return list(entry.get(collection, []))
+
+    def reassemble(self, record_id: str, collection: str, separator: str = "\n") -> Optional[str]:
+        """按 chunk_index 順序重組記錄在某個 collection 的文本，沒有 chunk 時返回 None"""
+        ids = self.records.get(record_id, {}).get(collection)
+        if not ids:
+            return None
+        return separator.join(self.store.text(chunk_position(value)) for value in ids)
+
+    def bundle(self, record_id: str) -> Optional[Dict[str, Any]]:
+        """記錄的完整內容：上下文 (含壞範例)、優質 prompt、期望輸出與完整 prompt"""
+        entry = self.records.get(record_id)
+        if entry is None:
+            return None
+        bundle = {"record_id": record_id, "chunk_ids": self.chunk_ids(record_id)}
+        for collection in CHUNK_COLLECTIONS:
+            bundle[collection] = self.reassemble(record_id, collection)
+        return bundle
+
+
+def build_record_index(prompt_ids: Optional[List[str]] = None, path: Optional[str] = None) -> RecordIndex:
+    """建立並保存記錄索引 (ingest 時呼叫)
+
+    Args:
+        prompt_ids: 引擎 collection 的文檔 ID，未提供時從數據集的 record_id 推得
+        path: 保存路徑，預設 RECORD_INDEX
+    """
+    from source_code.chunk_store import open_chunk_store
+    from source_code.dataset_store import get_dataset_store
+
+    store = open_chunk_store()
+    dataset = get_dataset_store()
+    if prompt_ids is None:
+        prompt_ids = [f"record_{record_id}" for record_id in dataset.load(["record_id"])["record_id"]]
+    index = RecordIndex.build(store, prompt_ids, source=_source_fingerprint(store.path, dataset.info()["sha256"]))
+    index.save(str(path or RECORD_INDEX))
+    return index
+
+
+def open_record_index(path: Optional[str] = None) -> RecordIndex:
+    """開啟記錄索引；文件不存在或 chunk 存儲、數據集已變更時重建"""
+    from source_code.chunk_store import open_chunk_store
+    from source_code.dataset_store import get_dataset_store
+
+    path = str(path or RECORD_INDEX)
+    store = open_chunk_store()
+    expected = _source_fingerprint(store.path, get_dataset_store().info()["sha256"])
+    if os.path.exists(path):
+        try:
+            index = RecordIndex.load(path, store=store)
+            if index.source == expected:
+                return index
+        except (OSError, ValueError, KeyError):
+            pass
+    return build_record_index(path=path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="重建記錄層級索引")
+    parser.add_argument("--output", default=str(RECORD_INDEX))
+    args = parser.parse_args()
+
+    index = build_record_index(path=args.output)
+    multi = sum(1 for entry in index.records.values() if any(len(ids) > 1 for ids in entry.values()))
+    print(f"已寫入 {len(index)} 筆記錄的索引到 {args.output} (多 chunk 記錄 {multi} 筆，chunk 存儲 {CHUNK_STORE})")
+
+
+if __name__ == "__main__":
+    main()
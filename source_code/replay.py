@@ -0,0 +1,393 @@
+# -*- coding: utf-8 -*-
+"""
+OpenAI embedding / chat API 的錄製與重放替身
+
+讓引擎在 CI 或離線環境中完整執行 (不需要真實 API key 或網路)：
+- Cassette: JSONL 錄製文件；embedding 以 (模型, 文本) 為單位保存，重放時不受批次切分影響
+- Responder: 依序查找錄製的回應，未見過的 embedding 輸入以特徵雜湊合成確定性向量，
+  chat 則合成固定格式的回覆；可注入延遲分佈與錯誤 (狀態碼、比例)
+- ReplayOpenAIClient: 進程內傳輸，沿用 OpenAIClient 的並發上限、重試、期限與在途合併
+- RecordingOpenAIClient: 經由真實 API 並把成功的回應寫入錄製文件
+- 替身 HTTP 服務：供其他進程 (服務 worker、LlamaIndex) 以 OPENAI_BASE_URL 指向
+
+用法：
+    PROMPT_RAG_OFFLINE=1 streamlit run app.py
+    PROMPT_RAG_RECORD=cassette.jsonl python -m source_code.server      # 錄製
+    python -m source_code.replay --port 8100 --cassette cassette.jsonl --latency lognormal:3.9:0.5
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+from source_code.config import REPLAY_CONFIG, SYSTEM_CONFIG
+from source_code.openai_client import OpenAIClient
+
+# 英文單字、數字或單一 CJK 字符視為一個 token
+TOKEN_PATTERN = re.compile(r"[A-Za-z0-9_]+|[一-鿿]")
+
+_standin = {"server": None, "url": None}
+_standin_lock = threading.Lock()
+
+
+class HashingEmbeddingFunction:
+    """確定性的特徵雜湊 embedding 替身
+
+    將 token 以 blake2b 雜湊到固定維度並帶正負號累加，再做 L2 正規化。
+    相同文本永遠得到相同向量，詞彙重疊越多的文本相似度越高。
+    """
+
+    def __init__(self, dimensions: int = 1536):
+        self.dimensions = dimensions
+        self.calls = 0
+        self.texts_embedded = 0
+        self._token_slots = {}
+
+    @property
+    def model_id(self) -> str:
+        """快照記錄的模型標識，與真實 embedding 模型區分"""
+        return f"offline-hash-{self.dimensions}"
+
+    def _slot(self, token: str):
+        slot = self._token_slots.get(token)
+        if slot is None:
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            slot = (value % self.dimensions, 1.0 if (value >> 63) & 1 else -1.0)
+            self._token_slots[token] = slot
+        return slot
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        import numpy as np
+
+        self.calls += 1
+        self.texts_embedded += len(input)
+
+        matrix = np.zeros((len(input), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(input):
+            slots = [self._slot(token) for token in TOKEN_PATTERN.findall(text.lower())]
+            if slots:
+                indices, signs = zip(*slots)
+                matrix[row] = np.bincount(indices, weights=signs, minlength=self.dimensions)
+
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (matrix / norms).tolist()
+
+
+class LatencyModel:
+    """可配置的延遲分佈 (毫秒)
+
+    規格字串：
+    - none
+    - fixed:50
+    - uniform:20:80
+    - normal:50:10          (平均值, 標準差，截斷於 0)
+    - lognormal:3.9:0.5     (底層常態分佈的 mu, sigma，中位數約 e^mu 毫秒)
+    """
+
+    def __init__(self, spec: str = "none", seed: Optional[int] = None):
+        self.spec = spec
+        parts = spec.split(":")
+        self.kind = parts[0]
+        self.params = [float(p) for p in parts[1:]]
+        self._random = random.Random(seed)
+
+        expected = {"none": 0, "fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+        if self.kind not in expected or len(self.params) != expected[self.kind]:
+            raise ValueError(f"無效的延遲規格：{spec}")
+
+    def sample_ms(self) -> float:
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return self._random.uniform(*self.params)
+        if self.kind == "normal":
+            return max(0.0, self._random.gauss(*self.params))
+        if self.kind == "lognormal":
+            return self._random.lognormvariate(*self.params)
+        return 0.0
+
+    def sleep(self):
+        delay = self.sample_ms()
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+
+def _chat_key(payload: Dict[str, Any]) -> str:
+    """chat 請求的錄製鍵：模型、訊息與取樣參數的雜湊"""
+    canonical = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """JSONL 錄製文件
+
+    每行一筆：
+    - {"type": "embedding", "model": ..., "text": ..., "embedding": [...]}
+    - {"type": "chat", "key": ..., "request": {...}, "response": {...}}
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.embeddings = {}
+        self.chats = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self._load(json.loads(line))
+
+    def _load(self, entry: Dict[str, Any]):
+        if entry.get("type") == "embedding":
+            self.embeddings[(entry["model"], entry["text"])] = entry["embedding"]
+        elif entry.get("type") == "chat":
+            self.chats[entry["key"]] = entry["response"]
+
+    def _append(self, entries: List[Dict[str, Any]]):
+        with self._lock:
+            for entry in entries:
+                self._load(entry)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    for entry in entries:
+                        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def record(self, path: str, request: Dict[str, Any], response: Dict[str, Any]):
+        """保存一次成功的 API 回應"""
+        if path.endswith("/embeddings"):
+            inputs = request["input"] if isinstance(request["input"], list) else [request["input"]]
+            self._append([
+                {"type": "embedding", "model": request["model"], "text": inputs[item["index"]], "embedding": item["embedding"]}
+                for item in response.get("data", [])
+            ])
+        elif path.endswith("/chat/completions"):
+            self._append([{"type": "chat", "key": _chat_key(request), "request": request, "response": response}])
+
+
+class Responder:
+    """以錄製內容或合成結果回答 API 請求，並注入延遲與錯誤"""
+
+    def __init__(
+        self,
+        cassette: Optional[Cassette] = None,
+        dimensions: Optional[int] = None,
+        latency: Optional[str] = None,
+        error_rate: Optional[float] = None,
+        error_status: Optional[int] = None,
+        seed: Optional[int] = None
+    ):
+        self.cassette = cassette if cassette is not None else Cassette(REPLAY_CONFIG["cassette_path"])
+        self.embedding_function = HashingEmbeddingFunction(dimensions or REPLAY_CONFIG["dimensions"])
+        self.latency = LatencyModel(latency or REPLAY_CONFIG["latency"], seed)
+        self.error_rate = REPLAY_CONFIG["error_rate"] if error_rate is None else error_rate
+        self.error_status = error_status or REPLAY_CONFIG["error_status"]
+        self.stats = {"requests": 0, "replayed": 0, "synthesized": 0, "errors_injected": 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _count(self, key: str, value: int = 1):
+        with self._lock:
+            self.stats[key] += value
+
+    def respond(self, path: str, payload: Dict[str, Any], timeout: Optional[float] = None) -> Tuple[int, Dict[str, str], bytes]:
+        """回答一個請求
+
+        Args:
+            path: API 路徑 (/embeddings 或 /chat/completions，可帶 /v1 前綴)
+            payload: 請求主體
+            timeout: 呼叫端的剩餘期限 (秒)，模擬延遲超過時拋出 TimeoutError
+
+        Returns:
+            (狀態碼, 回應標頭, 回應主體)
+        """
+        self._count("requests")
+        delay = self.latency.sample_ms() / 1000
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise TimeoutError("替身回應逾時")
+        if delay > 0:
+            time.sleep(delay)
+
+        with self._lock:
+            inject = self.error_rate > 0 and self._random.random() < self.error_rate
+        if inject:
+            self._count("errors_injected")
+            return self._json(self.error_status, {"error": {"message": "注入的錯誤", "type": "replay_injected"}})
+
+        if path.endswith("/embeddings"):
+            return self._json(200, self._embeddings(payload))
+        if path.endswith("/chat/completions"):
+            return self._json(200, self._chat(payload))
+        return self._json(404, {"error": {"message": f"替身不支援的路徑：{path}"}})
+
+    def _json(self, status: int, payload: Dict[str, Any]) -> Tuple[int, Dict[str, str], bytes]:
+        return status, {"Content-Type": "application/json"}, json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+    def _embeddings(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        model = payload.get("model") or SYSTEM_CONFIG["embedding_model"]
+        inputs = payload["input"] if isinstance(payload["input"], list) else [payload["input"]]
+        vectors = [self.cassette.embeddings.get((model, text)) for text in inputs]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            for i, vector in zip(missing, self.embedding_function([inputs[i] for i in missing])):
+                vectors[i] = vector
+        self._count("replayed", len(inputs) - len(missing))
+        self._count("synthesized", len(missing))
+
+        tokens = sum(len(TOKEN_PATTERN.findall(text)) for text in inputs)
+        return {
+            "object": "list",
+            "data": [{"object": "embedding", "index": i, "embedding": vector} for i, vector in enumerate(vectors)],
+            "model": model,
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+        }
+
+    def _chat(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        recorded = self.cassette.chats.get(_chat_key(payload))
+        if recorded is not None:
+            self._count("replayed")
+            return recorded
+
+        self._count("synthesized")
+        messages = payload.get("messages") or []
+        prompt = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+        content = f"[offline replay] {prompt[:200]}"
+        prompt_tokens = sum(len(TOKEN_PATTERN.findall(m.get("content") or "")) for m in messages)
+        completion_tokens = len(TOKEN_PATTERN.findall(content))
+        return {
+            "id": "chatcmpl-replay-" + _chat_key(payload)[:24],
+            "object": "chat.completion",
+            "created": 0,
+            "model": payload.get("model") or SYSTEM_CONFIG["llm_model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        }
+
+
+class ReplayOpenAIClient(OpenAIClient):
+    """進程內重放傳輸：不開網路連線，其餘 (並發上限、重試、期限、在途合併) 與真實客戶端相同"""
+
+    def __init__(self, responder: Optional[Responder] = None, **kwargs):
+        kwargs.setdefault("api_key", REPLAY_CONFIG["offline_api_key"])
+        kwargs.setdefault("base_url", "http://replay.invalid/v1")
+        super().__init__(**kwargs)
+        self.responder = responder or Responder()
+
+    def embedding_model_id(self, model: str) -> str:
+        # 未錄製的輸入以特徵雜湊合成：以此建立的快照不可當作真實模型的向量使用
+        return self.responder.embedding_function.model_id
+
+    def _send(self, path: str, body: bytes, headers: Dict[str, str], timeout: float):
+        status, response_headers, data = self.responder.respond(path, json.loads(body), timeout)
+        return status, response_headers.get("Retry-After"), data
+
+
+class RecordingOpenAIClient(OpenAIClient):
+    """經由真實 API，並把成功的回應寫入錄製文件"""
+
+    def __init__(self, cassette_path: Optional[str] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.cassette = Cassette(cassette_path or REPLAY_CONFIG["record_path"])
+
+    def _send(self, path: str, body: bytes, headers: Dict[str, str], timeout: float):
+        status, retry_after, data = super()._send(path, body, headers, timeout)
+        if status == 200:
+            try:
+                self.cassette.record(path, json.loads(body), json.loads(data))
+            except (ValueError, KeyError, OSError) as e:
+                print(f"錄製 API 回應失敗：{str(e)}")
+        return status, retry_after, data
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    """替身 HTTP 服務：POST /v1/embeddings、/v1/chat/completions"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            status, headers, data = self.server.responder.respond(self.path, payload)
+        except TimeoutError:
+            return
+        except (ValueError, KeyError, TypeError) as e:
+            status, headers, data = 400, {"Content-Type": "application/json"}, json.dumps(
+                {"error": {"message": f"無效的請求：{str(e)}"}}, ensure_ascii=False
+            ).encode("utf-8")
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_standin_server(host: str = "127.0.0.1", port: int = 0, responder: Optional[Responder] = None):
+    """在背景線程啟動替身 HTTP 服務
+
+    Returns:
+        (server, base_url)；base_url 已含 /v1，可直接作為 OPENAI_BASE_URL
+    """
+    server = ThreadingHTTPServer((host, port), _StandInHandler)
+    server.daemon_threads = True
+    server.responder = responder or Responder()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def ensure_standin_server() -> str:
+    """進程內共用的替身服務 (離線模式下供 LlamaIndex 等自帶 HTTP 傳輸的元件使用)"""
+    with _standin_lock:
+        if _standin["server"] is None:
+            _standin["server"], _standin["url"] = start_standin_server()
+        return _standin["url"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI API 錄製重放替身服務")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--cassette", default=REPLAY_CONFIG["cassette_path"], help="重放使用的錄製文件 (JSONL)")
+    parser.add_argument("--dimensions", type=int, default=REPLAY_CONFIG["dimensions"])
+    parser.add_argument("--latency", default=REPLAY_CONFIG["latency"], help="延遲分佈，例如 lognormal:3.9:0.5")
+    parser.add_argument("--error-rate", type=float, default=REPLAY_CONFIG["error_rate"])
+    parser.add_argument("--error-status", type=int, default=REPLAY_CONFIG["error_status"])
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    responder = Responder(
+        Cassette(args.cassette), args.dimensions, args.latency, args.error_rate, args.error_status, args.seed
+    )
+    server = ThreadingHTTPServer((args.host, args.port), _StandInHandler)
+    server.daemon_threads = True
+    server.responder = responder
+    print(f"替身服務監聽 http://{args.host}:{server.server_address[1]}/v1 "
+          f"(錄製 {len(responder.cassette.embeddings)} 條 embedding、{len(responder.cassette.chats)} 條 chat)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"統計：{responder.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+第二階段重排
+
+第一階段只按 embedding 距離排序。這裡在檢索之後對前 top_n 個候選批量重排，
+並受每個請求的時間預算約束：超出預算 (或重排出錯) 時保持第一階段順序，並在報告中註明。
+
+可插拔的 reranker 只需提供 name 屬性與 score(query, candidates, deadline) 方法：
+candidates 為 [{"id", "text", "metadata", "distance"}]，返回與其對齊的分數列表 (越高越前)，
+在 deadline (time.perf_counter() 時刻) 前無法完成時返回 None。可選的 prepare() 在引擎初始化時呼叫。
+
+內建：
+- FeatureReranker: 純 CPU 特徵打分 — 第一階段相似度、查詢與 prompt 的詞項重疊、
+  查詢暗示的 prompting 技巧與記錄技巧的匹配、查詢暗示的複雜度與 prompt 複雜度的吻合
+- CrossEncoderReranker: 本地小型 cross-encoder (需安裝 sentence-transformers，CPU 推理)
+
+用法：
+    PROMPT_RAG_RERANKER=features streamlit run app.py
+    rag_system = PromptGeneratorRAGSystem(reranker=FeatureReranker())
+"""
+
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from source_code.config import RERANK_CONFIG
+
+_TERM = re.compile(r"[a-z0-9]+|[一-鿿]")
+_TECHNIQUE = re.compile(r"[A-Z][A-Z_]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by can for from how i in into is it me my of on or please so that the "
+    "this to up us we what when which will with you your write make create give help".split()
+)
+
+# 查詢中的線索 → 數據集 prompting_techniques 欄位的技巧名稱
+TECHNIQUE_HINTS = {
+    "CHAIN_OF_THOUGHT": ("step by step", "step-by-step", "reasoning", "chain of thought", "逐步", "推理", "思考過程"),
+    "ROLE_PROMPTING": ("act as", "you are", "role", "persona", "扮演", "角色"),
+    "ONE_SHOT_FEW_SHOT": ("example", "few-shot", "few shot", "one-shot", "範例", "例子", "示例"),
+    "CODE_PROMPTING": ("code", "function", "python", "script", "program", "代碼", "程式", "函數"),
+    "CONTEXTUAL_PROMPTING": ("context", "background", "上下文", "背景"),
+    "STEP_BACK_PROMPTING": ("principle", "fundamental", "big picture", "原理", "原則", "本質"),
+    "SYSTEM_PROMPTING": ("format", "json", "template", "格式", "模板"),
+    "TREE_OF_THOUGHTS": ("alternative", "options", "brainstorm", "explore", "方案", "多種", "腦力激盪"),
+    "SELF_CONSISTENCY": ("verify", "double-check", "consistent", "驗證", "檢查", "一致")
+}
+
+# 查詢中的線索 → 期望的 complexity
+COMPLEXITY_HINTS = {
+    "low": ("simple", "basic", "quick", "short", "brief", "easy", "簡單", "基本", "快速", "簡短"),
+    "high": ("detailed", "advanced", "comprehensive", "in-depth", "expert", "complex", "thorough",
+             "詳細", "進階", "專業", "深入", "複雜", "全面")
+}
+
+
+def _terms(text: str) -> Set[str]:
+    """詞項集合：小寫英數詞 (去除停用詞與過短的詞) 與單個中文字"""
+    return {
+        term for term in _TERM.findall((text or "").lower())
+        if len(term) > 2 or "一" <= term[0] <= "鿿"
+    } - _STOPWORDS
+
+
+def _hints(query: str, table: Dict[str, Tuple[str, ...]]) -> Set[str]:
+    lowered = query.lower()
+    return {name for name, cues in table.items() if any(cue in lowered for cue in cues)}
+
+
+class FeatureReranker:
+    """特徵打分 reranker (純 CPU，不需模型)
+
+    分數 = Σ 權重 × 特徵，特徵皆在 [0, 1]：
+    - similarity: 第一階段相似度 (由平方 L2 距離換算，1 - d / 2)
+    - overlap: 查詢詞項出現在 prompt 中的比例
+    - technique: 查詢暗示的技巧中，該記錄使用了的比例 (查詢沒有暗示時為 0)
+    - complexity: 查詢暗示複雜度時，相同為 1、medium 為 0.5、否則 0
+
+    Args:
+        dataset_path: 讀取各記錄 prompting_techniques 的數據集，預設 PROCESSED_DATASET
+        weights: 特徵權重，預設 RERANK_CONFIG["weights"]
+    """
+
+    name = "features"
+
+    def __init__(self, dataset_path: Optional[str] = None, weights: Optional[Dict[str, float]] = None):
+        self.dataset_path = dataset_path
+        self.weights = dict(RERANK_CONFIG["weights"], **(weights or {}))
+        self._techniques = None
+
+    def prepare(self):
+        """載入 record_id → 技巧集合 (在請求路徑之外執行，避免首個請求超出預算)"""
+        if self._techniques is not None:
+            return
+        from source_code.config import PROCESSED_DATASET
+        from source_code.dataset_store import load_dataset
+
+        techniques = {}
+        try:
+            df = load_dataset(["record_id", "prompting_techniques"], csv_path=str(self.dataset_path or PROCESSED_DATASET))
+            for record_id, value in zip(df["record_id"], df["prompting_techniques"]):
+                techniques[f"record_{record_id}"] = set(_TECHNIQUE.findall(str(value)))
+        except Exception as e:
+            print(f"技巧特徵不可用：{str(e)}")
+        self._techniques = techniques
+
+    def score(self, query: str, candidates: List[Dict[str, Any]], deadline: float) -> Optional[List[float]]:
+        if self._techniques is None:
+            self.prepare()
+        query_terms = _terms(query)
+        wanted_techniques = _hints(query, TECHNIQUE_HINTS)
+        wanted_complexity = _hints(query, COMPLEXITY_HINTS)
+        weights = self.weights
+
+        scores = []
+        for candidate in candidates:
+            if time.perf_counter() > deadline:
+                return None
+            similarity = max(0.0, 1.0 - float(candidate["distance"]) / 2)
+            overlap = len(query_terms & _terms(candidate["text"])) / len(query_terms) if query_terms else 0.0
+            technique = 0.0
+            if wanted_techniques:
+                used = self._techniques.get(candidate["id"], set())
+                technique = len(wanted_techniques & used) / len(wanted_techniques)
+            complexity = 0.0
+            if len(wanted_complexity) == 1:
+                actual = (candidate.get("metadata") or {}).get("complexity")
+                complexity = 1.0 if actual in wanted_complexity else 0.5 if actual == "medium" else 0.0
+            scores.append(
+                weights["similarity"] * similarity
+                + weights["overlap"] * overlap
+                + weights["technique"] * technique
+                + weights["complexity"] * complexity
+            )
+        return scores
+
+
+class CrossEncoderReranker:
+    """本地 cross-encoder reranker (sentence-transformers，CPU)
+
+    單次批量推理無法中途中止：推理在專用線程執行，請求只等待剩餘預算；
+    逾時的推理在背景完成後丟棄，期間後續請求排隊等待同一線程，因而同樣退回第一階段順序。
+    """
+
+    name = "cross-encoder"
+
+    def __init__(self, model: Optional[str] = None, batch_size: int = 32):
+        self.model_name = model or RERANK_CONFIG["model"]
+        self.batch_size = batch_size
+        self._model = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cross-encoder")
+
+    def prepare(self):
+        if self._model is None:
+            from sentence_transformers import CrossEncoder
+            self._model = CrossEncoder(self.model_name, device="cpu")
+
+    def score(self, query: str, candidates: List[Dict[str, Any]], deadline: float) -> Optional[List[float]]:
+        if self._model is None:
+            self.prepare()
+        pairs = [(query, candidate["text"] or "") for candidate in candidates]
+        future = self._executor.submit(self._model.predict, pairs, batch_size=self.batch_size, show_progress_bar=False)
+        try:
+            return [float(value) for value in future.result(timeout=max(0.0, deadline - time.perf_counter()))]
+        except FutureTimeoutError:
+            return None
+
+
+def build_reranker(name: Optional[str] = None, dataset_path: Optional[str] = None):
+    """依名稱 (預設 RERANK_CONFIG["reranker"]) 建立 reranker；none 時返回 None"""
+    name = (name or RERANK_CONFIG["reranker"]).lower()
+    if name in ("", "none", "off"):
+        return None
+    if name == "features":
+        return FeatureReranker(dataset_path)
+    if name == "cross-encoder":
+        return CrossEncoderReranker()
+    raise ValueError(f"未知的 reranker：{name}")
+
+
+def rerank(
+    reranker,
+    query: str,
+    candidates: List[Dict[str, Any]],
+    budget_ms: Optional[float] = None
+) -> Tuple[List[int], Optional[List[float]], Dict[str, Any]]:
+    """在時間預算內重排候選
+
+    Returns:
+        (候選索引的新順序, 與候選對齊的分數, 報告 {"reranker", "candidates", "applied", "ms", "fallback"?})；
+        超出預算或出錯時順序不變、分數為 None，fallback 註明原因
+    """
+    budget_ms = RERANK_CONFIG["budget_ms"] if budget_ms is None else budget_ms
+    order = list(range(len(candidates)))
+    start = time.perf_counter()
+    fallback = None
+    try:
+        scores = reranker.score(query, candidates, start + budget_ms / 1000)
+    except Exception as e:
+        scores, fallback = None, f"error: {str(e)}"
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    if fallback is None and (scores is None or elapsed_ms > budget_ms):
+        fallback = "budget"
+    if fallback is None:
+        order.sort(key=lambda i: -scores[i])
+    else:
+        scores = None
+
+    report = {
+        "reranker": getattr(reranker, "name", type(reranker).__name__),
+        "candidates": len(candidates),
+        "applied": fallback is None,
+        "ms": round(elapsed_ms, 3)
+    }
+    if fallback is not None:
+        report["fallback"] = fallback
+    return order, scores, report
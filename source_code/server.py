@@ -0,0 +1,417 @@
+# -*- coding: utf-8 -*-
+"""
+Prompt RAG HTTP 服務
+
+獨立於 Streamlit 的檢索服務。主進程確認 (必要時重建) 向量快照後綁定監聽 socket，
+再 fork 出多個 worker；每個 worker 以 mmap 開啟同一份唯讀快照 (共用 page cache)，
+在自己的線程池中處理請求，並在 worker 異常退出時由主進程補上。
+
+端點：
+- POST /query     {"query": str, "context": str?, "profile": bool?, "lazy": bool?, "bundles": bool?, "diversify": bool?}
+- POST /filter    {"query": str, "filters": {"prompt_type": str?, "complexity": str?}, "lazy": bool?,
+                   "page_size": int?, "cursor": str?, "bundles": bool?}  提供 page_size 或 cursor 時分頁
+- POST /batch     {"queries": [{"query": str, "context": str?, "filters": {...}?}, ...], "lazy": bool?}
+- POST /documents {"ids": [str, ...]}  按需取回 lazy 結果的全文
+- POST /aliases   {"ids": [str, ...]}  展開代表文檔的近似重複別名
+- GET  /healthz 進程存活
+- GET  /readyz  快照已載入並預熱 (未就緒時返回 503，檢索端點亦同)；warmup 為背景查詢預熱的進度
+
+用法：
+    python -m source_code.server --workers 4 --port 8000
+    python -m source_code.server --rebuild        # 強制重建快照
+    python -m source_code.server --workers 1 --shards 4 --shard-by prompt_type
+
+--shards N 時每個 worker 將快照分給 N 個常駐分片進程並行檢索 (source_code/sharding.py)，
+總進程數為 workers × shards，大型數據集建議減少 workers。
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+
+from source_code.config import (
+    DEDUP_CONFIG,
+    PROCESSED_DATASET,
+    PROJECTION_CONFIG,
+    SERVER_CONFIG,
+    SHARDING_CONFIG,
+    WARMUP_CONFIG
+)
+from source_code.vector_snapshot import SnapshotCollection, embedding_model_name, export_collection, read_manifest
+
+
+def _dataset_source(dataset_path: str, embedding_function=None) -> Dict[str, Any]:
+    """快照的來源指紋：數據集內容、embedding 模型、近似重複合併與投影維度設定"""
+    digest = hashlib.sha256()
+    with open(dataset_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    embedding = embedding_model_name(embedding_function)
+    dedup = DEDUP_CONFIG["threshold"] if DEDUP_CONFIG["enabled"] else None
+    return {
+        "dataset": os.path.abspath(dataset_path),
+        "sha256": digest.hexdigest(),
+        "embedding": embedding,
+        "dedup": dedup,
+        "projection": PROJECTION_CONFIG["dimensions"] or None
+    }
+
+
+def _same_source(recorded: Dict[str, Any], source: Dict[str, Any]) -> bool:
+    """比較來源指紋；數據集的絕對路徑因節點而異，只比較內容與設定"""
+    return {k: v for k, v in recorded.items() if k != "dataset"} == {k: v for k, v in source.items() if k != "dataset"}
+
+
+def ensure_snapshot(snapshot_dir: str, dataset_path: str, embedding_function=None, rebuild: bool = False) -> Dict[str, Any]:
+    """確認快照與數據集一致，否則 ingest 數據集並重新匯出
+
+    Returns:
+        快照 manifest
+
+    Raises:
+        ValueError: 本機沒有數據集，而匯入快照的 embedding 模型與查詢使用的不符
+    """
+    manifest = read_manifest(snapshot_dir)
+    if manifest is not None and not rebuild and not os.path.exists(dataset_path):
+        # 由其他節點匯入的快照 (cli import)：本機沒有數據集時直接使用，但 embedding 模型必須一致
+        expected_model = embedding_model_name(embedding_function)
+        if manifest.get("embedding_model") != expected_model:
+            raise ValueError(f"快照的 embedding 模型為 {manifest.get('embedding_model')}，查詢將使用 {expected_model}")
+        print(f"使用匯入的向量快照：{snapshot_dir} ({manifest['count']} 條，本機無數據集)")
+        return manifest
+
+    source = _dataset_source(dataset_path, embedding_function)
+    if manifest is not None and _same_source(manifest.get("source") or {}, source) and not rebuild:
+        print(f"使用現有向量快照：{snapshot_dir} ({manifest['count']} 條)")
+        return manifest
+
+    from source_code.prompt_rag_system import PromptGeneratorRAGSystem
+
+    print(f"建立向量快照：{snapshot_dir}")
+    rag_system = PromptGeneratorRAGSystem(embedding_function=embedding_function, dataset_path=dataset_path)
+    manifest = export_collection(
+        rag_system.collection, snapshot_dir, source=source, projection_dimensions=PROJECTION_CONFIG["dimensions"]
+    )
+    rag_system.chroma_client.delete_collection(rag_system.collection.name)
+    projection = manifest.get("projection")
+    suffix = f"，PCA {projection['dimensions']} 維 (解釋變異 {projection['explained_variance']:.1%})" if projection else ""
+    print(f"向量快照已建立：{manifest['count']} 條，{manifest['dimensions']} 維{suffix}")
+    return manifest
+
+
+class WorkerState:
+    """單一 worker 的引擎與就緒狀態"""
+
+    def __init__(self, snapshot_dir: str, embedding_function=None, shards: int = 0, partition: Optional[str] = None):
+        self.snapshot_dir = snapshot_dir
+        self.embedding_function = embedding_function
+        self.shards = shards
+        self.partition = partition
+        self.rag_system = None
+        self.ready = threading.Event()
+        self.error = None
+        self.started = time.time()
+        self.warm_seconds = None
+        self.warmer = None
+
+    def load(self):
+        """開啟快照、預熱 page cache 並建立引擎 (在背景線程執行)"""
+        try:
+            from source_code.prompt_rag_system import PromptGeneratorRAGSystem
+
+            if self.shards > 1:
+                from source_code.sharding import ShardedCollection
+                collection = ShardedCollection(self.snapshot_dir, shards=self.shards, partition=self.partition)
+            else:
+                collection = SnapshotCollection(self.snapshot_dir)
+            self.warm_seconds = collection.warm()
+            self.rag_system = PromptGeneratorRAGSystem(
+                embedding_function=self.embedding_function,
+                collection=collection
+            )
+            self.ready.set()
+            print(f"[worker {os.getpid()}] 就緒：{collection.count()} 條，預熱 {self.warm_seconds:.2f}s")
+            # 就緒後在背景預熱 embedding 快取與檢索路徑 (每個 worker 各有自己的快取)
+            if WARMUP_CONFIG["enabled"]:
+                from source_code.warmup import CacheWarmer
+                self.warmer = CacheWarmer(self.rag_system).start()
+        except Exception as e:
+            self.error = str(e)
+            print(f"[worker {os.getpid()}] 載入失敗：{str(e)}")
+
+
+class RAGRequestHandler(BaseHTTPRequestHandler):
+    """JSON 請求處理；引擎返回的錯誤字典照常以 200 返回，與直接調用引擎一致"""
+
+    protocol_version = "HTTP/1.1"
+    server_version = "PromptRAG/1.0"
+
+    def log_message(self, format, *args):
+        # 預設每個請求都寫 stderr，高併發時成為瓶頸；僅保留錯誤日誌
+        pass
+
+    def _send_json(self, status: int, payload: Dict[str, Any]):
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> Optional[Dict[str, Any]]:
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > SERVER_CONFIG["max_body_bytes"]:
+            self._send_json(413, {"error": "請求主體過大"})
+            return None
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": "無效的 JSON"})
+            return None
+        if not isinstance(payload, dict):
+            self._send_json(400, {"error": "請求主體必須是 JSON 物件"})
+            return None
+        return payload
+
+    def do_GET(self):
+        state: WorkerState = self.server.worker_state
+        if self.path == "/healthz":
+            self._send_json(200, {"status": "ok", "worker": os.getpid()})
+        elif self.path == "/readyz":
+            if state.ready.is_set():
+                self._send_json(200, {
+                    "status": "ready",
+                    "worker": os.getpid(),
+                    "documents": state.rag_system.collection.count(),
+                    "warm_seconds": state.warm_seconds,
+                    "warmup": state.warmer.status() if state.warmer is not None else None
+                })
+            else:
+                self._send_json(503, {"status": "loading", "worker": os.getpid(), "error": state.error})
+        else:
+            self._send_json(404, {"error": f"未知路徑：{self.path}"})
+
+    def do_POST(self):
+        state: WorkerState = self.server.worker_state
+        if self.path not in ("/query", "/filter", "/batch", "/documents", "/aliases"):
+            self._send_json(404, {"error": f"未知路徑：{self.path}"})
+            return
+        payload = self._read_json()
+        if payload is None:
+            return
+        if not state.ready.is_set():
+            self._send_json(503, {"error": "索引尚未就緒"})
+            return
+
+        try:
+            status, result = self._dispatch(state.rag_system, payload)
+        except Exception as e:
+            # 引擎未預期的異常也以 JSON 回應，而不是中斷連線
+            print(f"[worker {os.getpid()}] {self.path} 處理錯誤：{str(e)}")
+            status, result = 500, {"error": f"內部錯誤：{str(e)}"}
+        self._send_json(status, result)
+
+    def _dispatch(self, rag_system, payload: Dict[str, Any]):
+        """執行端點並返回 (HTTP 狀態碼, 回應主體)"""
+        error = _validate_flags(payload, ("lazy", "bundles", "profile", "diversify"))
+        if error:
+            return 400, {"error": error}
+        lazy = bool(payload.get("lazy"))
+        bundles = bool(payload.get("bundles"))
+        if self.path in ("/documents", "/aliases"):
+            ids = payload.get("ids")
+            if not isinstance(ids, list) or not all(isinstance(doc_id, str) for doc_id in ids):
+                return 400, {"error": "ids 必須是字串列表"}
+            if self.path == "/documents":
+                return 200, {"documents": rag_system.get_documents(ids)}
+            return 200, {"aliases": rag_system.get_aliases(ids)}
+        if self.path == "/batch":
+            queries = payload.get("queries")
+            if not isinstance(queries, list) or not all(isinstance(q, dict) for q in queries):
+                return 400, {"error": "queries 必須是包含 query 的物件列表"}
+            for i, item in enumerate(queries):
+                error = _validate_query(item)
+                if error:
+                    return 400, {"error": f"queries[{i}]：{error}"}
+            return 200, {"results": rag_system.batch_query(queries, lazy=lazy)}
+
+        error = _validate_query(payload)
+        if error:
+            return 400, {"error": error}
+        query = payload["query"]
+        if self.path == "/query":
+            diversify = payload.get("diversify")
+            return 200, rag_system.query(
+                query, payload.get("context"), profile=bool(payload.get("profile")), lazy=lazy, bundles=bundles,
+                diversify=None if diversify is None else bool(diversify)
+            )
+        page_size = payload.get("page_size")
+        cursor = payload.get("cursor")
+        if (page_size is not None and not isinstance(page_size, int)) or (cursor is not None and not isinstance(cursor, str)):
+            return 400, {"error": "page_size 必須是整數，cursor 必須是字串"}
+        return 200, rag_system.apply_user_filter(
+            query, payload.get("filters") or {}, lazy=lazy, page_size=page_size, cursor=cursor, bundles=bundles
+        )
+
+
+def _validate_query(item: Dict[str, Any]) -> Optional[str]:
+    """檢查查詢物件的欄位型別，無效時返回錯誤訊息"""
+    query = item.get("query")
+    if not isinstance(query, str) or not query.strip():
+        return "缺少 query"
+    if item.get("context") is not None and not isinstance(item["context"], str):
+        return "context 必須是字串"
+    if item.get("filters") is not None and not isinstance(item["filters"], dict):
+        return "filters 必須是物件"
+    return None
+
+
+def _validate_flags(payload: Dict[str, Any], names) -> Optional[str]:
+    """開關欄位必須是 JSON 布林值 (或省略 / null)；字串 "false" 等視為無效，而非以真值判斷"""
+    invalid = [name for name in names if payload.get(name) is not None and not isinstance(payload[name], bool)]
+    if invalid:
+        return f"{', '.join(invalid)} 必須是布林值"
+    return None
+
+
+def _run_worker(server: ThreadingHTTPServer, snapshot_dir: str, embedding_function=None, shards: int = 0, partition: Optional[str] = None):
+    """worker 主迴圈：背景載入快照，同時開始接受請求 (未就緒時返回 503)"""
+    state = WorkerState(snapshot_dir, embedding_function, shards, partition)
+    server.worker_state = state
+    threading.Thread(target=state.load, daemon=True).start()
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def serve(
+    host: Optional[str] = None,
+    port: Optional[int] = None,
+    workers: Optional[int] = None,
+    snapshot_dir: Optional[str] = None,
+    dataset_path: Optional[str] = None,
+    embedding_function=None,
+    rebuild: bool = False,
+    shards: Optional[int] = None,
+    partition: Optional[str] = None
+):
+    """啟動服務 (阻塞直到收到 SIGINT / SIGTERM)
+
+    Args:
+        host / port: 監聽位址，預設取自 SERVER_CONFIG
+        workers: worker 進程數；1 或平台不支援 fork 時在主進程內服務
+        snapshot_dir: 向量快照目錄
+        dataset_path: 數據集 CSV 路徑，用於建立或驗證快照
+        embedding_function: 可選的 embedding 函數，未提供時使用引擎預設 (OpenAI)
+        rebuild: 強制重建快照
+        shards / partition: 每個 worker 的分片進程數與分片方式，預設取自 SHARDING_CONFIG
+    """
+    host = host or SERVER_CONFIG["host"]
+    port = SERVER_CONFIG["port"] if port is None else port
+    workers = workers or SERVER_CONFIG["workers"]
+    snapshot_dir = snapshot_dir or SERVER_CONFIG["snapshot_dir"]
+    dataset_path = dataset_path or str(PROCESSED_DATASET)
+
+    shards = SHARDING_CONFIG["shards"] if shards is None else shards
+    partition = partition or SHARDING_CONFIG["partition"]
+
+    ensure_snapshot(snapshot_dir, dataset_path, embedding_function, rebuild)
+    if shards > 1:
+        # 在 fork 之前寫好分片文件，worker 只需開啟
+        from source_code.sharding import ensure_shards
+        layout = ensure_shards(SnapshotCollection(snapshot_dir), shards, partition)
+        print(f"分片檢索：{shards} 個分片 ({partition})，各分片 {[entry['size'] for entry in layout['shards']]} 條")
+
+    server = ThreadingHTTPServer((host, port), RAGRequestHandler)
+    server.daemon_threads = True
+    print(f"Prompt RAG 服務監聽 http://{host}:{server.server_address[1]} ({workers} 個 worker)")
+
+    if workers <= 1 or not hasattr(os, "fork"):
+        try:
+            _run_worker(server, snapshot_dir, embedding_function, shards, partition)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    # 主進程只負責監督：所有 worker 在同一個監聽 socket 上 accept
+    children = set()
+    stopping = threading.Event()
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            code = 0
+            try:
+                _run_worker(server, snapshot_dir, embedding_function, shards, partition)
+            except Exception as e:
+                print(f"[worker {os.getpid()}] 異常退出：{str(e)}")
+                code = 1
+            finally:
+                os._exit(code)
+        children.add(pid)
+
+    def stop(*_):
+        stopping.set()
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(workers):
+        spawn()
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.discard(pid)
+        if not stopping.is_set():
+            print(f"worker {pid} 退出 (狀態 {status})，重新啟動")
+            time.sleep(1)
+            spawn()
+    server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prompt RAG HTTP 服務")
+    parser.add_argument("--host", default=SERVER_CONFIG["host"])
+    parser.add_argument("--port", type=int, default=SERVER_CONFIG["port"])
+    parser.add_argument("--workers", type=int, default=SERVER_CONFIG["workers"])
+    parser.add_argument("--snapshot-dir", default=SERVER_CONFIG["snapshot_dir"])
+    parser.add_argument("--dataset", default=str(PROCESSED_DATASET))
+    parser.add_argument("--rebuild", action="store_true", help="強制重建向量快照")
+    parser.add_argument("--shards", type=int, default=SHARDING_CONFIG["shards"], help="每個 worker 的分片進程數 (0 或 1 不分片)")
+    parser.add_argument("--shard-by", choices=["hash", "prompt_type"], default=SHARDING_CONFIG["partition"])
+    args = parser.parse_args()
+
+    try:
+        from source_code.config import initialize_environment
+        initialize_environment()
+    except Exception as e:
+        print(f"❌ 環境初始化失敗：{str(e)}")
+        sys.exit(1)
+
+    serve(
+        args.host, args.port, args.workers, args.snapshot_dir, args.dataset,
+        rebuild=args.rebuild, shards=args.shards, partition=args.shard_by
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,531 @@
+# -*- coding: utf-8 -*-
+"""
+多進程分片檢索
+
+單一 collection 的每次查詢只用一個核心，數據集複製到數十萬條後延遲隨規模線性增長。
+這裡將向量快照 (vector_snapshot) 按 prompt_type 或 ID 雜湊切分為 N 個分片：
+
+- 每個分片寫成快照目錄下 shards/<方式>-<N>/shard_<i>/ 的連續陣列 (全域行號、向量、範數、metadata 編碼、
+  可選的投影向量)，由一個常駐 worker 進程以 mmap 開啟，同一台機器上的多個服務進程共用 page cache
+- 查詢時父進程把查詢向量以 float32 原始位元組經 pipe 分發到相關分片 (where 帶 prompt_type 等值或 $in 條件時
+  只發送到含有該類型的分片)；各分片返回 top-k 的 (全域行號, 距離) 陣列，父進程以 heapq 合併出全域 top-k，
+  再從自己的 mmap 讀取 id、文檔與 metadata
+- 按 prompt_type 分片時，超過平均大小的類型會拆到多個分片，再以最長處理時間優先 (LPT) 平衡各分片大小
+
+ShardedCollection 實作引擎用到的 collection 介面 (count / query / get)，可直接注入
+PromptGeneratorRAGSystem(collection=...)。同一個 ShardedCollection 的查詢依序經過分片 (每個查詢已用上所有分片的核心)。
+
+用法：
+    python -m source_code.sharding --shards 4 --by prompt_type --replicate 50
+"""
+
+import argparse
+import heapq
+import json
+import math
+import os
+import shutil
+import signal
+import threading
+import time
+import zlib
+from itertools import islice
+from typing import Any, Dict, List, Optional, Set
+
+from source_code.config import SERVER_CONFIG, SHARDING_CONFIG
+from source_code.vector_snapshot import (
+    DEFAULT_INCLUDE,
+    SnapshotCollection,
+    rank_rows,
+    read_manifest,
+    value_lookup,
+    where_mask
+)
+
+LAYOUT_VERSION = 1
+PARTITIONS = ("hash", "prompt_type")
+
+
+def plan_shards(snapshot: SnapshotCollection, shards: int, partition: str):
+    """將快照的行號分配到各分片
+
+    Returns:
+        長度為 shards 的列表，每項為遞增的全域行號陣列 (可能為空)
+    """
+    import numpy as np
+
+    count = snapshot.count()
+    if partition == "hash":
+        # crc32 在各進程與各次執行間穩定 (不受 PYTHONHASHSEED 影響)
+        assignment = np.fromiter(
+            (zlib.crc32(snapshot.ids[row].encode("utf-8")) % shards for row in range(count)),
+            dtype=np.int64,
+            count=count
+        )
+        return [np.flatnonzero(assignment == shard) for shard in range(shards)]
+
+    if partition == "prompt_type":
+        codes = snapshot.metadata_codes.get("prompt_type")
+        if codes is None:
+            raise ValueError("快照沒有 prompt_type metadata，無法按類型分片")
+        target = max(1, math.ceil(count / shards))
+        pieces = []
+        for code in np.unique(codes):
+            rows = np.flatnonzero(codes == code)
+            pieces.extend(np.array_split(rows, math.ceil(len(rows) / target)))
+        loads = [0] * shards
+        assigned = [[] for _ in range(shards)]
+        for piece in sorted(pieces, key=len, reverse=True):
+            shard = loads.index(min(loads))
+            assigned[shard].append(piece)
+            loads[shard] += len(piece)
+        return [np.sort(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64) for parts in assigned]
+
+    raise ValueError(f"不支援的分片方式：{partition} (可選 {', '.join(PARTITIONS)})")
+
+
+def _layout_dir(snapshot: SnapshotCollection, shards: int, partition: str) -> str:
+    return os.path.join(snapshot.path, "shards", f"{partition}-{shards}")
+
+
+def _read_layout(directory: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(directory, "layout.json"), "r", encoding="utf-8") as f:
+            layout = json.load(f)
+        return layout if layout.get("version") == LAYOUT_VERSION else None
+    except (OSError, ValueError):
+        return None
+
+
+def ensure_shards(snapshot: SnapshotCollection, shards: int, partition: str) -> Dict[str, Any]:
+    """確認分片文件與快照一致，否則重新切分並寫出 (先寫入臨時目錄再替換)
+
+    Returns:
+        分片佈局：{"path", "partition", "shards": [{"size", "prompt_types"}], ...}
+    """
+    import numpy as np
+
+    directory = _layout_dir(snapshot, shards, partition)
+    source = {"created_at": snapshot.manifest["created_at"], "count": snapshot.count()}
+    layout = _read_layout(directory)
+    if layout is not None and layout["source"] == source:
+        layout["path"] = directory
+        return layout
+
+    staging = f"{directory}.tmp-{os.getpid()}"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    type_codes = snapshot.metadata_codes.get("prompt_type")
+    type_values = snapshot.metadata_values.get("prompt_type", [])
+    entries = []
+    for shard, rows in enumerate(plan_shards(snapshot, shards, partition)):
+        target = os.path.join(staging, f"shard_{shard}")
+        os.makedirs(target)
+        np.save(os.path.join(target, "rows.npy"), rows.astype(np.int64))
+        np.save(os.path.join(target, "vectors.npy"), np.ascontiguousarray(snapshot.vectors[rows]))
+        np.save(os.path.join(target, "norms.npy"), np.ascontiguousarray(snapshot.norms[rows]))
+        for key, codes in snapshot.metadata_codes.items():
+            np.save(os.path.join(target, f"meta_{key}.npy"), np.ascontiguousarray(codes[rows]))
+        if snapshot.projection is not None:
+            np.save(os.path.join(target, "projected.npy"), np.ascontiguousarray(snapshot.projected[rows]))
+            np.save(os.path.join(target, "projected_norms.npy"), np.ascontiguousarray(snapshot.projected_norms[rows]))
+        present = sorted(int(code) for code in np.unique(type_codes[rows]) if code >= 0) if type_codes is not None else []
+        entries.append({"size": int(len(rows)), "prompt_types": [type_values[code] for code in present]})
+
+    layout = {"version": LAYOUT_VERSION, "source": source, "partition": partition, "shards": entries}
+    with open(os.path.join(staging, "layout.json"), "w", encoding="utf-8") as f:
+        json.dump(layout, f, ensure_ascii=False, indent=2)
+
+    shutil.rmtree(directory, ignore_errors=True)
+    try:
+        os.replace(staging, directory)
+    except OSError:
+        # 另一個進程同時寫好了相同的分片
+        shutil.rmtree(staging, ignore_errors=True)
+        existing = _read_layout(directory)
+        if existing is None or existing["source"] != source:
+            raise
+        layout = existing
+    layout["path"] = directory
+    return layout
+
+
+class _Shard:
+    """worker 進程內的單一分片 (屬性與 SnapshotCollection 相同，可直接交給 rank_rows)"""
+
+    def __init__(self, directory: str, snapshot_path: str, rerank_depth: Optional[int] = None):
+        import numpy as np
+
+        manifest = read_manifest(snapshot_path)
+        if manifest is None:
+            raise ValueError(f"無效的向量快照：{snapshot_path}")
+        self.dimensions = manifest["dimensions"]
+        self.rows = np.load(os.path.join(directory, "rows.npy"), mmap_mode="r")
+        self.vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+        self.norms = np.load(os.path.join(directory, "norms.npy"), mmap_mode="r")
+        self.metadata_codes = {
+            key: np.load(os.path.join(directory, f"meta_{key}.npy"), mmap_mode="r")
+            for key in manifest["metadata"]
+        }
+        self.value_codes = value_lookup(manifest["metadata"])
+
+        self.projection = None
+        if manifest.get("projection"):
+            from source_code.config import PROJECTION_CONFIG
+            from source_code.projection import PCAProjection
+            self.projection = PCAProjection.load(snapshot_path)
+            self.projected = np.load(os.path.join(directory, "projected.npy"), mmap_mode="r")
+            self.projected_norms = np.load(os.path.join(directory, "projected_norms.npy"), mmap_mode="r")
+            self.rerank_depth = PROJECTION_CONFIG["rerank_depth"] if rerank_depth is None else rerank_depth
+
+    def warm(self) -> float:
+        start = time.perf_counter()
+        float((self.projected if self.projection is not None else self.vectors).sum())
+        float(self.norms.sum())
+        return time.perf_counter() - start
+
+    def search(self, queries, n_results: int, where: Optional[Dict[str, Any]]):
+        """返回 (全域行號, 距離) 兩個形狀為 (查詢數, k) 的陣列，每列按距離遞增"""
+        import numpy as np
+
+        candidates = None
+        if where:
+            candidates = np.flatnonzero(where_mask(where, self.metadata_codes, self.value_codes, len(self.rows)))
+        ranked = rank_rows(self, queries, candidates, n_results)
+        k = len(ranked[0][0]) if ranked else 0
+        rows = np.empty((len(ranked), k), dtype=np.int64)
+        distances = np.empty((len(ranked), k), dtype=np.float32)
+        for i, (local, row_distances) in enumerate(ranked):
+            rows[i] = self.rows[np.asarray(local, dtype=np.int64)]
+            distances[i] = row_distances
+        return rows, distances
+
+
+def _shard_worker(directory: str, snapshot_path: str, rerank_depth: Optional[int], conn):
+    """分片 worker 主迴圈
+
+    協定：父進程發送 ("query", n_results, where) 後緊接查詢向量的 float32 位元組，
+    worker 回覆 ("ok", 形狀) 與行號、距離兩段位元組；("warm",) 預熱；None 結束。
+    """
+    import numpy as np
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl-C 由父進程處理
+    try:
+        shard = _Shard(directory, snapshot_path, rerank_depth)
+    except Exception as e:
+        conn.send(("error", str(e)))
+        return
+    conn.send(("ready", len(shard.rows)))
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        payload = conn.recv_bytes() if message[0] == "query" else None
+        try:
+            if message[0] == "warm":
+                conn.send(("ok", shard.warm()))
+                continue
+            _, n_results, where = message
+            queries = np.frombuffer(payload, dtype=np.float32).reshape(-1, shard.dimensions)
+            rows, distances = shard.search(queries, n_results, where)
+        except Exception as e:
+            conn.send(("error", str(e)))
+            continue
+        conn.send(("ok", rows.shape))
+        conn.send_bytes(rows)
+        conn.send_bytes(distances)
+
+
+def requested_prompt_types(where: Optional[Dict[str, Any]]) -> Optional[Set[Any]]:
+    """where 條件限定的 prompt_type 集合；無法確定 (未限定或使用 $ne 等) 時返回 None"""
+    if not where:
+        return None
+    if "$and" in where:
+        sets = [found for found in map(requested_prompt_types, where["$and"]) if found is not None]
+        return set.intersection(*sets) if sets else None
+    if "$or" in where:
+        sets = [requested_prompt_types(clause) for clause in where["$or"]]
+        return None if not sets or any(found is None for found in sets) else set().union(*sets)
+    if "prompt_type" not in where:
+        return None
+    condition = where["prompt_type"]
+    if not isinstance(condition, dict):
+        return {condition}
+    operator, operand = next(iter(condition.items()))
+    if operator == "$eq":
+        return {operand}
+    if operator == "$in":
+        return set(operand)
+    return None
+
+
+def merge_top_k(parts, k: int):
+    """合併多個按距離遞增的 (行號陣列, 距離陣列)，返回全域前 k 的 (行號列表, 距離列表)"""
+    merged = list(islice(heapq.merge(*(zip(distances.tolist(), rows.tolist()) for rows, distances in parts)), k))
+    return [row for _, row in merged], [max(distance, 0.0) for distance, _ in merged]
+
+
+class _ShardHandle:
+    """父進程側的分片 worker 句柄"""
+
+    def __init__(self, index: int, process, conn, prompt_types: List[Any]):
+        self.index = index
+        self.process = process
+        self.conn = conn
+        self.prompt_types = set(prompt_types)
+
+    def receive(self):
+        """讀取一次回覆；query 回覆返回 (行號, 距離) 陣列，錯誤時返回錯誤訊息字串"""
+        import numpy as np
+
+        try:
+            status = self.conn.recv()
+            if status[0] != "ok":
+                return str(status[1])
+            if not isinstance(status[1], tuple):
+                return status[1]
+            rows = np.frombuffer(self.conn.recv_bytes(), dtype=np.int64).reshape(status[1])
+            distances = np.frombuffer(self.conn.recv_bytes(), dtype=np.float32).reshape(status[1])
+            return rows, distances
+        except (EOFError, OSError):
+            return f"分片 worker {self.index} 已退出"
+
+
+class ShardedCollection:
+    """多進程分片的唯讀快照，提供 collection 相容的 count / query / get"""
+
+    def __init__(
+        self,
+        path: str,
+        shards: Optional[int] = None,
+        partition: Optional[str] = None,
+        rerank_depth: Optional[int] = None
+    ):
+        """
+        Args:
+            path: 快照目錄
+            shards: 分片 (worker 進程) 數，未提供時使用 SHARDING_CONFIG
+            partition: "hash" 或 "prompt_type"，未提供時使用 SHARDING_CONFIG
+            rerank_depth: 有投影時以原始向量重排的候選數
+        """
+        import multiprocessing
+
+        self.snapshot = SnapshotCollection(path, rerank_depth)
+        self.name = self.snapshot.name
+        self.layout = ensure_shards(
+            self.snapshot,
+            max(1, shards or SHARDING_CONFIG["shards"]),
+            partition or SHARDING_CONFIG["partition"]
+        )
+        self._lock = threading.Lock()
+        self._workers = []
+
+        # spawn：不繼承父進程的線程與 Chroma / HTTP 狀態，worker 只載入 numpy 與分片文件
+        context = multiprocessing.get_context("spawn")
+        for index, entry in enumerate(self.layout["shards"]):
+            if not entry["size"]:
+                continue
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(
+                target=_shard_worker,
+                args=(os.path.join(self.layout["path"], f"shard_{index}"), path, rerank_depth, child_conn),
+                name=f"prompt-rag-shard-{index}",
+                daemon=True
+            )
+            process.start()
+            child_conn.close()
+            self._workers.append(_ShardHandle(index, process, parent_conn, entry["prompt_types"]))
+
+        for worker in self._workers:
+            try:
+                status = worker.conn.recv()
+            except EOFError:
+                # spawn 會重新導入主模組；主模組未以 if __name__ == "__main__" 保護時 worker 在此退出
+                status = ("error", "worker 進程已退出")
+            if status[0] != "ready":
+                self.close()
+                raise RuntimeError(f"分片 {worker.index} 啟動失敗：{status[1]}")
+
+    @property
+    def shard_sizes(self) -> List[int]:
+        return [entry["size"] for entry in self.layout["shards"]]
+
+    def count(self) -> int:
+        return self.snapshot.count()
+
+    def warm(self) -> float:
+        """預熱 id、文檔與 metadata，並由各分片預熱自己的向量，返回耗時 (秒)"""
+        start = time.perf_counter()
+        self.snapshot.warm(vectors=False)
+        with self._lock:
+            for worker in self._workers:
+                worker.conn.send(("warm",))
+            for worker in self._workers:
+                worker.receive()
+        return time.perf_counter() - start
+
+    def _route(self, where: Optional[Dict[str, Any]]) -> List[_ShardHandle]:
+        wanted = requested_prompt_types(where)
+        if wanted is None:
+            return list(self._workers)
+        return [worker for worker in self._workers if worker.prompt_types & wanted]
+
+    def query(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int = 10,
+        where: Optional[Dict[str, Any]] = None,
+        include=DEFAULT_INCLUDE,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """分發到相關分片檢索後合併 top-k，返回與 Chroma collection.query 相同結構的結果"""
+        import numpy as np
+
+        queries = np.ascontiguousarray(np.asarray(query_embeddings, dtype=np.float32))
+        if queries.ndim == 1:
+            queries = queries[None, :]
+
+        targets = self._route(where)
+        with self._lock:
+            for worker in targets:
+                worker.conn.send(("query", n_results, where))
+                worker.conn.send_bytes(queries)
+            # 即使某個分片出錯也要讀完所有回覆，保持各 pipe 同步
+            replies = [worker.receive() for worker in targets]
+
+        errors = [reply for reply in replies if isinstance(reply, str)]
+        if errors:
+            raise RuntimeError(f"分片檢索失敗：{errors[0]}")
+        ranked = [
+            merge_top_k([(rows[i], distances[i]) for rows, distances in replies], n_results)
+            for i in range(len(queries))
+        ]
+        return self.snapshot.format_results(ranked, include)
+
+    def get(self, *args, **kwargs) -> Dict[str, Any]:
+        return self.snapshot.get(*args, **kwargs)
+
+    def field(self, ids: List[str], name: str) -> Dict[str, str]:
+        return self.snapshot.field(ids, name)
+
+    def close(self, timeout: float = 5.0):
+        """結束所有分片 worker"""
+        for worker in self._workers:
+            try:
+                worker.conn.send(None)
+            except (OSError, ValueError):
+                pass
+        for worker in self._workers:
+            worker.process.join(timeout)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.conn.close()
+        self._workers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _ReplicatedCollection:
+    """將快照重複 factor 次 (每份加入小擾動) 的唯讀 collection，只供規模測試匯出用"""
+
+    def __init__(self, snapshot: SnapshotCollection, factor: int, noise: float = 0.01):
+        self.snapshot = snapshot
+        self.factor = factor
+        self.noise = noise
+
+    def get(self, include=(), limit: Optional[int] = None, offset: int = 0, **kwargs) -> Dict[str, Any]:
+        import numpy as np
+
+        base = self.snapshot.count()
+        end = min(base * self.factor, offset + (limit or base * self.factor))
+        rows = np.arange(offset, end)
+        if not len(rows):
+            return {"ids": [], "documents": [], "metadatas": [], "embeddings": []}
+        source = rows % base
+        copies = rows // base
+        vectors = np.asarray(self.snapshot.vectors[source], dtype=np.float32)
+        rng = np.random.default_rng(offset)
+        vectors = vectors + (copies[:, None] > 0) * rng.normal(scale=self.noise, size=vectors.shape).astype(np.float32)
+        found = self.snapshot._rows_result(source.tolist(), ("documents", "metadatas"))
+        return {
+            "ids": [f"{doc_id}#{copy}" if copy else doc_id for doc_id, copy in zip(found["ids"], copies.tolist())],
+            "documents": found["documents"],
+            "metadatas": found["metadatas"],
+            "embeddings": vectors
+        }
+
+
+def main():
+    import tempfile
+
+    import numpy as np
+    from source_code.vector_snapshot import export_collection
+
+    parser = argparse.ArgumentParser(description="分片檢索延遲比較 (單進程快照 vs 多進程分片)")
+    parser.add_argument("--snapshot-dir", default=SERVER_CONFIG["snapshot_dir"])
+    parser.add_argument("--shards", type=int, default=SHARDING_CONFIG["shards"] or min(4, os.cpu_count() or 1))
+    parser.add_argument("--by", choices=PARTITIONS, default=SHARDING_CONFIG["partition"])
+    parser.add_argument("--replicate", type=int, default=1, help="將快照重複的倍數 (寫入臨時目錄)")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    base = SnapshotCollection(args.snapshot_dir)
+    workdir = None
+    path = args.snapshot_dir
+    if args.replicate > 1:
+        workdir = tempfile.mkdtemp(prefix="prompt-rag-shards-")
+        path = os.path.join(workdir, "snapshot")
+        started = time.perf_counter()
+        export_collection(_ReplicatedCollection(base, args.replicate), path, page_size=20000)
+        print(f"已匯出 {base.count() * args.replicate:,} 條的複製快照 ({time.perf_counter() - started:.1f}s)")
+
+    try:
+        single = SnapshotCollection(path)
+        started = time.perf_counter()
+        sharded = ShardedCollection(path, shards=args.shards, partition=args.by)
+        print(f"{args.shards} 個分片 ({args.by})：{sharded.shard_sizes}，啟動 {time.perf_counter() - started:.1f}s")
+        single.warm()
+        sharded.warm()
+
+        rng = np.random.default_rng(0)
+        rows = rng.integers(0, single.count(), size=args.queries)
+        queries = np.asarray(single.vectors[np.sort(rows)], dtype=np.float32)
+        prompt_types = single.metadata_values.get("prompt_type") or [None]
+        agree = 0
+        timings = {"單進程": [], "分片": [], "單進程 (where)": [], "分片 (where)": []}
+        for i, query in enumerate(queries):
+            where = {"prompt_type": prompt_types[i % len(prompt_types)]} if prompt_types[0] is not None else None
+            for label, collection, condition in (
+                ("單進程", single, None), ("分片", sharded, None),
+                ("單進程 (where)", single, where), ("分片 (where)", sharded, where)
+            ):
+                started = time.perf_counter()
+                result = collection.query(query_embeddings=[query], n_results=args.k, where=condition, include=["distances"])
+                timings[label].append(time.perf_counter() - started)
+                if label == "單進程":
+                    expected = result["ids"][0]
+                elif label == "分片":
+                    agree += result["ids"][0] == expected
+
+        for label, values in timings.items():
+            values = sorted(values)
+            print(f"  {label:<14} p50 {values[len(values) // 2] * 1000:8.2f} ms   p95 {values[int(len(values) * 0.95)] * 1000:8.2f} ms")
+        print(f"  top-{args.k} 與單進程一致：{agree}/{len(queries)}")
+        sharded.close()
+    finally:
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+分階段延遲觀測 (OpenTelemetry)
+
+每個處理階段 (embedding、向量檢索、過濾、分類、客製化、渲染) 以 stage() 包裹，
+同時產生一個 span 和一筆 prompt_rag.stage.duration 直方圖記錄。
+
+Exporter 由 TELEMETRY_CONFIG["exporter"] (環境變數 PROMPT_RAG_TELEMETRY) 決定：
+- none: 預設，stage() 返回共用的空操作物件，不導入 opentelemetry
+- console: 以 OpenTelemetry 預設格式輸出到 stdout
+- json: 每行一個 JSON 物件，輸出到 PROMPT_RAG_TELEMETRY_FILE 或 stdout
+- otlp: 以 gRPC 發送到本地 collector (OTEL_EXPORTER_OTLP_ENDPOINT)
+"""
+
+import sys
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from source_code.config import TELEMETRY_CONFIG
+
+# 會同時寫入直方圖的低基數屬性，其餘屬性只記錄在 span 上
+METRIC_ATTRIBUTES = ("scenario", "cache_hit", "has_filters")
+
+_state = {"configured": False, "tracer": None, "histogram": None, "providers": []}
+_lock = threading.Lock()
+
+
+class _NoopStage:
+    """遙測關閉時使用的空操作階段"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+
+_NOOP_STAGE = _NoopStage()
+
+
+class _Stage:
+    """一個處理階段：span + 延遲直方圖"""
+
+    __slots__ = ("name", "attributes", "_span_manager", "_span", "_start")
+
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        self.name = name
+        self.attributes = {k: v for k, v in attributes.items() if v is not None}
+
+    def __enter__(self):
+        self._span_manager = _state["tracer"].start_as_current_span(self.name, attributes=self.attributes)
+        self._span = self._span_manager.__enter__()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed_ms = (time.perf_counter() - self._start) * 1000
+        metric_attributes = {"stage": self.name}
+        for key in METRIC_ATTRIBUTES:
+            if key in self.attributes:
+                metric_attributes[key] = self.attributes[key]
+        if exc_type is not None:
+            metric_attributes["error"] = True
+        _state["histogram"].record(elapsed_ms, attributes=metric_attributes)
+        return self._span_manager.__exit__(exc_type, exc_value, traceback)
+
+    def set_attribute(self, key: str, value: Any):
+        if value is None:
+            return
+        self.attributes[key] = value
+        self._span.set_attribute(key, value)
+
+
+def stage(name: str, **attributes):
+    """包裹一個處理階段
+
+    Args:
+        name: 階段名稱，例如 rag.embed、rag.vector_search
+        **attributes: span 屬性 (scenario、n_results、cache_hit、context_length 等)
+
+    Returns:
+        context manager，可在區塊內以 set_attribute 補充屬性
+    """
+    if not _state["configured"]:
+        configure_telemetry()
+    if _state["tracer"] is None:
+        return _NOOP_STAGE
+    return _Stage(name, attributes)
+
+
+def _json_line(payload: str) -> str:
+    """將 OpenTelemetry 的多行 JSON 壓成單行"""
+    import json
+    return json.dumps(json.loads(payload), ensure_ascii=False) + "\n"
+
+
+def configure_telemetry(exporter: Optional[str] = None) -> bool:
+    """初始化 tracer 與 meter
+
+    Args:
+        exporter: none / console / json / otlp，未提供時使用 TELEMETRY_CONFIG
+
+    Returns:
+        遙測是否啟用
+    """
+    with _lock:
+        exporter = (exporter or TELEMETRY_CONFIG["exporter"] or "none").lower()
+        _state["configured"] = True
+        if exporter == "none":
+            _state["tracer"] = None
+            _state["histogram"] = None
+            return False
+
+        try:
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+            from opentelemetry.sdk.metrics import MeterProvider
+            from opentelemetry.sdk.metrics.export import ConsoleMetricExporter, PeriodicExportingMetricReader
+
+            if exporter == "otlp":
+                from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+                from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter
+                span_exporter = OTLPSpanExporter(endpoint=TELEMETRY_CONFIG["otlp_endpoint"], insecure=True)
+                metric_exporter = OTLPMetricExporter(endpoint=TELEMETRY_CONFIG["otlp_endpoint"], insecure=True)
+            elif exporter == "json":
+                path = TELEMETRY_CONFIG["json_path"]
+                out = open(path, "a", encoding="utf-8") if path else sys.stdout
+                span_exporter = ConsoleSpanExporter(out=out, formatter=lambda span: _json_line(span.to_json()))
+                metric_exporter = ConsoleMetricExporter(out=out, formatter=lambda data: _json_line(data.to_json()))
+            elif exporter == "console":
+                span_exporter = ConsoleSpanExporter()
+                metric_exporter = ConsoleMetricExporter()
+            else:
+                raise ValueError(f"未知的 exporter：{exporter}")
+
+            resource = Resource.create({"service.name": TELEMETRY_CONFIG["service_name"]})
+            tracer_provider = TracerProvider(resource=resource)
+            tracer_provider.add_span_processor(BatchSpanProcessor(span_exporter))
+            meter_provider = MeterProvider(
+                resource=resource,
+                metric_readers=[PeriodicExportingMetricReader(
+                    metric_exporter,
+                    export_interval_millis=TELEMETRY_CONFIG["metric_export_interval_ms"]
+                )]
+            )
+
+            _state["tracer"] = tracer_provider.get_tracer("prompt_rag_system")
+            _state["histogram"] = meter_provider.get_meter("prompt_rag_system").create_histogram(
+                "prompt_rag.stage.duration",
+                unit="ms",
+                description="各處理階段的延遲"
+            )
+            _state["providers"] = [tracer_provider, meter_provider]
+            return True
+
+        except Exception as e:
+            print(f"遙測初始化失敗，已停用：{str(e)}")
+            _state["tracer"] = None
+            _state["histogram"] = None
+            return False
+
+
+def shutdown_telemetry():
+    """刷新並關閉 exporter (進程結束前調用)"""
+    with _lock:
+        for provider in _state["providers"]:
+            provider.shutdown()
+        _state["providers"] = []
+        _state["tracer"] = None
+        _state["histogram"] = None
@@ -0,0 +1,548 @@
+# -*- coding: utf-8 -*-
+"""
+唯讀向量快照
+
+將 collection 的向量、文檔與 metadata 匯出為一組平面文件，以 mmap 開啟：
+多個 worker 進程開啟同一份快照時共用作業系統的 page cache，而不是各自載入一份副本。
+
+目錄結構：
+- manifest.json: 版本、筆數、維度、embedding 模型、來源指紋、metadata 詞彙表與各文件的 SHA-256
+- vectors.npy / norms.npy: float32 向量矩陣與其平方範數
+- ids.bin、documents.bin (+ .offsets.npy): UTF-8 字串欄位；啟用壓縮文檔存儲 (DOC_STORE_CONFIG) 時
+  全文改存於 documents.docs (共用字典壓縮，含期望輸出欄位，見 source_code/doc_store.py)
+- meta_<key>.npy: 每個 metadata 欄位的 int32 編碼 (-1 表示缺值)
+- projection.npz / projected.npy / projected_norms.npy: 可選的 PCA 投影與投影後向量
+  (存在時第一階段在投影向量上搜索，候選再以原始向量重排，原始向量只讀取候選行)
+
+SnapshotCollection 實作引擎用到的 collection 介面 (count / query / get)，
+可直接注入 PromptGeneratorRAGSystem(collection=...)。
+
+快照與 Chroma 版本無關，也是可攜的備份格式：copy_snapshot 校驗後複製到新節點，
+import_snapshot 將向量批量載入新的 collection，兩者都不需要重新 embedding。
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+from typing import Any, Dict, List, Optional
+
+SNAPSHOT_VERSION = 2
+DEFAULT_INCLUDE = ("metadatas", "documents", "distances")
+
+
+def embedding_model_name(embedding_function=None) -> str:
+    """embedding 函數對應的模型名稱 (快照 manifest 記錄與載入時比對的值)
+
+    未提供函數時為引擎預設的 PooledEmbeddingFunction。優先取 model_id (離線重放與 HashingEmbeddingFunction
+    為 offline-hash-<維度>，不會與真實模型混淆)，其次 model 屬性，否則以類名區分。
+    """
+    if embedding_function is None:
+        from source_code.openai_client import PooledEmbeddingFunction
+        embedding_function = PooledEmbeddingFunction()
+    return (
+        getattr(embedding_function, "model_id", None)
+        or getattr(embedding_function, "model", None)
+        or type(embedding_function).__name__
+    )
+
+
+def _write_strings(path: str, values: List[str]):
+    """寫出 UTF-8 字串欄位：內容 blob 與 offsets"""
+    import numpy as np
+
+    encoded = [(value or "").encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(item) for item in encoded])
+    with open(f"{path}.bin", "wb") as f:
+        for item in encoded:
+            f.write(item)
+    np.save(f"{path}.offsets.npy", offsets)
+
+
+class _StringColumn:
+    """以 mmap 讀取的字串欄位"""
+
+    def __init__(self, path: str):
+        import numpy as np
+
+        self.offsets = np.load(f"{path}.offsets.npy", mmap_mode="r")
+        if os.path.getsize(f"{path}.bin") > 0:
+            self.data = np.memmap(f"{path}.bin", dtype=np.uint8, mode="r")
+        else:
+            self.data = np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row: int) -> str:
+        return self.data[self.offsets[row]:self.offsets[row + 1]].tobytes().decode("utf-8")
+
+
+def export_collection(
+    collection,
+    path: str,
+    source: Optional[Dict[str, Any]] = None,
+    page_size: int = 5000,
+    projection_dimensions: Optional[int] = None,
+    embedding_model: Optional[str] = None
+) -> Dict[str, Any]:
+    """將 collection 匯出為快照目錄
+
+    先寫入臨時目錄再替換，讀取中的進程不會看到寫了一半的快照。
+
+    Args:
+        collection: Chroma collection (或任何支援 get(include, limit, offset) 的物件)
+        path: 快照目錄
+        source: 寫入 manifest 的來源資訊 (例如數據集指紋)，用於判斷快照是否過期
+        page_size: 每次從 collection 讀取的筆數
+        projection_dimensions: 大於 0 且小於向量維度時擬合 PCA 並保存投影向量
+        embedding_model: 產生向量的 embedding 模型，未提供時取 source["embedding"] 或系統預設模型
+
+    Returns:
+        manifest 字典
+    """
+    import numpy as np
+
+    ids, documents, metadatas, vectors = [], [], [], []
+    offset = 0
+    while True:
+        page = collection.get(
+            include=["embeddings", "documents", "metadatas"],
+            limit=page_size,
+            offset=offset
+        )
+        if not page["ids"]:
+            break
+        ids.extend(page["ids"])
+        documents.extend(page["documents"])
+        metadatas.extend(page["metadatas"] or [{}] * len(page["ids"]))
+        vectors.append(np.asarray(page["embeddings"], dtype=np.float32))
+        offset += len(page["ids"])
+
+    matrix = np.concatenate(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+    vocabularies = {}
+    for metadata in metadatas:
+        for key, value in (metadata or {}).items():
+            vocabulary = vocabularies.setdefault(key, {})
+            vocabulary.setdefault(json.dumps(value, ensure_ascii=False), len(vocabulary))
+
+    staging = f"{path}.tmp-{os.getpid()}"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    np.save(os.path.join(staging, "vectors.npy"), matrix)
+    np.save(os.path.join(staging, "norms.npy"), (matrix * matrix).sum(axis=1).astype(np.float32))
+    _write_strings(os.path.join(staging, "ids"), ids)
+    from source_code.config import DOC_STORE_CONFIG
+    if DOC_STORE_CONFIG["enabled"]:
+        from source_code.doc_store import DOCUMENT_FIELD, DocStore
+        fields = {DOCUMENT_FIELD: documents}
+        if hasattr(collection, "field"):
+            expected = collection.field(ids, "expected_output")
+            if expected:
+                fields["expected_output"] = [expected.get(doc_id) for doc_id in ids]
+        DocStore.build(ids, fields).save(os.path.join(staging, "documents.docs"))
+    else:
+        _write_strings(os.path.join(staging, "documents"), documents)
+    for key, vocabulary in vocabularies.items():
+        codes = np.full(len(ids), -1, dtype=np.int32)
+        for row, metadata in enumerate(metadatas):
+            if metadata and key in metadata:
+                codes[row] = vocabulary[json.dumps(metadata[key], ensure_ascii=False)]
+        np.save(os.path.join(staging, f"meta_{key}.npy"), codes)
+
+    projection = None
+    if projection_dimensions and matrix.ndim == 2 and len(matrix) > 1 and projection_dimensions < matrix.shape[1]:
+        from source_code.projection import PCAProjection
+        projection = PCAProjection.fit(matrix, projection_dimensions)
+        projected = projection.transform(matrix)
+        projection.save(staging)
+        np.save(os.path.join(staging, "projected.npy"), projected)
+        np.save(os.path.join(staging, "projected_norms.npy"), (projected * projected).sum(axis=1).astype(np.float32))
+
+    if embedding_model is None:
+        embedding_model = (source or {}).get("embedding") or embedding_model_name()
+
+    manifest = {
+        "version": SNAPSHOT_VERSION,
+        "count": len(ids),
+        "dimensions": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+        "embedding_model": embedding_model,
+        "projection": {
+            "dimensions": projection.dimensions,
+            "explained_variance": projection.explained_variance
+        } if projection is not None else None,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "source": source or {},
+        "metadata": {
+            key: [json.loads(value) for value in vocabulary]
+            for key, vocabulary in vocabularies.items()
+        },
+        "checksums": snapshot_checksums(staging)
+    }
+    with open(os.path.join(staging, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    _install(staging, path)
+    return manifest
+
+
+def _install(staging: str, path: str):
+    """以寫好的臨時目錄替換快照目錄：舊快照先移開再換入新快照，最後刪除舊快照"""
+    retired = None
+    if os.path.exists(path):
+        retired = f"{path}.old-{os.getpid()}"
+        os.replace(path, retired)
+    os.replace(staging, path)
+    if retired:
+        shutil.rmtree(retired, ignore_errors=True)
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def snapshot_checksums(path: str) -> Dict[str, str]:
+    """快照目錄內各數據文件 (不含 manifest 與分片等衍生子目錄) 的 SHA-256"""
+    return {
+        name: _file_sha256(os.path.join(path, name))
+        for name in sorted(os.listdir(path))
+        if name != "manifest.json" and os.path.isfile(os.path.join(path, name))
+    }
+
+
+def verify_snapshot(path: str) -> Dict[str, Any]:
+    """校驗快照文件與 manifest 記錄的 SHA-256 一致
+
+    Returns:
+        manifest 字典
+
+    Raises:
+        ValueError: 快照無效、版本不符或文件缺失 / 損壞
+    """
+    manifest = read_manifest(path)
+    if manifest is None:
+        raise ValueError(f"無效的向量快照 (或版本不是 {SNAPSHOT_VERSION})：{path}")
+    problems = []
+    for name, expected in manifest["checksums"].items():
+        file_path = os.path.join(path, name)
+        if not os.path.isfile(file_path):
+            problems.append(f"{name} 缺失")
+        elif _file_sha256(file_path) != expected:
+            problems.append(f"{name} 校驗和不符")
+    if problems:
+        raise ValueError(f"向量快照校驗失敗：{'、'.join(problems)}")
+    return manifest
+
+
+def copy_snapshot(source: str, path: str) -> Dict[str, Any]:
+    """校驗 source 快照後複製到 path (原子替換)，用於匯出備份或在新節點匯入
+
+    只複製 manifest 記錄的文件；複製後再次校驗，確保目的地與來源一致。
+
+    Returns:
+        manifest 字典
+    """
+    manifest = verify_snapshot(source)
+    staging = f"{path}.tmp-{os.getpid()}"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    try:
+        for name in list(manifest["checksums"]) + ["manifest.json"]:
+            shutil.copyfile(os.path.join(source, name), os.path.join(staging, name))
+        verify_snapshot(staging)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    _install(staging, path)
+    return manifest
+
+
+def import_snapshot(path: str, collection, batch_size: int = 1000) -> int:
+    """將快照批量載入 (空的) Chroma collection，使用快照中的向量，不呼叫 embedding API
+
+    Returns:
+        載入的筆數
+    """
+    import numpy as np
+
+    snapshot = SnapshotCollection(path)
+    total = snapshot.count()
+    # 壓縮文檔存儲包裝的 collection 一併匯入額外文本欄位 (期望輸出)，全部寫入後 seal
+    sealable = hasattr(collection, "seal")
+    extra_fields = [name for name in getattr(snapshot.documents, "fields", []) if name != "document"] if sealable else []
+    for start in range(0, total, batch_size):
+        rows = list(range(start, min(start + batch_size, total)))
+        batch_ids = [snapshot.ids[r] for r in rows]
+        extra = {}
+        if extra_fields:
+            extra["fields"] = {name: [snapshot.documents.text(r, name) for r in rows] for name in extra_fields}
+        collection.add(
+            ids=batch_ids,
+            embeddings=np.asarray(snapshot.vectors[start:start + len(rows)]),
+            documents=[snapshot.documents[r] for r in rows],
+            metadatas=[snapshot._metadata(r) or None for r in rows],
+            **extra
+        )
+    if sealable:
+        collection.seal()
+    return total
+
+
+def where_mask(where: Dict[str, Any], metadata_codes, value_codes, count: int):
+    """將 where 條件轉為布林遮罩 (支援等值、$eq、$ne、$in、$and、$or)
+
+    Args:
+        where: Chroma 風格的 where 條件
+        metadata_codes: {欄位: int32 編碼陣列}
+        value_codes: {欄位: {JSON 值: 編碼}}
+        count: 行數
+    """
+    import numpy as np
+
+    if "$and" in where or "$or" in where:
+        operator = "$and" if "$and" in where else "$or"
+        masks = [where_mask(clause, metadata_codes, value_codes, count) for clause in where[operator]]
+        combine = np.logical_and if operator == "$and" else np.logical_or
+        return combine.reduce(masks) if masks else np.ones(count, dtype=bool)
+
+    if len(where) != 1:
+        raise ValueError(f"where 條件只允許一個運算子：{where}")
+    key, condition = next(iter(where.items()))
+    if not isinstance(condition, dict):
+        condition = {"$eq": condition}
+    operator, operand = next(iter(condition.items()))
+
+    codes = metadata_codes.get(key)
+    if codes is None:
+        return np.zeros(count, dtype=bool)
+    lookup = value_codes[key]
+    if operator in ("$eq", "$ne"):
+        mask = codes == lookup.get(json.dumps(operand, ensure_ascii=False), -2)
+        return mask if operator == "$eq" else ~mask
+    if operator == "$in":
+        wanted = [lookup[json.dumps(v, ensure_ascii=False)] for v in operand if json.dumps(v, ensure_ascii=False) in lookup]
+        return np.isin(codes, wanted)
+    raise ValueError(f"不支援的 where 運算子：{operator}")
+
+
+def exact_search(queries, vectors, norms, candidates, n_results: int):
+    """全精度暴力檢索，返回每個查詢的 (行號, 平方 L2 距離)
+
+    candidates 為可選的候選行號陣列 (None 表示全部)。
+    """
+    import numpy as np
+
+    if candidates is not None:
+        vectors, norms = vectors[candidates], norms[candidates]
+    k = min(n_results, len(vectors))
+    if k <= 0:
+        return [([], []) for _ in range(len(queries))]
+
+    distances = norms[None, :] + (queries * queries).sum(axis=1)[:, None] - 2 * (queries @ vectors.T)
+    ranked = []
+    for row in range(len(queries)):
+        top = np.argpartition(distances[row], k - 1)[:k]
+        top = top[np.argsort(distances[row][top])]
+        rows = top if candidates is None else candidates[top]
+        ranked.append((rows, [float(max(d, 0.0)) for d in distances[row][top]]))
+    return ranked
+
+
+def rank_rows(index, queries, candidates, n_results: int):
+    """每個查詢的 (行號, 平方 L2 距離)：有投影時兩階段，否則精確暴力搜索
+
+    index 需提供 vectors / norms / projection 屬性，有投影時另需 projected / projected_norms / rerank_depth
+    (SnapshotCollection 與分片 worker 共用)。
+    """
+    if index.projection is None:
+        return exact_search(queries, index.vectors, index.norms, candidates, n_results)
+    # 投影向量粗排 + 原始向量重排
+    from source_code.projection import two_stage_search
+    projected_queries = index.projection.transform(queries)
+    return [
+        two_stage_search(
+            queries[row], projected_queries[row], index.projected, index.projected_norms,
+            index.vectors, index.norms, n_results, index.rerank_depth, rows=candidates
+        )
+        for row in range(len(queries))
+    ]
+
+
+def value_lookup(metadata_values: Dict[str, List[Any]]) -> Dict[str, Dict[str, int]]:
+    """manifest 詞彙表的反查表：{欄位: {JSON 值: 編碼}}"""
+    return {
+        key: {json.dumps(value, ensure_ascii=False): code for code, value in enumerate(values)}
+        for key, values in metadata_values.items()
+    }
+
+
+def read_manifest(path: str) -> Optional[Dict[str, Any]]:
+    """讀取快照 manifest，不存在或格式不符時返回 None"""
+    try:
+        with open(os.path.join(path, "manifest.json"), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        return manifest if manifest.get("version") == SNAPSHOT_VERSION else None
+    except (OSError, ValueError):
+        return None
+
+
+class SnapshotCollection:
+    """以 mmap 開啟的唯讀快照，提供 collection 相容的 count / query / get
+
+    距離為平方 L2，與 Chroma 預設的 l2 空間相同。
+    """
+
+    def __init__(self, path: str, rerank_depth: Optional[int] = None):
+        """
+        Args:
+            path: 快照目錄
+            rerank_depth: 有投影時以原始向量重排的候選數，未提供時使用 PROJECTION_CONFIG
+        """
+        import numpy as np
+
+        self.path = path
+        self.manifest = read_manifest(path)
+        if self.manifest is None:
+            raise ValueError(f"無效的向量快照：{path}")
+
+        self.name = os.path.basename(os.path.normpath(path))
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.norms = np.load(os.path.join(path, "norms.npy"), mmap_mode="r")
+        self.ids = _StringColumn(os.path.join(path, "ids"))
+        if os.path.exists(os.path.join(path, "documents.docs")):
+            from source_code.doc_store import DocStore
+            self.documents = DocStore.open(os.path.join(path, "documents.docs"))
+        else:
+            self.documents = _StringColumn(os.path.join(path, "documents"))
+        self.metadata_codes = {
+            key: np.load(os.path.join(path, f"meta_{key}.npy"), mmap_mode="r")
+            for key in self.manifest["metadata"]
+        }
+        self.metadata_values = self.manifest["metadata"]
+        self._value_codes = value_lookup(self.metadata_values)
+        self._row_by_id = None
+
+        self.projection = None
+        if self.manifest.get("projection"):
+            from source_code.config import PROJECTION_CONFIG
+            from source_code.projection import PCAProjection
+            self.projection = PCAProjection.load(path)
+            self.projected = np.load(os.path.join(path, "projected.npy"), mmap_mode="r")
+            self.projected_norms = np.load(os.path.join(path, "projected_norms.npy"), mmap_mode="r")
+            self.rerank_depth = PROJECTION_CONFIG["rerank_depth"] if rerank_depth is None else rerank_depth
+
+    def count(self) -> int:
+        return self.manifest["count"]
+
+    def warm(self, vectors: bool = True) -> float:
+        """將向量與字串欄位讀入 page cache，返回耗時 (秒)
+
+        有投影時只預熱投影向量，原始向量在重排時按需讀取候選行；
+        vectors=False 時只預熱字串與 metadata (向量由分片 worker 各自預熱)。
+        """
+        start = time.perf_counter()
+        if vectors:
+            if self.projection is not None:
+                float(self.projected.sum())
+                float(self.projected_norms.sum())
+            else:
+                float(self.vectors.sum())
+            float(self.norms.sum())
+        int(self.ids.data.sum())
+        int(self.documents.data.sum())
+        for codes in self.metadata_codes.values():
+            int(codes.sum())
+        return time.perf_counter() - start
+
+    def _metadata(self, row: int) -> Dict[str, Any]:
+        metadata = {}
+        for key, codes in self.metadata_codes.items():
+            code = int(codes[row])
+            if code >= 0:
+                metadata[key] = self.metadata_values[key][code]
+        return metadata
+
+    def field(self, ids: List[str], name: str) -> Dict[str, str]:
+        """按 id 取回壓縮文檔存儲中的額外文本欄位 (例如 expected_output)；未使用文檔存儲時返回空字典"""
+        if name not in getattr(self.documents, "fields", []):
+            return {}
+        return self.documents.get_many(ids, name)
+
+    def _where_mask(self, where: Dict[str, Any]):
+        return where_mask(where, self.metadata_codes, self._value_codes, self.count())
+
+    def _rows_result(self, rows: List[int], include) -> Dict[str, Any]:
+        return {
+            "ids": [self.ids[r] for r in rows],
+            "documents": [self.documents[r] for r in rows] if "documents" in include else None,
+            "metadatas": [self._metadata(r) for r in rows] if "metadatas" in include else None,
+            "embeddings": [self.vectors[r] for r in rows] if "embeddings" in include else None
+        }
+
+    def _exact_search(self, queries, candidates, n_results: int):
+        return exact_search(queries, self.vectors, self.norms, candidates, n_results)
+
+    def _rank(self, queries, candidates, n_results: int):
+        return rank_rows(self, queries, candidates, n_results)
+
+    def format_results(self, ranked, include) -> Dict[str, Any]:
+        """將 (行號, 距離) 列表組成與 Chroma collection.query 相同結構的結果"""
+        result = {key: [] for key in ("ids", "documents", "metadatas", "embeddings", "distances")}
+        for rows, row_distances in ranked:
+            found = self._rows_result([int(r) for r in rows], include)
+            for key in ("ids", "documents", "metadatas", "embeddings"):
+                result[key].append(found[key])
+            result["distances"].append(row_distances)
+
+        for key in ("documents", "metadatas", "embeddings", "distances"):
+            if key not in include:
+                result[key] = None
+        return result
+
+    def query(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int = 10,
+        where: Optional[Dict[str, Any]] = None,
+        include=DEFAULT_INCLUDE,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """最近鄰檢索 (有投影時兩階段，否則精確暴力搜索)，返回與 Chroma collection.query 相同結構的結果"""
+        import numpy as np
+
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+
+        candidates = np.flatnonzero(self._where_mask(where)) if where else None
+        return self.format_results(self._rank(queries, candidates, n_results), include)
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        include=("metadatas", "documents"),
+        **kwargs
+    ) -> Dict[str, Any]:
+        """按 ID 或條件讀取文檔，返回與 Chroma collection.get 相同結構的結果"""
+        import numpy as np
+
+        if ids is not None:
+            if self._row_by_id is None:
+                self._row_by_id = {self.ids[r]: r for r in range(self.count())}
+            rows = [self._row_by_id[i] for i in ids if i in self._row_by_id]
+        elif where:
+            rows = np.flatnonzero(self._where_mask(where)).tolist()
+        else:
+            rows = list(range(self.count()))
+        rows = rows[offset:offset + limit] if limit is not None else rows[offset:]
+        return self._rows_result(rows, include)
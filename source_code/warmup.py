@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+啟動預熱
+
+部署後的第一批用戶要付出完整的 embedding 與檢索延遲 (embedding 快取是空的、Chroma 首次查詢才載入索引、
+延遲導入的模組尚未載入)。CacheWarmer 在引擎載入後於背景線程依序執行：
+
+1. 熱門查詢文件 (WARMUP_CONFIG["popular_queries"]，每行一條查詢或 {"query", "context"?, "filters"?} JSON)
+2. USER_FRIENDLY_FILTERS 的類型 × 複雜度組合 (以類型名稱為查詢的過濾搜索)
+3. 數據集的 task_description
+
+每批以一次 batch_query 執行 (一次 embedding 呼叫並實際檢索)，批次之間按 rate 限速，
+總數不超過 max_queries (保持在 embedding 快取容量以內，避免預熱擠掉彼此)。
+預熱不阻塞就緒：期間的查詢照常處理，只是尚未命中快取。
+
+用法：
+    warmer = CacheWarmer(rag_system).start()
+    warmer.status()    # {"state": "pending" | "warming" | "done" | "stopped" | "failed", "completed", "total", ...}
+
+    # 量測重啟後 (冷啟動 / 預熱後) 與穩定狀態的延遲分佈
+    PROMPT_RAG_OFFLINE=1 PROMPT_RAG_REPLAY_LATENCY=lognormal:3.9:0.5 python -m source_code.warmup
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from source_code.config import USER_FRIENDLY_FILTERS, WARMUP_CONFIG
+
+
+def load_popular_queries(path: Optional[str]) -> List[Dict[str, Any]]:
+    """讀取熱門查詢文件；不存在時返回空列表，無法解析的行略過"""
+    if not path or not os.path.exists(path):
+        return []
+    queries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                try:
+                    item = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if isinstance(item.get("query"), str) and item["query"].strip():
+                    queries.append({key: item[key] for key in ("query", "context", "filters") if item.get(key)})
+            else:
+                queries.append({"query": line})
+    return queries
+
+
+def filter_queries() -> List[Dict[str, Any]]:
+    """USER_FRIENDLY_FILTERS 的過濾組合：每個類型、每個複雜度，以及類型 × 複雜度"""
+    def label(text: str) -> str:
+        # 去掉標籤前的 emoji，例如 "💻 程式碼生成" → "程式碼生成"
+        return text.split(" ", 1)[-1]
+
+    prompt_types = USER_FRIENDLY_FILTERS["prompt_type"]
+    complexities = USER_FRIENDLY_FILTERS["complexity"]
+    queries = [{"query": label(name), "filters": {"prompt_type": key}} for key, name in prompt_types.items()]
+    queries += [{"query": label(name), "filters": {"complexity": key}} for key, name in complexities.items()]
+    queries += [
+        {"query": label(type_name), "filters": {"prompt_type": type_key, "complexity": complexity}}
+        for type_key, type_name in prompt_types.items()
+        for complexity in complexities
+    ]
+    return queries
+
+
+def task_description_queries(dataset_path: str) -> List[Dict[str, Any]]:
+    """數據集中不重複的 task_description (數據集不可用時返回空列表)"""
+    from source_code.dataset_store import load_dataset
+
+    try:
+        df = load_dataset(["task_description"], csv_path=dataset_path)
+    except Exception as e:
+        print(f"預熱略過 task_description：{str(e)}")
+        return []
+    seen = set()
+    queries = []
+    for text in df["task_description"]:
+        if isinstance(text, str) and text.strip() and text not in seen:
+            seen.add(text)
+            queries.append({"query": text})
+    return queries
+
+
+def warmup_queries(
+    dataset_path: str,
+    popular_path: Optional[str] = None,
+    max_queries: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """預熱查詢列表：熱門查詢優先，其次過濾組合與 task_description，去重後截到 max_queries"""
+    max_queries = WARMUP_CONFIG["max_queries"] if max_queries is None else max_queries
+    sources = (
+        load_popular_queries(popular_path if popular_path is not None else WARMUP_CONFIG["popular_queries"]),
+        filter_queries(),
+        task_description_queries(dataset_path)
+    )
+    queries, seen = [], set()
+    for source in sources:
+        for item in source:
+            key = json.dumps(item, sort_keys=True, ensure_ascii=False)
+            if key not in seen:
+                seen.add(key)
+                queries.append(item)
+            if len(queries) >= max_queries:
+                return queries
+    return queries
+
+
+class CacheWarmer:
+    """在背景線程以限速的批量查詢預熱引擎
+
+    Args:
+        engine: PromptGeneratorRAGSystem
+        queries: 預熱查詢，預設為 warmup_queries(engine.dataset_path)
+        rate: 每秒查詢數上限，預設 WARMUP_CONFIG
+        batch_size: 每批查詢數，預設 WARMUP_CONFIG
+        lazy: 與 Streamlit 介面一致，結果不附全文
+    """
+
+    def __init__(
+        self,
+        engine,
+        queries: Optional[List[Dict[str, Any]]] = None,
+        rate: Optional[float] = None,
+        batch_size: Optional[int] = None,
+        lazy: bool = True
+    ):
+        self.engine = engine
+        self.queries = queries
+        self.rate = rate if rate is not None else WARMUP_CONFIG["rate"]
+        self.batch_size = max(1, batch_size or WARMUP_CONFIG["batch_size"])
+        self.lazy = lazy
+        self._stop = threading.Event()
+        self._thread = None
+        self._status = {"state": "pending", "completed": 0, "total": None, "errors": 0, "seconds": None, "last_error": None}
+
+    def start(self) -> "CacheWarmer":
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="cache-warmer", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def status(self) -> Dict[str, Any]:
+        return dict(self._status)
+
+    def run(self) -> Dict[str, Any]:
+        """同步執行預熱並返回最終狀態"""
+        started = time.monotonic()
+        if self.queries is None:
+            self.queries = warmup_queries(self.engine.dataset_path)
+        self._status.update(state="warming", total=len(self.queries))
+
+        interval = self.batch_size / self.rate if self.rate > 0 else 0.0
+        for offset in range(0, len(self.queries), self.batch_size):
+            if self._stop.is_set():
+                self._status["state"] = "stopped"
+                break
+            batch_started = time.monotonic()
+            batch = self.queries[offset:offset + self.batch_size]
+            results = self.engine.batch_query(batch, lazy=self.lazy)
+            errors = [result["error"] for result in results if "error" in result]
+            if errors:
+                self._status["errors"] += len(errors)
+                self._status["last_error"] = errors[-1]
+            self._status["completed"] += len(batch)
+            # 限速：預熱與真實請求共用 embedding API 配額與 CPU
+            self._stop.wait(max(0.0, interval - (time.monotonic() - batch_started)))
+        else:
+            self._status["state"] = "done"
+
+        self._status["seconds"] = round(time.monotonic() - started, 3)
+        return self.status()
+
+    def _run(self):
+        try:
+            status = self.run()
+            print(
+                f"預熱{'完成' if status['state'] == 'done' else '中止'}：{status['completed']}/{status['total']} 條查詢 "
+                f"(錯誤 {status['errors']})，{status['seconds']:.1f}s"
+            )
+        except Exception as e:
+            print(f"預熱錯誤：{str(e)}")
+            self._status.update(state="failed", last_error=str(e))
+
+
+def _percentiles(latencies: List[float]) -> Dict[str, float]:
+    ordered = sorted(latencies)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {"p50_ms": round(pick(0.5), 2), "p99_ms": round(pick(0.99), 2), "max_ms": round(ordered[-1], 2)}
+
+
+def main():
+    """比較重啟後直接服務、預熱後服務與穩定狀態的延遲分佈 (使用向量快照)"""
+    import random
+
+    from source_code.config import PROCESSED_DATASET, SERVER_CONFIG
+    from source_code.prompt_rag_system import PromptGeneratorRAGSystem
+    from source_code.server import ensure_snapshot
+    from source_code.vector_snapshot import SnapshotCollection
+
+    parser = argparse.ArgumentParser(description="啟動預熱延遲基準")
+    parser.add_argument("--snapshot-dir", default=SERVER_CONFIG["snapshot_dir"])
+    parser.add_argument("--dataset", default=str(PROCESSED_DATASET))
+    parser.add_argument("--probe", type=int, default=200, help="量測的查詢數 (從預熱查詢中抽樣)")
+    parser.add_argument("--rate", type=float, default=0, help="預熱限速 (0 為不限速)")
+    args = parser.parse_args()
+
+    ensure_snapshot(args.snapshot_dir, args.dataset)
+    queries = warmup_queries(args.dataset)
+    probe = random.Random(0).sample(queries, min(args.probe, len(queries)))
+
+    def engine():
+        # 每次開新的快照與引擎，模擬重啟 (OS page cache 在同一台機器上仍是熱的)
+        return PromptGeneratorRAGSystem(dataset_path=args.dataset, collection=SnapshotCollection(args.snapshot_dir))
+
+    def measure(rag_system) -> Dict[str, float]:
+        latencies = []
+        for item in probe:
+            start = time.perf_counter()
+            if item.get("filters"):
+                rag_system.apply_user_filter(item["query"], item["filters"], lazy=True)
+            else:
+                rag_system.query(item["query"], item.get("context"), lazy=True)
+            latencies.append((time.perf_counter() - start) * 1000)
+        return _percentiles(latencies)
+
+    report = {"cold": measure(engine())}
+    warmed = engine()
+    report["warmup"] = CacheWarmer(warmed, queries=queries, rate=args.rate).run()
+    report["after_warmup"] = measure(warmed)
+    report["steady"] = measure(warmed)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()